@@ -0,0 +1,361 @@
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+from db_handler import DBHandler, ACTION_TYPES, SCHEMA_VERSION
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+# Far enough in the future to mean "up to now and anything stamped later".
+FAR_FUTURE = 2 ** 62
+
+COLUMNS = {"ids": np.int64, "timestamps": np.int64, "mod_ids": np.int64, "types": np.int8}
+
+
+def quota_hits(counts: np.ndarray, excused: np.ndarray, quotas: np.ndarray) -> np.ndarray:
+    """Counts the moderators that met their quotas, per week. Excused weeks
+    (vacation) count neither way.
+
+    Args:
+        counts (np.ndarray): Weekly counts of shape (moderators, weeks, types), see ActionAnalytics.weekly_counts().
+        excused (np.ndarray): Booleans of shape (moderators, weeks), True for weeks that don't count.
+        quotas (np.ndarray): Weekly quotas (sent, edited, deleted). Shape (types,) for the same quotas for everyone, (moderators, types) for quotas per moderator or (candidates, 1, types) to try several at once.
+
+    Returns:
+        np.ndarray: The amount of moderators that met the quotas per week, with a leading candidates axis if several were given.
+    """
+    met = np.all(counts >= np.asarray(quotas)[..., None, :], axis=-1) & ~excused
+    return met.sum(axis=-2)
+
+
+class ActionColumns():
+    def __init__(self, ids: np.ndarray, timestamps: np.ndarray,
+                 mod_ids: np.ndarray, types: np.ndarray) -> None:
+        """Every action as parallel arrays, sorted by timestamp.
+
+        Args:
+            ids (np.ndarray): Database ids.
+            timestamps (np.ndarray): Unix timestamps.
+            mod_ids (np.ndarray): Discord ids of the moderators.
+            types (np.ndarray): Type codes, the index into ACTION_TYPES.
+        """
+        self.ids = ids
+        self.timestamps = timestamps
+        self.mod_ids = mod_ids
+        self.types = types
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes taken up by the arrays. Loaded columns are memory mapped, their
+        pages only take up memory once they're read."""
+        return self.ids.nbytes + self.timestamps.nbytes + self.mod_ids.nbytes + self.types.nbytes
+
+    @classmethod
+    def empty(cls) -> "ActionColumns":
+        return cls(*(np.empty(0, dtype) for dtype in COLUMNS.values()))
+
+    def between(self, start_time: int, end_time: int) -> "ActionColumns":
+        """Returns the actions in the timeframe (both ends included), without copying."""
+        lo = np.searchsorted(self.timestamps, start_time, side="left")
+        hi = np.searchsorted(self.timestamps, end_time, side="right")
+        return ActionColumns(self.ids[lo:hi], self.timestamps[lo:hi],
+                             self.mod_ids[lo:hi], self.types[lo:hi])
+
+    def where(self, mask: np.ndarray) -> "ActionColumns":
+        return ActionColumns(self.ids[mask], self.timestamps[mask],
+                             self.mod_ids[mask], self.types[mask])
+
+
+class ActionAnalytics():
+    def __init__(self, db: DBHandler, guild_id: int, cache_dir: str = None, grace: int = 600) -> None:
+        """Answers questions about the moderator activity of a guild (histograms, rolling
+        totals, streaks, per moderator counts) with numpy instead of Python
+        loops over Action objects.
+
+        The actions are kept in memory as columns sorted by timestamp.
+        refresh() only asks the database for actions from the last few
+        minutes before the newest one it has, so keeping up is cheap. With a
+        cache dir the columns are saved as .npy files and memory mapped on
+        the next start, so only what happened since has to be loaded. The
+        first refresh counts the older actions in the database, and loads
+        everything again if they no longer match the cache.
+
+        Args:
+            db (DBHandler): The database to read the actions from.
+            guild_id (int): The guild whose actions to load.
+            cache_dir (str, optional): Where to keep the columns between runs. Defaults to None, no cache.
+            grace (int, optional): How many seconds before the newest known action to look for new ones. Deletions come in through the audit log and can be stamped a bit in the past. Defaults to 600.
+        """
+        self.db = db
+        self.guild_id = guild_id
+        self.cache_dir = cache_dir
+        self.grace = grace
+        self.columns = ActionColumns.empty()
+        # If the columns loaded from the cache were checked against the database.
+        self._verified = False
+        self._lock = threading.Lock()
+        if cache_dir:
+            self._load_cache()
+
+    # -------------------------- LOADING --------------------------
+
+    def _load_cache(self) -> None:
+        meta_path = os.path.join(self.cache_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            arrays = [np.load(os.path.join(self.cache_dir, f"{name}.npy"), mmap_mode="r")
+                      for name in COLUMNS]
+        except (OSError, ValueError):
+            logger.exception("Failed to load the analytics cache, loading everything again")
+            return
+        if meta.get("rows") != len(arrays[1]):
+            logger.warning("The analytics cache is incomplete, loading everything again")
+            return
+        if meta.get("schema") != SCHEMA_VERSION:
+            logger.info("The analytics cache is from an older database layout, loading everything again")
+            return
+        self.columns = ActionColumns(*arrays)
+
+    def _save_cache(self, columns: ActionColumns) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Written next to the old files and swapped in, so a crash halfway
+        # leaves a cache that fails the row count check instead of a mix.
+        for name in COLUMNS:
+            partial = os.path.join(self.cache_dir, f"{name}.partial.npy")
+            np.save(partial, getattr(columns, name))
+            os.replace(partial, os.path.join(self.cache_dir, f"{name}.npy"))
+        with open(os.path.join(self.cache_dir, "meta.json"), "w") as f:
+            json.dump({"rows": len(columns), "schema": SCHEMA_VERSION}, f)
+
+    def refresh(self) -> int:
+        """Loads the actions added since the last refresh. Blocks, call it
+        from a worker thread.
+
+        Returns:
+            int: The amount of new actions.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            old = self.columns
+            since = int(old.timestamps[-1]) - self.grace if len(old) else 0
+            if len(old) and not self._verified:
+                # Only new actions are loaded from here on, but the database
+                # can have changed further back since the cache was saved
+                # (unowned rows given to the guild, a restored backup).
+                cached = int(np.searchsorted(old.timestamps, since))
+                stored = self.db.count_actions(self.guild_id, 0, since - 1)
+                if cached != stored:
+                    logger.warning("The analytics cache of guild %s has %d actions before %d, the database %d, "
+                                   "loading everything again", self.guild_id, cached, since, stored)
+                    old, since = ActionColumns.empty(), 0
+                    self.columns = old
+            self._verified = True
+            rows = self.db.get_action_columns(self.guild_id, since, FAR_FUTURE)
+            new = np.array(rows, dtype=np.int64).reshape(-1, 4)
+            if len(old):
+                # Anything we already have (by id) is skipped.
+                known = old.ids[np.searchsorted(old.timestamps, since):]
+                new = new[~np.isin(new[:, 0], known)]
+
+            if len(new):
+                merged = ActionColumns(
+                    np.concatenate([old.ids, new[:, 0]]),
+                    np.concatenate([old.timestamps, new[:, 1]]),
+                    np.concatenate([old.mod_ids, new[:, 2]]),
+                    np.concatenate([old.types, new[:, 3].astype(np.int8)]))
+                # Nearly sorted already, the stable sort (timsort) is quick on that.
+                order = np.argsort(merged.timestamps, kind="stable")
+                merged = merged.where(order)
+                if self.cache_dir:
+                    self._save_cache(merged)
+                self.columns = merged
+
+            metrics.observe("analytics.refresh", (time.perf_counter() - start) * 1000)
+            metrics.set_gauge("analytics.rows", len(self.columns))
+            return len(new)
+
+    # ------------------------- AGGREGATES -------------------------
+
+    def select(self, start_time: int, end_time: int, moderator_id: int = None,
+               type: str = None) -> ActionColumns:
+        """Returns the actions in the timeframe, optionally of one moderator or type.
+
+        Args:
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            moderator_id (int, optional): Only actions of this moderator. Defaults to None.
+            type (str, optional): Only actions of this type ("sent", "edited" or "deleted"). Defaults to None.
+
+        Returns:
+            ActionColumns: The matching actions, sorted by timestamp.
+        """
+        columns = self.columns.between(start_time, end_time)
+        mask = None
+        if moderator_id is not None:
+            mask = columns.mod_ids == moderator_id
+        if type is not None:
+            type_mask = columns.types == ACTION_TYPES.index(type)
+            mask = type_mask if mask is None else mask & type_mask
+        return columns if mask is None else columns.where(mask)
+
+    def histogram(self, start_time: int, end_time: int, bucket: int,
+                  moderator_id: int = None, type: str = None) -> tuple[np.ndarray, np.ndarray]:
+        """Counts the actions per time bucket.
+
+        Args:
+            start_time (int): Beginning of the timeframe (unix timestamp), the first bucket starts here.
+            end_time (int): End of the timeframe (unix timestamp).
+            bucket (int): Length of a bucket in seconds, e.g. HOUR or DAY.
+            moderator_id (int, optional): Only count this moderator. Defaults to None.
+            type (str, optional): Only count this type. Defaults to None.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The start of every bucket and the amount of actions in it.
+        """
+        amount = (end_time - start_time) // bucket + 1
+        selected = self.select(start_time, end_time, moderator_id, type)
+        counts = np.bincount((selected.timestamps - start_time) // bucket, minlength=amount)
+        return start_time + np.arange(amount, dtype=np.int64) * bucket, counts
+
+    def hour_of_day(self, start_time: int, end_time: int, moderator_id: int = None,
+                    type: str = None, utc_offset: int = 0) -> np.ndarray:
+        """Counts the actions per hour of the day, to see when moderators are active.
+
+        Args:
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            moderator_id (int, optional): Only count this moderator. Defaults to None.
+            type (str, optional): Only count this type. Defaults to None.
+            utc_offset (int, optional): Seconds to add to UTC to get the wanted timezone. Defaults to 0.
+
+        Returns:
+            np.ndarray: 24 counts, the first one for 00:00-01:00.
+        """
+        selected = self.select(start_time, end_time, moderator_id, type)
+        return np.bincount((selected.timestamps + utc_offset) // HOUR % 24, minlength=24)
+
+    def weekday_hour(self, start_time: int, end_time: int, moderator_id: int = None,
+                     type: str = None, utc_offset: int = 0) -> np.ndarray:
+        """Counts the actions per weekday and hour of the day, for heatmaps.
+
+        Args:
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            moderator_id (int, optional): Only count this moderator. Defaults to None.
+            type (str, optional): Only count this type. Defaults to None.
+            utc_offset (int, optional): Seconds to add to UTC to get the wanted timezone. Defaults to 0.
+
+        Returns:
+            np.ndarray: 7 rows (Monday first) of 24 counts (00:00-01:00 first).
+        """
+        selected = self.select(start_time, end_time, moderator_id, type)
+        local = selected.timestamps + utc_offset
+        # The epoch was a Thursday, 3 days into the week.
+        weekdays = (local // DAY + 3) % 7
+        return np.bincount(weekdays * 24 + local // HOUR % 24, minlength=7 * 24).reshape(7, 24)
+
+    def rolling_totals(self, start_time: int, end_time: int, window: int = WEEK,
+                       step: int = DAY, moderator_id: int = None,
+                       type: str = None) -> tuple[np.ndarray, np.ndarray]:
+        """Counts the actions in a window that slides over the timeframe, like
+        "actions in the 7 days before each day".
+
+        Args:
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            window (int, optional): Length of the window in seconds, a multiple of step. Defaults to WEEK.
+            step (int, optional): How far the window moves each time, in seconds. Defaults to DAY.
+            moderator_id (int, optional): Only count this moderator. Defaults to None.
+            type (str, optional): Only count this type. Defaults to None.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The end of every window and the amount of actions in it.
+        """
+        steps = window // step
+        # Start early enough that the first window is complete.
+        starts, counts = self.histogram(
+            start_time - (steps - 1) * step, end_time, step, moderator_id, type)
+        total = np.concatenate([[0], np.cumsum(counts)])
+        totals = total[steps:] - total[:-steps]
+        return starts[steps - 1:] + step, totals
+
+    def per_moderator(self, start_time: int, end_time: int) -> dict[int, tuple[int, int, int]]:
+        """Counts the sent, edited and deleted messages of every moderator.
+        Format is always (sent, edited, deleted), same as
+        DBHandler.get_amount_of_actions_per_moderator().
+
+        Args:
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+
+        Returns:
+            dict[int, tuple[int, int, int]]: The counts per moderator id. Moderators without any actions are left out.
+        """
+        selected = self.columns.between(start_time, end_time)
+        mod_ids, index = np.unique(selected.mod_ids, return_inverse=True)
+        kinds = len(ACTION_TYPES)
+        counts = np.bincount(index * kinds + selected.types,
+                             minlength=len(mod_ids) * kinds).reshape(-1, kinds)
+        return {int(mod_id): tuple(int(c) for c in row) for mod_id, row in zip(mod_ids, counts)}
+
+    def weekly_counts(self, start_time: int, weeks: int, moderator_ids: list[int]) -> np.ndarray:
+        """Counts the actions of every type per moderator and week, in one pass.
+
+        Args:
+            start_time (int): Beginning of the first week (unix timestamp).
+            weeks (int): The amount of weeks.
+            moderator_ids (list[int]): The moderators to count, actions of anyone else are left out.
+
+        Returns:
+            np.ndarray: Counts of shape (moderators, weeks, types), in the order of moderator_ids and ACTION_TYPES.
+        """
+        kinds = len(ACTION_TYPES)
+        ids = np.asarray(moderator_ids, dtype=np.int64)
+        selected = self.columns.between(start_time, start_time + weeks * WEEK - 1)
+        # Map every action to the row of its moderator through the sorted ids.
+        order = np.argsort(ids)
+        sorted_ids = ids[order]
+        positions = np.searchsorted(sorted_ids, selected.mod_ids).clip(max=max(len(ids) - 1, 0))
+        known = sorted_ids[positions] == selected.mod_ids if len(ids) else np.zeros(len(selected), bool)
+        rows = order[positions[known]]
+        week = (selected.timestamps[known] - start_time) // WEEK
+        cells = (rows * weeks + week) * kinds + selected.types[known]
+        return np.bincount(cells, minlength=len(ids) * weeks * kinds).reshape(len(ids), weeks, kinds)
+
+    def streaks(self, moderator_id: int, start_time: int, end_time: int,
+                bucket: int = WEEK, minimum: int = 1, type: str = None) -> tuple[int, int]:
+        """Finds the longest and the current run of buckets in which a moderator
+        did at least a minimum amount of actions.
+
+        Args:
+            moderator_id (int): Discord id of the moderator.
+            start_time (int): Beginning of the timeframe (unix timestamp), the first bucket starts here.
+            end_time (int): End of the timeframe (unix timestamp), the last bucket is the current one.
+            bucket (int, optional): Length of a bucket in seconds. Defaults to WEEK.
+            minimum (int, optional): Actions needed for a bucket to count. Defaults to 1.
+            type (str, optional): Only count this type. Defaults to None.
+
+        Returns:
+            tuple[int, int]: The longest streak and the current streak, in buckets.
+        """
+        _, counts = self.histogram(start_time, end_time, bucket, moderator_id, type)
+        active = np.concatenate([[False], counts >= minimum, [False]])
+        # Runs start where active goes False -> True and end at True -> False.
+        edges = np.flatnonzero(np.diff(active.astype(np.int8)))
+        lengths = edges[1::2] - edges[::2]
+        longest = int(lengths.max()) if len(lengths) else 0
+        current = int(lengths[-1]) if len(lengths) and edges[-1] == len(counts) else 0
+        return longest, current
@@ -0,0 +1,202 @@
+import logging
+import math
+from db_handler import ACTION_TYPES
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+
+class Anomaly():
+    def __init__(self, moderator_id: int, guild_id: int, type: str, kind: str,
+                 count: int, mean: float, std: float, bucket_start: int) -> None:
+        """A moderator doing a lot more or a lot less of something than usual.
+
+        Args:
+            moderator_id (int): Discord id of the moderator.
+            guild_id (int): The guild the moderator acted in.
+            type (str): The action type ("sent", "edited" or "deleted").
+            kind (str): "spike" or "drop".
+            count (int): The amount of actions in the bucket.
+            mean (float): The usual amount per bucket.
+            std (float): The usual deviation from that.
+            bucket_start (int): Unix timestamp of the start of the bucket.
+        """
+        self.moderator_id = moderator_id
+        self.guild_id = guild_id
+        self.type = type
+        self.kind = kind
+        self.count = count
+        self.mean = mean
+        self.std = std
+        self.bucket_start = bucket_start
+
+
+class RateStats():
+    # Kept for every moderator and type, so keep them small.
+    __slots__ = ("bucket", "count", "mean", "var", "seen", "spike_bucket", "dropped")
+
+    def __init__(self, bucket: int) -> None:
+        self.bucket = bucket        # index of the bucket being counted
+        self.count = 0              # actions in that bucket so far
+        self.mean = 0.0             # EWMA of the finished buckets
+        self.var = 0.0              # EWMA variance of the finished buckets
+        self.seen = 0               # amount of finished buckets
+        self.spike_bucket = -1      # last bucket a spike was reported for
+        self.dropped = False        # if the last finished bucket was a drop
+
+
+class AnomalyDetector():
+    def __init__(self, bucket: int = DAY, alpha: float = 0.1, threshold: float = 3.0,
+                 min_count: int = 20, warmup: int = 14, max_gap: int = 60) -> None:
+        """Watches the rate of every moderator's actions as they come in and
+        flags sudden spikes (e.g. mass deletions) and drops.
+
+        Per guild, moderator and action type it only keeps an exponentially weighted
+        mean and variance of the actions per bucket plus the count of the
+        current bucket, so memory stays constant however long the bot runs and
+        nothing is read from the database per action.
+
+        Spikes are reported as soon as the current bucket goes past the
+        threshold, drops when a bucket ends (see sweep()).
+
+        Args:
+            bucket (int, optional): Length of a bucket in seconds. Defaults to DAY.
+            alpha (float, optional): Weight of the newest bucket in the averages, higher forgets faster. Defaults to 0.1.
+            threshold (float, optional): How many standard deviations away from the mean counts as unusual. Defaults to 3.0.
+            min_count (int, optional): Spikes need at least this many actions, drops a mean of at least this many. Keeps quiet moderators from raising alerts over a handful of actions. Defaults to 20.
+            warmup (int, optional): Buckets a moderator needs before they can raise alerts. Defaults to 14.
+            max_gap (int, optional): Most empty buckets that are folded in one at a time after a quiet spell, the averages are near zero after that anyway. Defaults to 60.
+        """
+        self.bucket = bucket
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_count = min_count
+        self.warmup = warmup
+        self.max_gap = max_gap
+        # (guild id, moderator id, type code) -> stats
+        self._stats: dict[tuple[int, int, int], RateStats] = {}
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    def observe(self, moderator_id: int, guild_id: int, type: str, timestamp: int) -> list[Anomaly]:
+        """Counts one action. Cheap enough to call for every event.
+
+        Args:
+            moderator_id (int): Discord id of the moderator.
+            guild_id (int): The guild the action happened in.
+            type (str): The action type ("sent", "edited" or "deleted").
+            timestamp (int): Unix timestamp of the action.
+
+        Returns:
+            list[Anomaly]: Anything unusual this action showed, usually nothing.
+        """
+        bucket = timestamp // self.bucket
+        key = (guild_id, moderator_id, ACTION_TYPES.index(type))
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = RateStats(bucket)
+
+        found = self._advance(key, stats, bucket) if bucket > stats.bucket else []
+        if bucket < stats.bucket:
+            # Stamped in a bucket that is already finished (the audit log
+            # can lag behind), too late to count.
+            return found
+        stats.count += 1
+
+        if stats.count < self.min_count or stats.seen < self.warmup:
+            return found
+        std = math.sqrt(stats.var)
+        if stats.spike_bucket != bucket and stats.count > stats.mean + self.threshold * std:
+            stats.spike_bucket = bucket
+            found.append(self._anomaly(key, stats, "spike", stats.count, std, bucket))
+        return found
+
+    def sweep(self, now: int, guild_id: int = None) -> list[Anomaly]:
+        """Finishes the buckets that ended before now for every moderator, so
+        moderators that went quiet get checked too. Run it about once a bucket.
+
+        Args:
+            now (int): The current unix timestamp.
+            guild_id (int, optional): Only sweep the moderators of this guild. Defaults to None, every guild.
+
+        Returns:
+            list[Anomaly]: The drops found in the finished buckets.
+        """
+        bucket = now // self.bucket
+        found = []
+        for key, stats in list(self._stats.items()):
+            if guild_id is None or key[0] == guild_id:
+                found += self._advance(key, stats, bucket)
+        return found
+
+    def seed(self, guild_id: int, rows: list[tuple[int, int, int, int]], now: int) -> None:
+        """Builds the statistics of a guild from its past actions, so alerts
+        don't have to wait for the warmup after every restart. Replaces what
+        was there for the guild, actions observed while seeding don't make it
+        into the new numbers.
+
+        Args:
+            guild_id (int): The guild the actions happened in.
+            rows (list[tuple[int, int, int, int]]): (id, timestamp, mod_id, type code) of the past actions in any order, see DBHandler.get_action_columns().
+            now (int): The current unix timestamp.
+        """
+        seeded: dict[tuple[int, int, int], RateStats] = {}
+        for _, timestamp, mod_id, type in sorted(rows, key=lambda row: row[1]):
+            bucket = timestamp // self.bucket
+            key = (guild_id, mod_id, type)
+            stats = seeded.get(key)
+            if stats is None:
+                stats = seeded[key] = RateStats(bucket)
+            self._advance(key, stats, bucket)
+            stats.count += 1
+        for key, stats in seeded.items():
+            # The current bucket stays open, a spike that's going on right
+            # now is still reported by the next action.
+            self._advance(key, stats, now // self.bucket)
+            stats.dropped = False
+        # A copy, observe() can add to the dict while this runs on a thread.
+        others = {key: stats for key, stats in list(self._stats.items()) if key[0] != guild_id}
+        self._stats = others | seeded
+
+    def forget(self, guild_id: int, moderator_id: int) -> None:
+        """Drops the statistics of a moderator in a guild, e.g. once they're de-registered."""
+        for type in range(len(ACTION_TYPES)):
+            self._stats.pop((guild_id, moderator_id, type), None)
+
+    def _advance(self, key: tuple[int, int, int], stats: RateStats, bucket: int) -> list[Anomaly]:
+        """Finishes the buckets of stats up to the given one and folds them
+        into the averages, checking each for a drop first."""
+        found = []
+        if bucket <= stats.bucket:
+            return found
+        gap = bucket - stats.bucket
+        for step in range(min(gap, self.max_gap)):
+            # The first one is the counted bucket, the rest were empty.
+            count = stats.count if step == 0 else 0
+            std = math.sqrt(stats.var)
+            drop = (stats.seen >= self.warmup and stats.mean >= self.min_count
+                    and count < stats.mean - self.threshold * std)
+            if drop and not stats.dropped:
+                found.append(self._anomaly(key, stats, "drop", count, std, stats.bucket + step))
+            stats.dropped = drop
+
+            if stats.seen >= self.warmup:
+                # Outliers are only folded in up to the threshold, so one
+                # spike doesn't blow up the variance and hide the next one.
+                count = min(max(count, stats.mean - self.threshold * std),
+                            stats.mean + self.threshold * std)
+            diff = count - stats.mean
+            increment = self.alpha * diff
+            stats.mean += increment
+            stats.var = (1 - self.alpha) * (stats.var + diff * increment)
+            stats.seen += 1
+        stats.bucket = bucket
+        stats.count = 0
+        return found
+
+    def _anomaly(self, key: tuple[int, int, int], stats: RateStats, kind: str,
+                 count: int, std: float, bucket: int) -> Anomaly:
+        return Anomaly(key[1], key[0], ACTION_TYPES[key[2]], kind,
+                       count, stats.mean, std, bucket * self.bucket)
@@ -0,0 +1,122 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+MONTH_FILE = re.compile(r"^actions-(\d{4})-(\d{2})\.sqlite$")
+
+
+def month_start(year: int, month: int) -> int:
+    """Returns the unix timestamp of the first second of a month (UTC)."""
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def next_month(year: int, month: int) -> tuple[int, int]:
+    """Returns the (year, month) after the given one."""
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_of(timestamp: int) -> tuple[int, int]:
+    """Returns the (year, month) a unix timestamp falls in (UTC)."""
+    date = datetime.fromtimestamp(timestamp, timezone.utc)
+    return date.year, date.month
+
+
+class ActionArchive():
+    def __init__(self, directory: str) -> None:
+        """Cold storage for old actions: one sqlite database per month, holding
+        an actions table with the same columns as the main one.
+
+        Months are archived oldest first and without gaps, so everything
+        before the end of the newest archived month (the boundary) lives
+        here and everything from the boundary on lives in the main database.
+        Reads for a range only open the archive files of the months it
+        actually overlaps.
+
+        Args:
+            directory (str): Where the monthly archive files are kept.
+        """
+        self.directory = directory
+        self.months: list[tuple[int, int]] = []
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                match = MONTH_FILE.match(name)
+                if match:
+                    self.months.append((int(match[1]), int(match[2])))
+        self.months.sort()
+        # (thread id, year, month) -> read only connection, see _connection().
+        self._connections: dict[tuple[int, int, int], sqlite3.Connection] = {}
+
+    @property
+    def boundary(self) -> int:
+        """Unix timestamp before which every action is archived, 0 if nothing is."""
+        if not self.months:
+            return 0
+        return month_start(*next_month(*self.months[-1]))
+
+    def path(self, year: int, month: int) -> str:
+        return os.path.join(self.directory, f"actions-{year:04d}-{month:02d}.sqlite")
+
+    def add(self, year: int, month: int) -> None:
+        """Marks a month as archived, its file has to be complete at this point.
+
+        Args:
+            year (int): The year of the month.
+            month (int): The month.
+        """
+        if (year, month) not in self.months:
+            self.months.append((year, month))
+            self.months.sort()
+
+    def max_id(self) -> int:
+        """Returns the highest action id in the archive, 0 if it's empty."""
+        if not self.months:
+            return 0
+        result = self._connection(*self.months[-1]).execute("SELECT MAX(id) FROM actions;").fetchone()
+        return result[0] or 0
+
+    def _connection(self, year: int, month: int) -> sqlite3.Connection:
+        # Connections can't be shared between threads, every thread keeps
+        # its own (read only) connection per archive file. close() runs on
+        # another thread than most of them.
+        key = (threading.get_ident(), year, month)
+        connection = self._connections.get(key)
+        if connection is None:
+            uri = f"file:{os.path.abspath(self.path(year, month))}?mode=ro"
+            connection = self._connections[key] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return connection
+
+    def close(self) -> None:
+        """Closes the connections to the archive files of every thread."""
+        for connection in self._connections.values():
+            connection.close()
+        self._connections = {}
+
+    def read(self, query: str, start_time: int, end_time: int, vars: tuple = ()) -> list[tuple]:
+        """Runs a read query on every archived month that overlaps the range.
+        The query has to filter on "timestamp" BETWEEN ? AND ? with those as
+        its first two parameters.
+
+        Args:
+            query (str): The query string.
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            vars (tuple, optional): The vars for the rest of the query. Defaults to ().
+
+        Returns:
+            list[tuple]: The rows of all the overlapping months, oldest month first.
+        """
+        result = []
+        for year, month in list(self.months):
+            if end_time < month_start(year, month) or start_time >= month_start(*next_month(year, month)):
+                continue
+            try:
+                result += self._connection(year, month).execute(
+                    query, (start_time, end_time) + vars).fetchall()
+            except sqlite3.Error as e:
+                logger.error("The error '%s' occurred while reading archive %04d-%02d", e, year, month)
+        return result
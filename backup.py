@@ -0,0 +1,187 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Callable
+from db_handler import DBHandler
+from metrics import metrics, TimingStats
+
+logger = logging.getLogger(__name__)
+
+
+class BackupManager():
+    def __init__(self, db: DBHandler, directory: str, keep: int = 7,
+                 pages: int = 256, pause: float = 0.005) -> None:
+        """Takes consistent copies of the database while the bot keeps running,
+        and keeps the newest few of them as gzipped snapshots. The monthly
+        archive files (see archive.py) hold the only copy of old actions, so
+        each of them is copied too, into directory/archive, whenever it
+        changed since its last copy.
+
+        The copy is made with sqlite's online backup API on a worker thread,
+        a few pages per step with a short pause in between. The source
+        connection holds one read transaction for the whole copy, so every
+        step reads from the same snapshot and writes from the bot (which WAL
+        lets through next to a reader) never make the backup start over.
+
+        Args:
+            db (DBHandler): The database to back up.
+            directory (str): Where to put the snapshots.
+            keep (int, optional): How many snapshots to keep, older ones are deleted. Defaults to 7.
+            pages (int, optional): The amount of pages to copy per step. Defaults to 256.
+            pause (float, optional): Seconds to wait between steps. Defaults to 0.005.
+        """
+        self.db = db
+        self.directory = directory
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        self._lock = asyncio.Lock()
+
+    def snapshots(self) -> list[str]:
+        """Returns the paths of the kept snapshots, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith("db-") and name.endswith(".sqlite.gz"))
+        return [os.path.join(self.directory, name) for name in names]
+
+    async def run(self, guild_id: int = 0) -> str:
+        """Takes a backup, used as the "backup" job.
+
+        Args:
+            guild_id (int, optional): Unused, backups aren't tied to a guild. Defaults to 0.
+
+        Returns:
+            str: The path of the new snapshot.
+        """
+        async with self._lock:
+            return await asyncio.to_thread(self.backup)
+
+    def backup(self) -> str:
+        """Copies the database into a new gzipped snapshot and drops the
+        snapshots past the ones to keep. Blocks, run it on a worker thread.
+
+        Returns:
+            str: The path of the new snapshot.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"db-{stamp}.sqlite.gz")
+        partial = os.path.join(self.directory, f".db-{stamp}.sqlite.partial")
+
+        # Times every write the bot makes while we copy, that's the delay
+        # the backup causes.
+        writes = self.db.write_timings = TimingStats()
+        steps = 0
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal steps
+            steps += 1
+            # Give the GIL (and with it the event loop) a moment between steps.
+            time.sleep(self.pause)
+
+        start = time.perf_counter()
+        try:
+            copy_ms = self._copy(sqlite3.connect(self.db.path, isolation_level=None),
+                                 partial, path, progress)
+        finally:
+            self.db.write_timings = None
+        archives = self.backup_archives()
+        total_ms = (time.perf_counter() - start) * 1000
+
+        removed = 0
+        for old in self.snapshots()[:-self.keep]:
+            os.remove(old)
+            removed += 1
+
+        size = os.path.getsize(path)
+        metrics.observe("backup.copy", copy_ms)
+        metrics.observe("backup.total", total_ms)
+        metrics.set_gauge("backup.size_bytes", size)
+        metrics.set_gauge("backup.write_delay_max_ms", round(writes.max_ms, 1))
+        logger.info(
+            "backed up the database to %s (%d KiB) in %.0f ms (copy %.0f ms, %d steps), "
+            "%d writes during the copy, p99 %.1f ms, max %.1f ms, %d old snapshots removed, "
+            "%d archive months copied",
+            path, size // 1024, total_ms, copy_ms, steps,
+            writes.count, writes.percentile(99), writes.max_ms, removed, archives)
+        return path
+
+    def backup_archives(self) -> int:
+        """Copies every monthly archive file that changed since its last copy
+        into directory/archive, gzipped. There is one copy per month, made
+        again when archiving adds to the month or DBHandler.assign_unowned_rows()
+        rewrites it. Blocks, run it on a worker thread.
+
+        Returns:
+            int: The amount of archive files that were copied.
+        """
+        archive = self.db.archive
+        if archive is None:
+            return 0
+        directory = os.path.join(self.directory, "archive")
+        os.makedirs(directory, exist_ok=True)
+        copied = 0
+        for year, month in list(archive.months):
+            source = archive.path(year, month)
+            name = os.path.basename(source)
+            path = os.path.join(directory, f"{name}.gz")
+            # Copies carry the modification time their source had when the
+            # copy started, so a change made during the copy isn't missed.
+            modified = os.path.getmtime(source)
+            if os.path.exists(path) and os.path.getmtime(path) == modified:
+                continue
+            uri = f"file:{os.path.abspath(source)}?mode=ro"
+            self._copy(sqlite3.connect(uri, uri=True, isolation_level=None),
+                       os.path.join(directory, f".{name}.partial"), path)
+            os.utime(path, (modified, modified))
+            copied += 1
+        metrics.set_gauge("backup.archive_files", len(archive.months))
+        return copied
+
+    def _copy(self, source: sqlite3.Connection, partial: str, path: str,
+              progress: Callable[[int, int, int], None] = None) -> float:
+        """Copies a database from one read snapshot into a gzipped file with
+        sqlite's online backup API, and closes the source connection.
+
+        Args:
+            source (sqlite3.Connection): Connection to the database to copy, in autocommit mode.
+            partial (str): Where to put the uncompressed copy until it's gzipped.
+            path (str): The path of the gzipped copy.
+            progress (Callable[[int, int, int], None], optional): Called after every step, see sqlite3.Connection.backup(). Defaults to None.
+
+        Returns:
+            float: The time the copy (without the compression) took, in milliseconds.
+        """
+        start = time.perf_counter()
+        target = sqlite3.connect(partial)
+        # The partial file is thrown away if anything goes wrong, so it needs
+        # no journal, and skipping its syncs keeps the disk free for the bot.
+        target.execute("PRAGMA journal_mode = OFF;")
+        target.execute("PRAGMA synchronous = OFF;")
+        try:
+            source.execute("BEGIN;")
+            # Starts the read transaction, from here on we see one snapshot.
+            source.execute("SELECT COUNT(*) FROM sqlite_master;").fetchone()
+            source.backup(target, pages=self.pages, progress=progress)
+            source.execute("COMMIT;")
+            copy_ms = (time.perf_counter() - start) * 1000
+        finally:
+            source.close()
+            target.close()
+
+        try:
+            with open(partial, "rb") as raw, gzip.open(path + ".tmp", "wb", compresslevel=6) as compressed:
+                shutil.copyfileobj(raw, compressed)
+            # Replaces the last copy of an archive month only once the new one is complete.
+            os.replace(path + ".tmp", path)
+        finally:
+            os.remove(partial)
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+        return copy_ms
@@ -0,0 +1,379 @@
+# -*- coding: UTF-8 -*-
+"""Offline replay benchmark for the cogs.
+
+Drives the listeners and commands of ModManager, StickyManager and
+MemberCountManager with fake discord objects against a temporary database,
+and reports throughput, per handler latency and the final database size.
+Nothing here talks to discord, so it runs without a network connection.
+
+Run from the repository root:
+    python benchmarks/cog_replay.py --events 20000 --moderators 20 --users 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import discord  # noqa: E402
+from db_handler import DBHandler  # noqa: E402
+from metrics import TimingStats, metrics  # noqa: E402
+from job_scheduler import JobScheduler  # noqa: E402
+from member_resolver import MemberResolver  # noqa: E402
+from outbound import OutboundScheduler  # noqa: E402
+
+GUILD_ID = 1_000
+MOD_CATEGORY_ID = 2_000
+MEMBER_COUNT_CHANNEL_ID = 3_000
+BOT_ID = 4_000
+
+
+# ---------------------------- FAKE DISCORD ----------------------------
+
+class FakeUser():
+    def __init__(self, id: int, name: str) -> None:
+        self.id = id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{id}>"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+class FakePartialMessage():
+    def __init__(self, id: int) -> None:
+        self.id = id
+
+    async def delete(self) -> None:
+        pass
+
+
+class FakeChannel():
+    def __init__(self, id: int, guild: "FakeGuild", category_id: int = None) -> None:
+        self.id = id
+        self.guild = guild
+        self.category_id = category_id
+        self.name = f"channel-{id}"
+
+    async def send(self, **kwargs) -> "FakeMessage":
+        return FakeMessage(self.guild.next_id(), self.guild.bot_user, self,
+                           self.guild.clock)
+
+    def get_partial_message(self, message_id: int) -> FakePartialMessage:
+        return FakePartialMessage(message_id)
+
+    async def edit(self, **kwargs) -> None:
+        if "name" in kwargs:
+            self.name = kwargs["name"]
+
+    async def delete(self) -> None:
+        pass
+
+
+class FakeGuild():
+    def __init__(self, id: int, bot_user: FakeUser, members: dict[int, FakeUser]) -> None:
+        self.id = id
+        self.bot_user = bot_user
+        self.members = members
+        self.member_count = len(members)
+        self.channels: dict[int, FakeChannel] = {}
+        self.clock = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self._id = 10_000_000
+
+    def next_id(self) -> int:
+        self._id += 1
+        return self._id
+
+    def get_member(self, id: int) -> FakeUser:
+        return self.members.get(id)
+
+    def get_channel(self, id: int) -> FakeChannel:
+        return self.channels.get(id)
+
+
+class FakeMessage():
+    def __init__(self, id: int, author: FakeUser, channel: FakeChannel,
+                 created_at: datetime) -> None:
+        self.id = id
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.created_at = created_at
+        self.edited_at = None
+
+
+class FakeRawMessageUpdate():
+    def __init__(self, message: FakeMessage) -> None:
+        self.message = message
+
+
+class FakeAuditLogEntry():
+    def __init__(self, user: FakeUser, channel: FakeChannel, created_at: datetime) -> None:
+        self.action = discord.AuditLogAction.message_delete
+        self.user = user
+        self.user_id = user.id
+        self.guild = channel.guild
+        self.extra = type("Extra", (), {"channel": channel, "count": 1})()
+        self.created_at = created_at
+
+
+class FakeCallbackResponse():
+    def __init__(self) -> None:
+        # Nothing is really sent, so there is no message to point to.
+        self.resource = None
+
+
+class FakeResponse():
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send_message(self, *args, **kwargs) -> FakeCallbackResponse:
+        self.sent += 1
+        return FakeCallbackResponse()
+
+    async def defer(self, *args, **kwargs) -> None:
+        pass
+
+    async def send_modal(self, *args, **kwargs) -> None:
+        self.sent += 1
+
+    def is_done(self) -> bool:
+        return self.sent > 0
+
+
+class FakeFollowup():
+    async def send(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeInteraction():
+    def __init__(self, bot: "FakeBot", user: FakeUser, channel: FakeChannel) -> None:
+        guild = bot.guild
+        self.id = guild.next_id()
+        self.client = bot
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        # Real time, not the guild clock, since the time to first response
+        # is measured against it.
+        self.created_at = discord.utils.utcnow()
+        self.command = None
+        self.data = {}
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+class FakeTree():
+    def add_command(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeBot():
+    def __init__(self, db: DBHandler, user: FakeUser, guild: FakeGuild) -> None:
+        self.db = db
+        self.user = user
+        self.tree = FakeTree()
+        self.guild = guild
+        self.outbound = OutboundScheduler()
+        # Never started, the benchmark runs the jobs itself.
+        self.jobs = JobScheduler(db)
+        self.member_resolver = MemberResolver()
+
+    def get_guild(self, id: int) -> FakeGuild:
+        return self.guild if id == self.guild.id else None
+
+    async def wait_until_ready(self) -> None:
+        # Never "ready", so background loops never start on their own
+        # and only run when the benchmark calls them.
+        await asyncio.Event().wait()
+
+
+# ------------------------------ BENCHMARK -----------------------------
+
+async def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="cog_replay_")
+    db_path = os.path.join(workdir, "bench.sqlite")
+    db = DBHandler(db_path)
+    db.create_tables()
+    db.warm_up()
+
+    # Importing the cogs only after the database exists, like the bot does.
+    from cogs.Mod_manager import ModManager
+    from cogs.sticky_manager import StickyManager
+    from cogs.Member_count_manager import MemberCountManager
+
+    bot_user = FakeUser(BOT_ID, "bot")
+    users = {i: FakeUser(i, f"user{i}") for i in range(1, args.users + 1)}
+    guild = FakeGuild(GUILD_ID, bot_user, users)
+    bot = FakeBot(db, bot_user, guild)
+
+    channels = [FakeChannel(guild.next_id(), guild) for _ in range(args.channels)]
+    mod_channels = [FakeChannel(guild.next_id(), guild, MOD_CATEGORY_ID) for _ in range(2)]
+    for channel in channels + mod_channels:
+        guild.channels[channel.id] = channel
+    guild.channels[MEMBER_COUNT_CHANNEL_ID] = FakeChannel(MEMBER_COUNT_CHANNEL_ID, guild)
+
+    db.add_guild(GUILD_ID, (10, 5, 5), MOD_CATEGORY_ID, 0, 604_800,
+                 MEMBER_COUNT_CHANNEL_ID)
+    moderators = rng.sample(list(users.values()), args.moderators)
+    for mod in moderators:
+        db.register_moderator(GUILD_ID, mod.id, (10, 5, 5))
+    for channel in channels[:args.sticky_channels]:
+        db.create_sticky(GUILD_ID, channel.id, guild.next_id(), "Rules", "Please read the rules.")
+
+    mod_manager = ModManager(bot)
+    sticky_manager = StickyManager(bot)
+    member_count_manager = MemberCountManager(bot)
+
+    timings: dict[str, TimingStats] = {}
+    recent_messages: list[FakeMessage] = []
+
+    async def timed(name: str, coro) -> None:
+        start = time.perf_counter()
+        await coro
+        stats = timings.get(name)
+        if stats is None:
+            stats = timings[name] = TimingStats(window=args.events)
+        stats.add((time.perf_counter() - start) * 1000)
+
+    def pick_author() -> FakeUser:
+        # Moderators write a share of the messages way bigger than their
+        # share of the members, just like on a real server.
+        if rng.random() < args.moderator_share:
+            return rng.choice(moderators)
+        return users[rng.randint(1, args.users)]
+
+    weights = [args.message_weight, args.edit_weight,
+               args.delete_weight, args.interaction_weight]
+    kinds = ["message", "edit", "delete", "interaction"]
+
+    start = time.perf_counter()
+    for i in range(args.events):
+        guild.clock += timedelta(seconds=rng.randint(1, 30))
+        kind = rng.choices(kinds, weights)[0]
+
+        if kind == "message" or not recent_messages:
+            channel = rng.choice(channels + mod_channels)
+            msg = FakeMessage(guild.next_id(), pick_author(), channel, guild.clock)
+            recent_messages.append(msg)
+            if len(recent_messages) > 500:
+                recent_messages.pop(0)
+            # The bot dispatches on_message to every cog listening for it.
+            await timed("ModManager.on_message", mod_manager.on_message(msg))
+            await timed("StickyManager.on_message", sticky_manager.on_message(msg))
+
+        elif kind == "edit":
+            msg = rng.choice(recent_messages)
+            msg.edited_at = guild.clock
+            await timed("ModManager.on_raw_message_edit",
+                        mod_manager.on_raw_message_edit(FakeRawMessageUpdate(msg)))
+
+        elif kind == "delete":
+            entry = FakeAuditLogEntry(rng.choice(moderators),
+                                      rng.choice(channels), guild.clock)
+            await timed("ModManager.on_audit_log_entry_create",
+                        mod_manager.on_audit_log_entry_create(entry))
+
+        else:
+            mod = rng.choice(moderators)
+            interaction = FakeInteraction(bot, mod, rng.choice(channels))
+            if rng.random() < 0.5:
+                await timed("ModManager.get_moderator",
+                            mod_manager.get_moderator(interaction, mod))
+            else:
+                await timed("ModManager.get_moderator_stats",
+                            mod_manager.get_moderator_stats.callback(
+                                mod_manager, interaction, mod, "7d"))
+
+        if i % args.member_count_every == 0:
+            await timed("MemberCountManager.update_member_count",
+                        member_count_manager.update_member_count(GUILD_ID))
+
+        # Let queued outbound work (sticky reposts, renames) run between
+        # events, like it would between gateway events.
+        await asyncio.sleep(0)
+
+    interaction = FakeInteraction(bot, moderators[0], channels[0])
+    await timed("ModManager.list_moderators",
+                mod_manager.list_moderators.callback(mod_manager, interaction))
+    await timed("ModManager.run_quota_check",
+                mod_manager.run_quota_check(GUILD_ID))
+    await timed("ModManager.run_anomaly_sweep",
+                mod_manager.run_anomaly_sweep(GUILD_ID))
+    await bot.outbound.drain()
+    elapsed = time.perf_counter() - start
+
+    db.close()
+
+    report = {
+        "events": args.events,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(args.events / elapsed, 1),
+        "db_size_bytes": os.path.getsize(db_path),
+        "handlers": {
+            name: {
+                "count": stats.count,
+                "p50_ms": round(stats.percentile(50), 4),
+                "p99_ms": round(stats.percentile(99), 4),
+                "max_ms": round(stats.max_ms, 4),
+            } for name, stats in sorted(timings.items())
+        },
+        "outbound": {
+            "ran": {name: stats.count for name, stats in metrics.timings.items()
+                    if name.startswith("outbound.run.")},
+            "merged": {name: count for name, count in metrics.counters.items()
+                       if name.startswith("outbound.merged.")},
+        },
+    }
+    shutil.rmtree(workdir)
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['events']} events in {report['seconds']} s "
+          f"({report['events_per_second']} events/s), "
+          f"db size {report['db_size_bytes'] / 1024:.0f} KiB")
+    print(f"{'handler':<42} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, h in report["handlers"].items():
+        print(f"{name:<42} {h['count']:>7} {h['p50_ms']:>9.3f} {h['p99_ms']:>9.3f} {h['max_ms']:>9.3f}")
+    print("outbound jobs run:", report["outbound"]["ran"], "merged:", report["outbound"]["merged"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--moderators", type=int, default=20)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--channels", type=int, default=30)
+    parser.add_argument("--sticky-channels", type=int, default=5)
+    parser.add_argument("--moderator-share", type=float, default=0.2,
+                        help="share of messages written by moderators")
+    parser.add_argument("--message-weight", type=float, default=70)
+    parser.add_argument("--edit-weight", type=float, default=15)
+    parser.add_argument("--delete-weight", type=float, default=10)
+    parser.add_argument("--interaction-weight", type=float, default=5)
+    parser.add_argument("--member-count-every", type=int, default=1_000,
+                        help="run the member count loop once every this many events")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,340 @@
+# -*- coding: UTF-8 -*-
+"""DBHandler micro-benchmark at production data sizes.
+
+Fills a scratch SQLite database with a realistic amount of data (millions of
+actions, hundreds of moderators, years of vacation weeks) and times every
+public DBHandler method against it. Results are written as JSON so runs from
+before and after a schema or query change can be compared.
+
+Run from the repository root:
+    python benchmarks/db_bench.py --actions 2000000 --out before.json
+    python benchmarks/db_bench.py --actions 2000000 --out after.json --compare before.json
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db_handler import DBHandler  # noqa: E402
+
+GUILD_ID = 1_000
+WEEK = 604_800
+ACTION_TYPES = ["sent", "edited", "deleted"]
+
+
+class Context():
+    def __init__(self, db: DBHandler, args: argparse.Namespace) -> None:
+        """Everything the benchmark cases need to build their arguments.
+
+        Args:
+            db (DBHandler): The handler for the filled scratch database.
+            args (argparse.Namespace): The command line arguments.
+        """
+        self.db = db
+        self.rng = random.Random(args.seed)
+        self.mod_ids = list(range(1, args.moderators + 1))
+        self.channel_ids = list(range(100_000, 100_000 + args.channels))
+        self.end = int(datetime(2025, 1, 6, tzinfo=timezone.utc).timestamp())
+        self.start = self.end - args.years * 52 * WEEK
+        self._counter = 0
+
+    def next(self) -> int:
+        """Returns a fresh number every call, for ids that have to be unique."""
+        self._counter += 1
+        return self._counter
+
+    def mod(self) -> int:
+        """Returns the id of a random moderator."""
+        return self.rng.choice(self.mod_ids)
+
+    def channel(self) -> int:
+        """Returns the id of a random channel."""
+        return self.rng.choice(self.channel_ids)
+
+    def week(self, offset: int = 0) -> str:
+        """Returns a random "YYYY-WW" week string inside the filled period."""
+        ts = self.rng.randint(self.start, self.end - WEEK) + offset * WEEK
+        return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%W")
+
+
+# Every public DBHandler method, mapped to a function that builds its
+# arguments. Some get more than one case to cover short and long ranges.
+CASES = {
+    "create_sticky": lambda c: (GUILD_ID, 200_000 + c.next(), 300_000 + c.next(), "title", "description"),
+    "update_sticky": lambda c: (GUILD_ID, c.channel(), 400_000 + c.next()),
+    "del_sticky": lambda c: (GUILD_ID, c.channel()),
+    "get_sticky": lambda c: (GUILD_ID, c.channel()),
+    "get_all_stickies": lambda c: (GUILD_ID,),
+
+    "register_moderator": lambda c: (GUILD_ID, 1_000_000 + c.next(), (10, 5, 5)),
+    "set_quota": lambda c: (GUILD_ID, c.mod(), (10, 5, 5)),
+    "set_all_quotas": lambda c: (GUILD_ID, (10, 5, 5)),
+    "set_consecutive_completed_weeks": lambda c: (GUILD_ID, c.mod(), 3),
+    "increment_consecutive_completed_weeks": lambda c: (GUILD_ID, c.mod()),
+    "set_vacation_days": lambda c: (GUILD_ID, c.mod(), 7),
+    "increment_vacation_days": lambda c: (GUILD_ID, c.mod()),
+    "de_register_moderator": lambda c: (GUILD_ID, c.mod()),
+    "get_moderator": lambda c: (GUILD_ID, c.mod()),
+    "get_all_moderators": lambda c: (GUILD_ID,),
+    "get_all_inactive_moderators": lambda c: (GUILD_ID,),
+
+    "create_action": lambda c: (GUILD_ID, c.rng.choice(ACTION_TYPES), c.mod(), c.end, c.channel(), c.next()),
+    "get_all_actions[week]": lambda c: (GUILD_ID, c.end - WEEK, c.end, c.mod()),
+    "get_all_actions[all]": lambda c: (GUILD_ID, 0, c.end, c.mod()),
+    "get_all_actions_of_type[week]": lambda c: (GUILD_ID, c.end - WEEK, c.end, c.mod(), "sent"),
+    "get_all_actions_of_type[all]": lambda c: (GUILD_ID, 0, c.end, c.mod(), "sent"),
+    "get_amount_of_actions_by_type[week]": lambda c: (GUILD_ID, c.end - WEEK, c.end, c.mod()),
+    "get_amount_of_actions_by_type[all]": lambda c: (GUILD_ID, 0, c.end, c.mod()),
+    "get_amount_of_actions_per_moderator[week]": lambda c: (GUILD_ID, c.end - WEEK, c.end),
+    "get_amount_of_actions_per_moderator[all]": lambda c: (GUILD_ID, 0, c.end),
+    "get_action_columns[week]": lambda c: (GUILD_ID, c.end - WEEK, c.end),
+    "get_action_columns[all]": lambda c: (GUILD_ID, 0, c.end),
+    "count_actions[all]": lambda c: (GUILD_ID, 0, c.end),
+
+    # Nothing is older than the start, so this times the check for work.
+    "archive_actions": lambda c: (c.start,),
+
+    "add_vacation_week": lambda c: (GUILD_ID, c.mod(), f"9{c.next():03d}-01"),
+    "remove_vacation_week": lambda c: (GUILD_ID, c.mod(), c.week()),
+    "get_all_vacation_weeks": lambda c: (GUILD_ID, c.mod()),
+    "get_all_vacation_weeks_during_period": lambda c: (GUILD_ID, c.mod(), c.week(), c.week(26)),
+    "is_vacation_week": lambda c: (GUILD_ID, c.mod(), c.week()),
+    "amount_of_vacation_weeks": lambda c: (GUILD_ID, c.mod()),
+    "amount_of_vacation_weeks_during_period": lambda c: (GUILD_ID, c.mod(), c.week(), c.week(26)),
+
+    "add_guild": lambda c: (GUILD_ID + c.next(), (10, 5, 5)),
+    "set_mod_category_id": lambda c: (GUILD_ID, 5),
+    "set_last_mod_check": lambda c: (GUILD_ID, c.end),
+    "set_time_between_checks": lambda c: (GUILD_ID, WEEK),
+    "set_default_quotas": lambda c: (GUILD_ID, (10, 5, 5)),
+    "set_member_count_channel_id": lambda c: (GUILD_ID, 6),
+    "set_alert_channel_id": lambda c: (GUILD_ID, 7),
+    "get_guild": lambda c: (GUILD_ID,),
+    "get_all_guilds": lambda c: (),
+
+    "add_job": lambda c: (f"job{c.next()}", GUILD_ID, WEEK, c.end),
+    "set_job_schedule": lambda c: ("quota_check", GUILD_ID, WEEK, c.end),
+    "record_job_run": lambda c: ("quota_check", GUILD_ID, c.end, 12.5, None, c.end + WEEK),
+    "remove_job": lambda c: (f"job{c.next()}", GUILD_ID),
+    "get_all_jobs": lambda c: (),
+
+    "create_tables": lambda c: (),
+    "assign_unowned_rows": lambda c: ({channel: GUILD_ID for channel in c.channel_ids},),
+    "warm_up": lambda c: (),
+    "memory_usage": lambda c: (),
+}
+
+
+def fill(db: DBHandler, ctx: Context, args: argparse.Namespace) -> None:
+    """Bulk loads the scratch database. Goes straight to the connection
+    in one transaction, since the DBHandler commits after every row.
+
+    Args:
+        db (DBHandler): The handler for the empty scratch database.
+        ctx (Context): The benchmark context.
+        args (argparse.Namespace): The command line arguments.
+    """
+    rng = random.Random(args.seed)
+    con = db.connection
+
+    con.execute(
+        "INSERT INTO config VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (GUILD_ID, 1, ctx.start, WEEK, "10,5,5", 2, 3))
+    con.executemany(
+        "INSERT INTO moderators VALUES (?, 10, 5, 5, 0, 0, 1, ?)",
+        ((mod, GUILD_ID) for mod in ctx.mod_ids))
+    con.executemany(
+        f"INSERT INTO stickies VALUES (?, ?, 'title', 'description', {GUILD_ID})",
+        ((channel, channel + 1_000_000) for channel in ctx.channel_ids[:args.stickies]))
+
+    # Moderators aren't equally active, a few of them do most of the work.
+    weights = [rng.paretovariate(1.2) for _ in ctx.mod_ids]
+
+    def actions():
+        # Drawn in chunks, calling rng.choices once per row is way too slow
+        # for millions of rows.
+        span = ctx.end - ctx.start
+        for first in range(0, args.actions, 100_000):
+            k = min(100_000, args.actions - first)
+            # Stored as codes, the index into ACTION_TYPES.
+            types = rng.choices(range(len(ACTION_TYPES)), (70, 20, 10), k=k)
+            mods = rng.choices(ctx.mod_ids, weights, k=k)
+            channels = rng.choices(ctx.channel_ids, k=k)
+            for i in range(k):
+                yield (GUILD_ID,
+                       mods[i],
+                       ctx.start + rng.randrange(span),
+                       first + i + 1,
+                       types[i],
+                       channels[i],
+                       None if types[i] == 2 else 10_000_000 + first + i)
+    con.executemany(
+        "INSERT INTO actions (guild_id, mod_id, timestamp, id, type, channel_id, message_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        actions())
+
+    # Every moderator takes a few weeks of vacation a year.
+    def vacation_weeks():
+        day = datetime.fromtimestamp(ctx.start, timezone.utc)
+        while day.timestamp() < ctx.end:
+            for mod in ctx.mod_ids:
+                if rng.random() < args.vacation_rate:
+                    yield (day.strftime("%Y-%W"), mod, GUILD_ID)
+            day += timedelta(weeks=1)
+    con.executemany(
+        "INSERT OR IGNORE INTO vacation_weeks VALUES (?, ?, ?)", vacation_weeks())
+    con.commit()
+
+
+def time_method(ctx: Context, name: str, build_args, args: argparse.Namespace) -> dict:
+    """Times one benchmark case.
+
+    Args:
+        ctx (Context): The benchmark context.
+        name (str): Name of the case, the method name optionally followed by [variant].
+        build_args (Callable): Builds the arguments for one call.
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        dict: The timing results for the case, in milliseconds.
+    """
+    method = getattr(ctx.db, name.split("[")[0])
+    samples = []
+    deadline = time.perf_counter() + args.budget
+    while len(samples) < args.repeat and (len(samples) < 1 or time.perf_counter() < deadline):
+        call_args = build_args(ctx)
+        start = time.perf_counter()
+        try:
+            method(*call_args)
+        except ValueError:
+            # register_moderator refuses duplicates, that's not what we time.
+            pass
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.mean(samples), 4),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    workdir = tempfile.mkdtemp(prefix="db_bench_")
+    db_path = os.path.join(workdir, "bench.sqlite")
+    archive_dir = os.path.join(workdir, "archive") if args.archive_days is not None else None
+    db = DBHandler(db_path, archive_dir=archive_dir)
+    db.create_tables()
+    ctx = Context(db, args)
+
+    start = time.perf_counter()
+    fill(db, ctx, args)
+    fill_seconds = time.perf_counter() - start
+    print(f"filled database in {fill_seconds:.1f} s")
+    if args.archive_days is not None:
+        start = time.perf_counter()
+        moved = db.archive_actions(ctx.end - args.archive_days * 24 * 60 * 60)
+        print(f"archived {moved} actions in {time.perf_counter() - start:.1f} s")
+    if args.warm:
+        start = time.perf_counter()
+        db.warm_up()
+        print(f"warmed up caches in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    public = sorted(name for name, _ in inspect.getmembers(DBHandler, inspect.isfunction)
+                    if not name.startswith("_"))
+    # close() ends the handler, it's what the run finishes with.
+    covered = {name.split("[")[0] for name in CASES} | {"close"}
+    missing = [name for name in public if name not in covered]
+    if missing:
+        print(f"no benchmark case for: {', '.join(missing)}")
+
+    # Reads first, so the writes that come after don't change what they see.
+    order = sorted(CASES, key=lambda name: not name.split("[")[0].startswith(("get", "is", "amount")))
+    results = {}
+    for name in order:
+        if args.only and not any(part in name for part in args.only):
+            continue
+        results[name] = time_method(ctx, name, CASES[name], args)
+        print(f"{name:<45} {results[name]['median_ms']:>10.3f} ms")
+
+    db.close()
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "sizes": {
+            "actions": args.actions,
+            "moderators": args.moderators,
+            "years": args.years,
+            "channels": args.channels,
+        },
+        "fill_seconds": round(fill_seconds, 2),
+        "warm": args.warm,
+        "archive_days": args.archive_days,
+        "db_size_bytes": os.path.getsize(db_path),
+        "missing_cases": missing,
+        "results": results,
+    }
+    shutil.rmtree(workdir)
+    return report
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Prints the median of every case next to the one from an earlier run.
+
+    Args:
+        report (dict): The report from this run.
+        baseline (dict): The report to compare against.
+    """
+    print(f"\n{'case':<45} {'before ms':>10} {'after ms':>10} {'ratio':>7}")
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:<45} {'-':>10} {result['median_ms']:>10.3f}")
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        print(f"{name:<45} {old['median_ms']:>10.3f} {result['median_ms']:>10.3f} {ratio:>6.2f}x")
+    print(f"{'db size (MiB)':<45} {baseline['db_size_bytes'] / 2**20:>10.1f} "
+          f"{report['db_size_bytes'] / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--actions", type=int, default=2_000_000)
+    parser.add_argument("--moderators", type=int, default=300)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--channels", type=int, default=80)
+    parser.add_argument("--stickies", type=int, default=10)
+    parser.add_argument("--vacation-rate", type=float, default=0.05,
+                        help="chance a moderator takes any given week off")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="times to run each case")
+    parser.add_argument("--budget", type=float, default=3.0,
+                        help="max seconds to spend repeating a single case")
+    parser.add_argument("--only", nargs="*",
+                        help="only run cases whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true",
+                        help="fill the DBHandler caches first, so the cached getters are timed")
+    parser.add_argument("--archive-days", type=int,
+                        help="archive the actions of months older than this many days first, so reads span hot and cold storage")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
@@ -0,0 +1,641 @@
+# -*- coding: UTF-8 -*-
+"""Local stand-in for the discord REST API and gateway, for end-to-end load tests.
+
+Speaks just enough of discord's HTTP and gateway protocol for BTBot to log in,
+receive a guild and handle scripted traffic (messages, edits, deletions,
+member joins and slash commands), with configurable latency and rate limits.
+Nothing leaves the machine.
+
+Start the server, optionally seeding a database that matches the fake guild:
+    python benchmarks/fake_discord.py --seed-db ./db.sqlite --duration 120
+
+Then point the bot at it (the server prints the exact values on startup):
+    DISCORD_API_BASE=http://127.0.0.1:8765/api/v10 \\
+    DISCORD_GATEWAY_URL=ws://127.0.0.1:8765/gateway \\
+    TEST_TOKEN=fake TEST_GUILD_ID=<guild id> python main.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from aiohttp import web, WSMsgType
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from metrics import TimingStats  # noqa: E402
+
+DISCORD_EPOCH = 1_420_070_400_000
+# Ids of the guild, channels and members are derived from a fixed point in
+# time, so the same arguments always produce the same ones (and --seed-db
+# matches them). Messages, audit log entries and interactions carry the real
+# time instead, the bot dates actions by their ids.
+ID_BASE_MS = 1_700_000_000_000 - DISCORD_EPOCH
+
+MESSAGE_DELETE_AUDIT_ACTION = 72
+PERMISSIONS_ALL = str((1 << 50) - 1)
+
+
+def snowflake(n: int) -> int:
+    return (ID_BASE_MS << 22) + n
+
+
+def timed_snowflake(n: int) -> int:
+    """Returns an id created now, n keeps ids made in the same millisecond apart."""
+    return ((int(time.time() * 1000) - DISCORD_EPOCH) << 22) + n % 4096
+
+
+def iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def json_response(data, status: int = 200, headers: dict = None) -> web.Response:
+    # discord.py only parses bodies whose content type is exactly
+    # "application/json", aiohttp's own json_response adds a charset.
+    return web.Response(body=json.dumps(data).encode(), status=status,
+                        headers={**(headers or {}), "Content-Type": "application/json"})
+
+
+class RateLimiter():
+    def __init__(self, limit: int, window: float) -> None:
+        """A fixed window rate limit, like the ones discord puts on every route.
+
+        Args:
+            limit (int): Requests allowed per window, 0 to disable.
+            window (float): Length of the window in seconds.
+        """
+        self.limit = limit
+        self.window = window
+        self.windows: dict[str, tuple[float, int]] = {}
+
+    def hit(self, key: str) -> tuple[bool, int, float]:
+        """Counts one request against the given bucket.
+
+        Args:
+            key (str): The bucket the request belongs to.
+
+        Returns:
+            tuple[bool, int, float]: If the request is allowed, the remaining requests and seconds until the window resets.
+        """
+        now = time.monotonic()
+        start, count = self.windows.get(key, (now, 0))
+        if now - start >= self.window:
+            start, count = now, 0
+        reset_after = self.window - (now - start)
+        if self.limit and count >= self.limit:
+            return False, 0, reset_after
+        self.windows[key] = (start, count + 1)
+        return True, max(0, self.limit - count - 1), reset_after
+
+
+class FakeDiscord():
+    def __init__(self, args: argparse.Namespace) -> None:
+        """Holds the fake guild and everything the server has seen.
+
+        Args:
+            args (argparse.Namespace): The command line arguments.
+        """
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self._next_id = 0
+
+        self.bot_user = self.user(self.new_id(), "BTBot", bot=True)
+        self.application_id = self.new_id()
+        self.guild_id = args.guild_id or self.new_id()
+        self.mod_category_id = self.new_id()
+        self.mod_role_id = self.new_id()
+
+        self.channels: dict[int, dict] = {}
+        self.add_channel("moderators", 4)
+        self.mod_channel_id = self.add_channel("mod-chat", 0, self.mod_category_id)
+        self.member_count_channel_id = self.add_channel("members - 0", 2)
+        self.text_channel_ids = [self.add_channel(f"general-{i}", 0)
+                                 for i in range(args.channels)]
+        self.sticky_channel_ids = self.text_channel_ids[:args.sticky_channels]
+
+        self.members: dict[int, dict] = {}
+        for i in range(args.members):
+            member_id = self.new_id()
+            self.members[member_id] = self.member(self.user(member_id, f"user{i}"))
+        self.moderator_ids = list(self.members)[:args.moderators]
+        for mod_id in self.moderator_ids:
+            self.members[mod_id]["roles"] = [str(self.mod_role_id)]
+
+        # Connected sessions and the shard (id, count) each one identified as.
+        self.sessions: dict[web.WebSocketResponse, tuple[int, int]] = {}
+        self.sequence = 0
+        self.recent_messages: deque[dict] = deque(maxlen=200)
+        self.pending_interactions: dict[str, float] = {}
+        self.commands: dict[str, dict] = {}
+        self._load: asyncio.Task = None
+
+        self.route_limiter = RateLimiter(args.bucket_limit, args.bucket_window)
+        self.rename_limiter = RateLimiter(args.rename_limit, args.rename_window)
+        self.global_limiter = RateLimiter(args.global_limit, 1.0)
+        self.stats = {"requests": {}, "rate_limited": {}, "events": {}}
+        self.interaction_latency = TimingStats(window=100_000)
+
+    # ----------------------------- PAYLOADS -----------------------------
+
+    def new_id(self) -> int:
+        self._next_id += 1
+        return snowflake(self._next_id)
+
+    def new_event_id(self) -> int:
+        self._next_id += 1
+        return timed_snowflake(self._next_id)
+
+    def user(self, id: int, name: str, bot: bool = False) -> dict:
+        return {"id": str(id), "username": name, "global_name": name,
+                "discriminator": "0", "avatar": None, "bot": bot}
+
+    def member(self, user: dict) -> dict:
+        return {"user": user, "roles": [], "joined_at": iso_now(),
+                "deaf": False, "mute": False, "flags": 0}
+
+    def add_channel(self, name: str, type: int, parent_id: int = None) -> int:
+        id = self.new_id()
+        self.channels[id] = {
+            "id": str(id), "type": type, "name": name, "guild_id": str(self.guild_id),
+            "position": len(self.channels), "permission_overwrites": [],
+            "parent_id": str(parent_id) if parent_id else None, "nsfw": False,
+        }
+        if type == 2:
+            self.channels[id].update({"bitrate": 64_000, "user_limit": 0, "rtc_region": None})
+        return id
+
+    def guild(self) -> dict:
+        members = list(self.members.values()) + [self.member(self.bot_user)]
+        return {
+            "id": str(self.guild_id), "name": "Fake Battle Talent", "icon": None,
+            "owner_id": str(self.moderator_ids[0]) if self.moderator_ids else self.bot_user["id"],
+            "roles": [
+                {"id": str(self.guild_id), "name": "@everyone", "permissions": PERMISSIONS_ALL,
+                 "position": 0, "color": 0, "hoist": False, "managed": False,
+                 "mentionable": False, "flags": 0},
+                {"id": str(self.mod_role_id), "name": "Moderator", "permissions": PERMISSIONS_ALL,
+                 "position": 1, "color": 0, "hoist": True, "managed": False,
+                 "mentionable": False, "flags": 0},
+            ],
+            "channels": list(self.channels.values()),
+            "members": members,
+            "member_count": len(members),
+            "large": False, "unavailable": False, "features": [],
+            "emojis": [], "stickers": [], "threads": [], "voice_states": [],
+            "presences": [], "stage_instances": [], "guild_scheduled_events": [],
+            "joined_at": iso_now(), "premium_tier": 0, "preferred_locale": "en-US",
+        }
+
+    def message(self, channel_id: int, author: dict, content: str = "",
+                embeds: list = None, edited: bool = False) -> dict:
+        msg = {
+            "id": str(self.new_event_id()), "channel_id": str(channel_id),
+            "guild_id": str(self.guild_id), "author": author,
+            "content": content, "timestamp": iso_now(),
+            "edited_timestamp": iso_now() if edited else None,
+            "tts": False, "mention_everyone": False, "mentions": [],
+            "mention_roles": [], "attachments": [], "embeds": embeds or [],
+            "pinned": False, "type": 0,
+        }
+        if not author.get("bot"):
+            msg["member"] = {k: v for k, v in self.members[int(author["id"])].items() if k != "user"}
+        return msg
+
+    # ----------------------------- GATEWAY ------------------------------
+
+    async def dispatch(self, event: str, data: dict, ws: web.WebSocketResponse = None) -> None:
+        """Sends a dispatch event to the given session, or else to every
+        session whose shard the fake guild is on."""
+        self.sequence += 1
+        self.stats["events"][event] = self.stats["events"].get(event, 0) + 1
+        payload = json.dumps({"op": 0, "t": event, "s": self.sequence, "d": data})
+        targets = [ws] if ws is not None else [
+            session for session, shard in list(self.sessions.items()) if self.on_shard(shard)]
+        for session in targets:
+            if not session.closed:
+                await session.send_str(payload)
+
+    def on_shard(self, shard: tuple[int, int]) -> bool:
+        """Checks if the fake guild's events go to the given (id, count) shard."""
+        shard_id, shard_count = shard
+        return (self.guild_id >> 22) % shard_count == shard_id
+
+    async def gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": 41_250}})
+
+        async for raw in ws:
+            if raw.type != WSMsgType.TEXT:
+                continue
+            msg = json.loads(raw.data)
+            op, data = msg.get("op"), msg.get("d")
+
+            if op == 1:
+                await ws.send_json({"op": 11})
+
+            elif op in (2, 6):
+                # Identify and resume both get a fresh session, with the full
+                # guild if it's on the session's shard.
+                shard = tuple(data["shard"]) if isinstance(data, dict) and data.get("shard") else (0, 1)
+                self.sessions[ws] = shard
+                ready = {
+                    "v": 10, "user": self.bot_user, "session_id": f"fake-session-{shard[0]}",
+                    "resume_gateway_url": self.args.public_url.replace("http", "ws") + "/gateway",
+                    "guilds": [{"id": str(self.guild_id), "unavailable": True}] if self.on_shard(shard) else [],
+                    "application": {"id": str(self.application_id), "flags": 0},
+                    "shard": list(shard),
+                }
+                await self.dispatch("READY", ready, ws)
+                if self.on_shard(shard):
+                    await self.dispatch("GUILD_CREATE", self.guild(), ws)
+                if self.args.duration is not None and self._load is None:
+                    self._load = asyncio.create_task(self.generate_load())
+
+            elif op == 8:
+                # Member chunk request, answer with everyone matching.
+                user_ids = data.get("user_ids")
+                query = (data.get("query") or "").lower()
+                members = [m for id, m in self.members.items()
+                           if (user_ids is None or str(id) in map(str, user_ids))
+                           and m["user"]["username"].startswith(query)]
+                limit = data.get("limit") or len(members)
+                await self.dispatch("GUILD_MEMBERS_CHUNK", {
+                    "guild_id": str(self.guild_id), "members": members[:limit],
+                    "chunk_index": 0, "chunk_count": 1, "nonce": data.get("nonce"),
+                }, ws)
+
+        self.sessions.pop(ws, None)
+        return ws
+
+    # ------------------------------- REST -------------------------------
+
+    def bucket(self, request: web.Request) -> str:
+        """Returns the rate limit bucket of a request. Like discord, ids other than
+        the first one (the "major parameter") don't get their own bucket."""
+        parts = request.path.split("/")
+        seen_major = False
+        for i, part in enumerate(parts):
+            if part.isdigit():
+                if seen_major:
+                    parts[i] = "{id}"
+                seen_major = True
+        return f"{request.method} {'/'.join(parts)}"
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        if not request.path.startswith("/api/"):
+            return await handler(request)
+
+        bucket = self.bucket(request)
+        route = re.sub(r"\d{5,}", "{id}", bucket)
+        self.stats["requests"][route] = self.stats["requests"].get(route, 0) + 1
+
+        if self.args.latency_ms:
+            await asyncio.sleep(max(0, self.rng.gauss(self.args.latency_ms, self.args.jitter_ms)) / 1000)
+
+        allowed, remaining, reset_after = self.global_limiter.hit("global")
+        is_global = not allowed
+        if allowed:
+            allowed, remaining, reset_after = self.route_limiter.hit(bucket)
+        # Renaming channels has its own, much stricter limit on discord.
+        if allowed and request.method == "PATCH" and request.path.startswith("/api/v10/channels/"):
+            allowed, remaining, reset_after = self.rename_limiter.hit(bucket)
+
+        headers = {
+            "X-RateLimit-Limit": str(self.args.bucket_limit or 1000),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": f"fake-{abs(hash(bucket))}",
+        }
+        if not allowed:
+            self.stats["rate_limited"][route] = self.stats["rate_limited"].get(route, 0) + 1
+            headers["Retry-After"] = f"{reset_after:.3f}"
+            # discord.py treats a 429 without a Via header as a Cloudflare ban.
+            headers["Via"] = "1.1 google"
+            if is_global:
+                headers["X-RateLimit-Global"] = "true"
+            else:
+                headers["X-RateLimit-Scope"] = "user"
+            return json_response(
+                {"message": "You are being rate limited.", "retry_after": reset_after,
+                 "global": is_global, "code": 0},
+                status=429, headers=headers)
+
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    async def get_me(self, request: web.Request) -> web.Response:
+        return json_response(self.bot_user)
+
+    async def get_application(self, request: web.Request) -> web.Response:
+        return json_response({
+            "id": str(self.application_id), "name": "BTBot", "description": "",
+            "icon": None, "bot_public": False, "bot_require_code_grant": False,
+            "owner": self.user(self.new_id(), "owner"), "verify_key": "", "flags": 0,
+        })
+
+    async def get_gateway(self, request: web.Request) -> web.Response:
+        return json_response({
+            "url": self.args.public_url.replace("http", "ws") + "/gateway",
+            "shards": self.args.shards,
+            "session_start_limit": {"total": 1000, "remaining": 1000,
+                                    "reset_after": 0, "max_concurrency": 1},
+        })
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        channel_id = int(request.match_info["channel_id"])
+        body = await self.read_body(request)
+        return json_response(self.message(
+            channel_id, self.bot_user, body.get("content") or "", body.get("embeds")))
+
+    async def delete_message(self, request: web.Request) -> web.Response:
+        return web.Response(status=204)
+
+    async def edit_channel(self, request: web.Request) -> web.Response:
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return json_response({"message": "Unknown Channel", "code": 10003}, status=404)
+        channel.update({k: v for k, v in (await self.read_body(request)).items()
+                        if k in ("name", "position", "topic")})
+        return json_response(channel)
+
+    async def delete_channel(self, request: web.Request) -> web.Response:
+        channel = self.channels.pop(int(request.match_info["channel_id"]), None)
+        if channel is None:
+            return json_response({"message": "Unknown Channel", "code": 10003}, status=404)
+        return json_response(channel)
+
+    async def create_channel(self, request: web.Request) -> web.Response:
+        body = await self.read_body(request)
+        id = self.add_channel(body.get("name", "channel"), body.get("type", 0), body.get("parent_id"))
+        return json_response(self.channels[id])
+
+    async def interaction_callback(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        sent_at = self.pending_interactions.pop(token, None)
+        if sent_at is not None:
+            self.interaction_latency.add((time.perf_counter() - sent_at) * 1000)
+        body = await self.read_body(request)
+        data = body.get("data") or {}
+        message = self.message(self.text_channel_ids[0], self.bot_user,
+                               data.get("content") or "", data.get("embeds"))
+        return json_response({
+            "interaction": {"id": request.match_info["interaction_id"], "type": 2,
+                            "response_message_id": message["id"],
+                            "response_message_loading": body.get("type") == 5,
+                            "response_message_ephemeral": False},
+            "resource": {"type": body.get("type", 4), "message": message},
+        })
+
+    async def webhook_message(self, request: web.Request) -> web.Response:
+        body = await self.read_body(request)
+        return json_response(self.message(
+            self.text_channel_ids[0], self.bot_user, body.get("content") or "", body.get("embeds")))
+
+    async def sync_commands(self, request: web.Request) -> web.Response:
+        commands = await self.read_body(request)
+        result = []
+        for command in commands:
+            # discord always sends a description back, even for context menus.
+            command = {"description": "", **command, "id": str(self.new_id()),
+                       "application_id": str(self.application_id), "version": "1"}
+            self.commands[command["name"]] = command
+            result.append(command)
+        return json_response(result)
+
+    async def get_commands(self, request: web.Request) -> web.Response:
+        return json_response(list(self.commands.values()))
+
+    async def fallback(self, request: web.Request) -> web.Response:
+        print(f"unhandled route: {request.method} {request.path}")
+        return json_response({"message": "404: Not Found", "code": 0}, status=404)
+
+    @staticmethod
+    async def read_body(request: web.Request):
+        if request.content_type == "application/json":
+            return await request.json()
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "payload_json":
+                    return json.loads(await part.text())
+        return {}
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        api = "/api/v{version}"
+        app.router.add_get("/gateway", self.gateway)
+        app.router.add_get(api + "/users/@me", self.get_me)
+        app.router.add_get(api + "/oauth2/applications/@me", self.get_application)
+        app.router.add_get(api + "/gateway", self.get_gateway)
+        app.router.add_get(api + "/gateway/bot", self.get_gateway)
+        app.router.add_post(api + "/channels/{channel_id}/messages", self.create_message)
+        app.router.add_delete(api + "/channels/{channel_id}/messages/{message_id}", self.delete_message)
+        app.router.add_patch(api + "/channels/{channel_id}", self.edit_channel)
+        app.router.add_delete(api + "/channels/{channel_id}", self.delete_channel)
+        app.router.add_post(api + "/guilds/{guild_id}/channels", self.create_channel)
+        app.router.add_post(api + "/interactions/{interaction_id}/{token}/callback", self.interaction_callback)
+        app.router.add_post(api + "/webhooks/{application_id}/{token}", self.webhook_message)
+        app.router.add_patch(api + "/webhooks/{application_id}/{token}/messages/{message_id}", self.webhook_message)
+        app.router.add_put(api + "/applications/{application_id}/commands", self.sync_commands)
+        app.router.add_put(api + "/applications/{application_id}/guilds/{guild_id}/commands", self.sync_commands)
+        app.router.add_get(api + "/applications/{application_id}/commands", self.get_commands)
+        app.router.add_get(api + "/applications/{application_id}/guilds/{guild_id}/commands", self.get_commands)
+        app.router.add_route("*", "/api/{tail:.*}", self.fallback)
+        return app
+
+    # ------------------------------- LOAD -------------------------------
+
+    async def generate_load(self) -> None:
+        """Sends scripted traffic at the configured rates until the duration runs out."""
+        args = self.args
+        rates = {
+            "message": args.message_rate,
+            "edit": args.edit_rate,
+            "delete": args.delete_rate,
+            "join": args.join_rate,
+            "interaction": args.interaction_rate,
+        }
+        total = sum(rates.values())
+        if not total:
+            return
+        kinds, weights = list(rates), list(rates.values())
+        # Give the bot a moment to finish its own startup.
+        await asyncio.sleep(args.warmup)
+        print(f"sending load for {args.duration} s at {total:g} events/s")
+        end = time.monotonic() + args.duration
+
+        while time.monotonic() < end:
+            await asyncio.sleep(self.rng.expovariate(total))
+            kind = self.rng.choices(kinds, weights)[0]
+            await getattr(self, f"send_{kind}")()
+
+        print("load finished")
+        self.print_report()
+
+    def pick_author(self) -> dict:
+        if self.moderator_ids and self.rng.random() < self.args.moderator_share:
+            return self.members[self.rng.choice(self.moderator_ids)]["user"]
+        return self.rng.choice(list(self.members.values()))["user"]
+
+    async def send_message(self) -> None:
+        channel_id = self.rng.choice(self.text_channel_ids + [self.mod_channel_id])
+        msg = self.message(channel_id, self.pick_author(), "hello")
+        self.recent_messages.append(msg)
+        await self.dispatch("MESSAGE_CREATE", msg)
+
+    async def send_edit(self) -> None:
+        if not self.recent_messages:
+            return await self.send_message()
+        msg = self.rng.choice(self.recent_messages)
+        msg = {**msg, "content": msg["content"] + " (edited)", "edited_timestamp": iso_now()}
+        await self.dispatch("MESSAGE_UPDATE", msg)
+
+    async def send_delete(self) -> None:
+        if not self.recent_messages or not self.moderator_ids:
+            return
+        msg = self.recent_messages.popleft()
+        await self.dispatch("MESSAGE_DELETE", {
+            "id": msg["id"], "channel_id": msg["channel_id"], "guild_id": str(self.guild_id)})
+        await self.dispatch("GUILD_AUDIT_LOG_ENTRY_CREATE", {
+            "id": str(self.new_event_id()), "guild_id": str(self.guild_id),
+            "user_id": str(self.rng.choice(self.moderator_ids)),
+            "target_id": msg["author"]["id"], "action_type": MESSAGE_DELETE_AUDIT_ACTION,
+            "options": {"channel_id": msg["channel_id"], "count": "1"},
+            "changes": [], "reason": None,
+        })
+
+    async def send_join(self) -> None:
+        member_id = self.new_id()
+        member = self.member(self.user(member_id, f"user{len(self.members)}"))
+        self.members[member_id] = member
+        await self.dispatch("GUILD_MEMBER_ADD", {**member, "guild_id": str(self.guild_id)})
+
+    async def send_interaction(self) -> None:
+        if not self.moderator_ids:
+            return
+        invoker = self.members[self.rng.choice(self.moderator_ids)]
+        target = self.members[self.rng.choice(self.moderator_ids)]
+        if self.rng.random() < 0.5:
+            data = {"name": "list_moderators", "type": 1, "options": []}
+        else:
+            data = {
+                "name": "get_moderator_stats", "type": 1,
+                "options": [{"name": "user", "type": 6, "value": target["user"]["id"]},
+                            {"name": "earlier_time", "type": 3, "value": "7d"}],
+                "resolved": {
+                    "users": {target["user"]["id"]: target["user"]},
+                    "members": {target["user"]["id"]: {k: v for k, v in target.items() if k != "user"}},
+                },
+            }
+        data["id"] = self.commands.get(data["name"], {}).get("id", str(self.new_id()))
+        token = f"token-{self.new_id()}"
+        channel = self.channels[self.rng.choice(self.text_channel_ids)]
+        self.pending_interactions[token] = time.perf_counter()
+        # The bot measures its time to first response against the interaction id.
+        interaction_id = self.new_event_id()
+        await self.dispatch("INTERACTION_CREATE", {
+            "id": str(interaction_id), "application_id": str(self.application_id),
+            "type": 2, "data": data, "guild_id": str(self.guild_id),
+            "channel_id": channel["id"], "channel": channel,
+            "member": {**invoker, "permissions": PERMISSIONS_ALL},
+            "token": token, "version": 1, "locale": "en-US",
+            "app_permissions": PERMISSIONS_ALL, "attachment_size_limit": 8_388_608,
+        })
+
+    def print_report(self) -> None:
+        print("\nrequests per route:")
+        for route, count in sorted(self.stats["requests"].items(), key=lambda i: -i[1]):
+            limited = self.stats["rate_limited"].get(route, 0)
+            print(f"\t{count:>7} {route}" + (f" ({limited} rate limited)" if limited else ""))
+        print("events sent:")
+        for event, count in sorted(self.stats["events"].items()):
+            print(f"\t{count:>7} {event}")
+        latency = self.interaction_latency
+        unanswered = len(self.pending_interactions)
+        print(f"interaction response time: n={latency.count} p50={latency.percentile(50):.1f}ms "
+              f"p99={latency.percentile(99):.1f}ms max={latency.max_ms:.1f}ms, "
+              f"{unanswered} never answered")
+
+
+def seed_database(server: FakeDiscord, path: str) -> None:
+    """Sets up a database that matches the fake guild, so the bot tracks the
+    fake moderators and reposts stickies in the fake sticky channels.
+
+    Args:
+        server (FakeDiscord): The fake server with the guild to seed.
+        path (str): Path of the database file, created if it doesn't exist.
+    """
+    from db_handler import DBHandler
+    db = DBHandler(path)
+    db.create_tables()
+    if db.get_guild(server.guild_id) is None:
+        db.add_guild(server.guild_id, (10, 5, 5), server.mod_category_id,
+                     int(time.time()), 604_800, server.member_count_channel_id)
+    for mod_id in server.moderator_ids:
+        if db.get_moderator(server.guild_id, mod_id) is None:
+            db.register_moderator(server.guild_id, mod_id, (10, 5, 5))
+    for channel_id in server.sticky_channel_ids:
+        if db.get_sticky(server.guild_id, channel_id) is None:
+            db.create_sticky(server.guild_id, channel_id, server.new_id(), "Rules", "Please read the rules.")
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--guild-id", type=int, help="defaults to a generated id")
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--moderators", type=int, default=10)
+    parser.add_argument("--moderator-share", type=float, default=0.2,
+                        help="share of messages written by moderators")
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--sticky-channels", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=1, help="shard count recommended to the bot")
+    parser.add_argument("--seed-db", help="create/update this database to match the fake guild")
+
+    load = parser.add_argument_group("scripted load")
+    load.add_argument("--duration", type=float,
+                      help="seconds of load to send once the bot connects, no load if unset")
+    load.add_argument("--warmup", type=float, default=2.0,
+                      help="seconds to wait after the bot connects before sending load")
+    load.add_argument("--message-rate", type=float, default=20.0, help="messages per second")
+    load.add_argument("--edit-rate", type=float, default=4.0, help="edits per second")
+    load.add_argument("--delete-rate", type=float, default=2.0, help="deletions per second")
+    load.add_argument("--join-rate", type=float, default=0.5, help="member joins per second")
+    load.add_argument("--interaction-rate", type=float, default=1.0, help="slash commands per second")
+
+    limits = parser.add_argument_group("latency and rate limits")
+    limits.add_argument("--latency-ms", type=float, default=0.0, help="added latency per request")
+    limits.add_argument("--jitter-ms", type=float, default=0.0, help="standard deviation of the latency")
+    limits.add_argument("--bucket-limit", type=int, default=5, help="requests per bucket per window, 0 for none")
+    limits.add_argument("--bucket-window", type=float, default=5.0)
+    limits.add_argument("--rename-limit", type=int, default=2, help="channel edits per channel per window")
+    limits.add_argument("--rename-window", type=float, default=600.0)
+    limits.add_argument("--global-limit", type=int, default=50, help="requests per second overall, 0 for none")
+    args = parser.parse_args()
+    args.public_url = f"http://{args.host}:{args.port}"
+
+    server = FakeDiscord(args)
+    if args.seed_db:
+        seed_database(server, args.seed_db)
+
+    print("point the bot at this server with:")
+    print(f"\tDISCORD_API_BASE={args.public_url}/api/v10")
+    print(f"\tDISCORD_GATEWAY_URL={args.public_url.replace('http', 'ws')}/gateway")
+    print(f"\tTEST_GUILD_ID={server.guild_id}")
+    try:
+        web.run_app(server.app(), host=args.host, port=args.port, print=None)
+    finally:
+        server.print_report()
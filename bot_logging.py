@@ -0,0 +1,69 @@
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+
+LOG_FORMAT = "[{asctime}] [{levelname:<8}] {name}: {message}"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _gzip_namer(name: str) -> str:
+    # Rotated files get a .gz suffix, so "discord.log.1" becomes "discord.log.1.gz".
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    # Compress the full log into the rotated file and remove the original,
+    # the handler opens a fresh one right after.
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def setup_logging(
+        path: str = "discord.log",
+        level: int | str = logging.INFO,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 10) -> logging.handlers.QueueListener:
+    """Sets up logging for the whole bot (discord.py, the database and the cogs).
+
+    Log records are put on a queue by the logging calls themselves, which is
+    cheap, and are written to the file and console by a background thread. The
+    log file is rotated by size and the rotated files are gzipped.
+
+    Args:
+        path (str, optional): Path of the log file. Defaults to "discord.log".
+        level (int | str, optional): The minimum level to log, e.g. "DEBUG". Defaults to logging.INFO.
+        max_bytes (int, optional): Size at which the log file is rotated. Defaults to 10 MiB.
+        backup_count (int, optional): Amount of rotated files to keep. Defaults to 10.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener, call stop() on it at shutdown to flush the queue.
+    """
+    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT, style="{")
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(formatter)
+
+    # The console only gets the important stuff, even when debugging.
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener.start()
+    return listener
@@ -0,0 +1,179 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+TYPE_COLOURS = {"sent": "#1dff1a", "edited": "#f1c40f", "deleted": "#e74c3c"}
+BACKGROUND = "#2b2d31"
+FOREGROUND = "#dbdee1"
+
+
+# ----------------------- RENDERING (in the pool) -----------------------
+# Everything in this section runs in the worker processes. It only gets and
+# returns plain data, so the arguments and results can be pickled.
+
+def _init_worker() -> None:
+    # Pay for the matplotlib import once per worker, not on the first chart.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def _style(figure, axes) -> None:
+    figure.patch.set_facecolor(BACKGROUND)
+    axes.set_facecolor(BACKGROUND)
+    axes.tick_params(colors=FOREGROUND)
+    axes.title.set_color(FOREGROUND)
+    axes.xaxis.label.set_color(FOREGROUND)
+    axes.yaxis.label.set_color(FOREGROUND)
+    for spine in axes.spines.values():
+        spine.set_color(FOREGROUND)
+
+
+def _to_png(figure) -> bytes:
+    import matplotlib.pyplot as plt
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", dpi=100, facecolor=figure.get_facecolor())
+    plt.close(figure)
+    return buffer.getvalue()
+
+
+def render_heatmap(title: str, counts: list[list[int]]) -> bytes:
+    """Draws the actions per weekday and hour of the day.
+
+    Args:
+        title (str): Title above the chart.
+        counts (list[list[int]]): 7 rows (Monday first) of 24 counts (00:00 UTC first).
+
+    Returns:
+        bytes: The chart as a PNG.
+    """
+    import matplotlib.pyplot as plt
+    figure, axes = plt.subplots(figsize=(10, 3.6))
+    _style(figure, axes)
+    image = axes.imshow(counts, aspect="auto", cmap="viridis", interpolation="nearest")
+    axes.set_yticks(range(7), WEEKDAYS)
+    axes.set_xticks(range(0, 24, 2), [f"{hour:02d}" for hour in range(0, 24, 2)])
+    axes.set_xlabel("Hour (UTC)")
+    axes.set_title(title)
+    bar = figure.colorbar(image, ax=axes)
+    bar.ax.tick_params(colors=FOREGROUND)
+    figure.tight_layout()
+    return _to_png(figure)
+
+
+def render_trend(title: str, week_labels: list[str], totals: dict[str, list[int]],
+                 quotas: dict[str, int], vacation: list[bool]) -> bytes:
+    """Draws the weekly totals of every action type against its quota.
+
+    Args:
+        title (str): Title above the chart.
+        week_labels (list[str]): Label of every week, oldest first.
+        totals (dict[str, list[int]]): The weekly totals per action type.
+        quotas (dict[str, int]): The weekly quota per action type.
+        vacation (list[bool]): Per week, if the moderator was on vacation.
+
+    Returns:
+        bytes: The chart as a PNG.
+    """
+    import matplotlib.pyplot as plt
+    figure, axes = plt.subplots(figsize=(10, 4))
+    _style(figure, axes)
+    weeks = range(len(week_labels))
+    for week in weeks:
+        if vacation[week]:
+            axes.axvspan(week - 0.5, week + 0.5, color=FOREGROUND, alpha=0.1, linewidth=0)
+    for type, values in totals.items():
+        axes.plot(weeks, values, marker="o", color=TYPE_COLOURS[type], label=type)
+        if quotas.get(type):
+            axes.axhline(quotas[type], color=TYPE_COLOURS[type], linestyle="--", alpha=0.6)
+    step = max(1, len(week_labels) // 12)
+    axes.set_xticks(list(weeks)[::step], week_labels[::step])
+    axes.set_ylabel("Actions per week")
+    axes.set_ylim(bottom=0)
+    axes.set_title(title)
+    legend = axes.legend(facecolor=BACKGROUND, edgecolor=FOREGROUND)
+    for text in legend.get_texts():
+        text.set_color(FOREGROUND)
+    figure.tight_layout()
+    return _to_png(figure)
+
+
+# ------------------------- RENDERER (on the bot) -------------------------
+
+class ChartRenderer():
+    def __init__(self, max_workers: int = 1, cache_size: int = 128, grace: int = 600) -> None:
+        """Renders charts in a pool of worker processes, so drawing them never
+        holds up the event loop (or the GIL), and keeps the PNGs of periods
+        that are over, since those can't change any more.
+
+        The pool is only started when the first chart is asked for.
+
+        Args:
+            max_workers (int, optional): The amount of worker processes. Defaults to 1.
+            cache_size (int, optional): The max amount of charts to keep. Defaults to 128.
+            grace (int, optional): Seconds after its end before a period counts as over. Deletions come in through the audit log and can be stamped a bit in the past. Defaults to 600.
+        """
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.grace = grace
+        self._pool: ProcessPoolExecutor = None
+        self._cache: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking a process with running threads (the log listener,
+            # database workers) can deadlock the child, start clean ones.
+            # Those import main.py again (as __mp_main__), so it only
+            # creates the bot under its __name__ == "__main__" check.
+            self._pool = ProcessPoolExecutor(
+                self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker)
+        return self._pool
+
+    async def render(self, key: tuple, end_time: int, func: Callable[..., bytes], *args) -> bytes:
+        """Renders a chart, or returns the cached one.
+
+        Args:
+            key (tuple): What the chart shows, e.g. ("heatmap", moderator id, start, end).
+            end_time (int): End of the charted period (unix timestamp). Charts of periods that are over get cached.
+            func (Callable[..., bytes]): One of the render_* functions of this module.
+            *args: The arguments for func.
+
+        Returns:
+            bytes: The chart as a PNG.
+        """
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            metrics.increment("charts.cache_hit")
+            return cached
+
+        start = time.perf_counter()
+        png = await asyncio.get_running_loop().run_in_executor(self._get_pool(), func, *args)
+        metrics.observe(f"charts.render.{func.__name__}", (time.perf_counter() - start) * 1000)
+
+        if end_time < time.time() - self.grace:
+            self._cache[key] = png
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return png
+
+    def memory_usage(self) -> tuple[int, int]:
+        """Returns the amount of cached charts and the bytes of their PNGs."""
+        pngs = list(self._cache.values())
+        return len(pngs), sum(map(len, pngs))
+
+    def close(self) -> None:
+        """Stops the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,267 @@
+# -*- coding: UTF-8 -*-
+from discord.ext import commands
+from discord import app_commands
+import discord
+from analytics import ActionAnalytics, quota_hits, DAY, WEEK
+from charts import ChartRenderer, render_heatmap, render_trend
+from db_handler import DBHandler, ACTION_TYPES
+from interactions import followup, run_deferred
+from datetime import datetime, timezone
+import asyncio
+import io
+import logging
+import os
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ? global colour for the cog. Change this when we get around to a cohesive theme and whatnot.
+global colour
+colour = 0x3498db
+
+# The first Monday after the epoch, weeks start on Monday 00:00 UTC.
+FIRST_MONDAY = 4 * DAY
+
+# Where the action columns are kept between runs, one directory per guild,
+# see analytics.py.
+ANALYTICS_CACHE_DIR = "./analytics_cache"
+# Processes that draw the charts. Each one holds its own copy of matplotlib.
+CHART_WORKERS = 1
+# The most weeks /simulate_quotas lists one by one, older ones only count
+# towards the totals.
+SIMULATION_WEEKS_SHOWN = 12
+
+
+class ActivityManager(commands.Cog):
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+        self.db: DBHandler = bot.db
+        # Made on first use instead of at startup, numpy and the first load
+        # of a guild's actions aren't needed before someone asks for a chart.
+        self._analytics: dict[int, ActionAnalytics] = {}
+        self.charts = ChartRenderer(max_workers=CHART_WORKERS)
+
+    async def cog_unload(self) -> None:
+        self.charts.close()
+
+    def memory_usage(self) -> dict[str, tuple[int, int]]:
+        """Measures the memory of the cog's caches, see memory_report.py.
+
+        Returns:
+            dict[str, tuple[int, int]]: Name of each cache -> (entries, bytes).
+        """
+        columns = [analytics.columns for analytics in list(self._analytics.values())]
+        return {
+            "analytics columns": (sum(map(len, columns)), sum(column.nbytes for column in columns)),
+            "chart cache": self.charts.memory_usage(),
+        }
+
+    def analytics(self, guild_id: int) -> ActionAnalytics:
+        """Returns the analytics of a guild, loading them on first use.
+
+        Args:
+            guild_id (int): The id of the guild.
+
+        Returns:
+            ActionAnalytics: The analytics, refresh them before use.
+        """
+        analytics = self._analytics.get(guild_id)
+        if analytics is None:
+            analytics = self._analytics.setdefault(guild_id, ActionAnalytics(
+                self.db, guild_id, os.path.join(ANALYTICS_CACHE_DIR, str(guild_id))))
+        return analytics
+
+    @app_commands.command(description="Shows when a moderator is active and how their weeks compare to their quota")
+    @app_commands.default_permissions(manage_guild=True)
+    async def moderator_activity(self, interaction: discord.Interaction, user: discord.Member,
+                                 weeks: app_commands.Range[int, 1, 104] = 12,
+                                 weeks_ago: app_commands.Range[int, 0, 520] = 0) -> None:
+        """Sends a heatmap of a moderator's actions by weekday and hour, and
+        their weekly totals against their quotas.
+
+        Args:
+            interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+            user (discord.Member): The moderator to show.
+            weeks (int, optional): How many weeks to show. Defaults to 12.
+            weeks_ago (int, optional): How many weeks before this one the shown period ends, 0 includes this week. Defaults to 0.
+        """
+        moderator = self.db.get_moderator(interaction.guild_id, user.id)
+        if moderator is None:
+            await interaction.response.send_message(
+                f"User {user.display_name} is not a moderator.", ephemeral=True)
+            return
+
+        start_time, end_time = self.period(weeks, weeks_ago)
+        heatmap, totals, labels, vacation = await run_deferred(
+            interaction, self.activity_data, interaction.guild_id, user.id, start_time, end_time)
+
+        quotas = dict(zip(ACTION_TYPES, moderator.quotas))
+        name = user.display_name
+        heatmap_png, trend_png = await asyncio.gather(
+            self.charts.render(
+                ("heatmap", interaction.guild_id, user.id, start_time, end_time, name), end_time,
+                render_heatmap, f"Actions of {name} by weekday and hour", heatmap),
+            self.charts.render(
+                ("trend", interaction.guild_id, user.id, start_time, end_time, name, tuple(moderator.quotas), tuple(vacation)),
+                end_time, render_trend, f"Weekly actions of {name} against quota",
+                labels, totals, quotas, vacation))
+
+        # Weeks on vacation don't count either way.
+        worked = [week for week in range(weeks) if not vacation[week]]
+        at_quota = sum(
+            all(totals[type][week] >= int(quotas[type]) for type in ACTION_TYPES)
+            for week in worked)
+
+        first = datetime.fromtimestamp(start_time, timezone.utc).strftime("%d/%m/%Y")
+        last = datetime.fromtimestamp(min(end_time, int(time.time())), timezone.utc).strftime("%d/%m/%Y")
+        embed = discord.Embed(
+            title=f"Activity of {name}",
+            description=f"Timeframe is {first} - {last}",
+            colour=colour)
+        for type in ACTION_TYPES:
+            embed.add_field(name=f"{type}: {sum(totals[type])}",
+                            value=f"quota {quotas[type]} per week", inline=True)
+        embed.add_field(name=f"Weeks at quota: {at_quota}/{len(worked)}",
+                        value=f"{weeks - len(worked)} weeks of vacation", inline=False)
+        embed.set_image(url="attachment://trend.png")
+
+        await followup(interaction, embed=embed, files=[
+            discord.File(io.BytesIO(trend_png), filename="trend.png"),
+            discord.File(io.BytesIO(heatmap_png), filename="heatmap.png")])
+
+    @app_commands.command(description="Shows how many moderators would have met the given quotas in the past weeks")
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.describe(weeks="How many finished weeks to look back, defaults to 12")
+    async def simulate_quotas(self, interaction: discord.Interaction,
+                              send_quota: app_commands.Range[int, 0], edit_quota: app_commands.Range[int, 0],
+                              delete_quota: app_commands.Range[int, 0],
+                              weeks: app_commands.Range[int, 1, 520] = 12) -> None:
+        """Slash command that tries out weekly quotas on the past weeks, next
+        to the quotas the moderators have now, before changing them.
+
+        Args:
+            interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+            send_quota (int): The sent messages quota to try.
+            edit_quota (int): The edited messages quota to try.
+            delete_quota (int): The deleted messages quota to try.
+            weeks (int, optional): How many finished weeks to look back. Defaults to 12.
+        """
+        quotas = (send_quota, edit_quota, delete_quota)
+        # Only finished weeks, the current one would make any quota look bad.
+        start_time, end_time = self.period(weeks, 1)
+        labels, proposed, current, counted = await run_deferred(
+            interaction, self.simulation_data, interaction.guild_id, quotas, start_time, weeks)
+
+        if not sum(counted):
+            await followup(interaction, embed=discord.Embed(
+                title="Quota simulation",
+                description="There are no moderators (that weren't on vacation) in this timeframe",
+                colour=colour))
+            return
+
+        first = datetime.fromtimestamp(start_time, timezone.utc).strftime("%d/%m/%Y")
+        last = datetime.fromtimestamp(end_time, timezone.utc).strftime("%d/%m/%Y")
+        embed = discord.Embed(
+            title="Quota simulation",
+            description=f"Timeframe is {first} - {last}\nTried quotas: ``{send_quota} sent messages, {edit_quota} edited messages & {delete_quota} deleted messages``",
+            colour=colour)
+        total = sum(counted)
+        embed.add_field(name="With the tried quotas",
+                        value=f"{sum(proposed)}/{total} moderator weeks met ({sum(proposed) / total:.0%})")
+        embed.add_field(name="With the current quotas",
+                        value=f"{sum(current)}/{total} moderator weeks met ({sum(current) / total:.0%})")
+
+        shown = range(max(0, weeks - SIMULATION_WEEKS_SHOWN), weeks)
+        lines = [f"{labels[week]}  tried {proposed[week]:>3}/{counted[week]:<3}  current {current[week]:>3}/{counted[week]}"
+                 for week in reversed(shown)]
+        name = "Per week (newest first)" if weeks <= SIMULATION_WEEKS_SHOWN else \
+            f"Last {SIMULATION_WEEKS_SHOWN} weeks (newest first)"
+        embed.add_field(name=name, value="```\n" + "\n".join(lines) + "```", inline=False)
+        embed.set_footer(text="Weeks a moderator was on vacation don't count")
+        await followup(interaction, embed=embed)
+
+    def simulation_data(self, guild_id: int, quotas: tuple[int, int, int], start_time: int, weeks: int
+                        ) -> tuple[list[str], list[int], list[int], list[int]]:
+        """Checks the tried quotas and everyone's current quotas against every
+        moderator of a guild and week at once. Runs on a worker thread.
+
+        Args:
+            guild_id (int): The id of the guild.
+            quotas (tuple[int, int, int]): The weekly quotas to try (sent, edited, deleted).
+            start_time (int): Beginning of the first week (unix timestamp), a Monday.
+            weeks (int): The amount of weeks.
+
+        Returns:
+            tuple[list[str], list[int], list[int], list[int]]: A label per week, and per week the moderators that would meet the tried quotas, that met their current quotas and that weren't on vacation.
+        """
+        analytics = self.analytics(guild_id)
+        analytics.refresh()
+        moderators = self.db.get_all_moderators(guild_id)
+        counts = analytics.weekly_counts(start_time, weeks, [mod.id for mod in moderators])
+
+        dates = [datetime.fromtimestamp(start_time + week * WEEK, timezone.utc) for week in range(weeks)]
+        keys = [date.strftime("%Y-%W") for date in dates]
+        excused = np.zeros((len(moderators), weeks), dtype=bool)
+        for row, mod in enumerate(moderators):
+            vacation_weeks = {week.date for week in self.db.get_all_vacation_weeks(guild_id, mod.id)}
+            if vacation_weeks:
+                excused[row] = [key in vacation_weeks for key in keys]
+
+        current_quotas = np.array([[int(quota) for quota in mod.quotas] for mod in moderators],
+                                  dtype=np.int64).reshape(-1, len(ACTION_TYPES))
+        proposed = quota_hits(counts, excused, np.array(quotas))
+        current = quota_hits(counts, excused, current_quotas)
+        counted = (~excused).sum(axis=0)
+        labels = [date.strftime("%d/%m/%Y") for date in dates]
+        return labels, proposed.tolist(), current.tolist(), counted.tolist()
+
+    @staticmethod
+    def period(weeks: int, weeks_ago: int) -> tuple[int, int]:
+        """Returns the timeframe of whole weeks to show.
+
+        Args:
+            weeks (int): How many weeks the timeframe spans.
+            weeks_ago (int): How many weeks before this one the timeframe ends.
+
+        Returns:
+            tuple[int, int]: The first and the last second of the timeframe (unix timestamps).
+        """
+        now = int(time.time())
+        this_week = now - (now - FIRST_MONDAY) % WEEK
+        start_time = this_week - (weeks_ago + weeks - 1) * WEEK
+        return start_time, start_time + weeks * WEEK - 1
+
+    def activity_data(self, guild_id: int, moderator_id: int, start_time: int, end_time: int
+                      ) -> tuple[list[list[int]], dict[str, list[int]], list[str], list[bool]]:
+        """Gathers what the charts show. Runs on a worker thread.
+
+        Args:
+            guild_id (int): The id of the guild.
+            moderator_id (int): Discord id of the moderator.
+            start_time (int): Beginning of the timeframe (unix timestamp), a Monday.
+            end_time (int): End of the timeframe (unix timestamp).
+
+        Returns:
+            tuple[list[list[int]], dict[str, list[int]], list[str], list[bool]]: The weekday/hour counts, the weekly totals per type, a label per week and per week if the moderator was on vacation.
+        """
+        analytics = self.analytics(guild_id)
+        analytics.refresh()
+        heatmap = analytics.weekday_hour(start_time, end_time, moderator_id).tolist()
+        totals = {}
+        for type in ACTION_TYPES:
+            week_starts, counts = analytics.histogram(
+                start_time, end_time, WEEK, moderator_id, type)
+            totals[type] = counts.tolist()
+
+        dates = [datetime.fromtimestamp(int(week), timezone.utc) for week in week_starts]
+        vacation_weeks = {week.date for week in self.db.get_all_vacation_weeks(guild_id, moderator_id)}
+        labels = [date.strftime("%d/%m") for date in dates]
+        vacation = [date.strftime("%Y-%W") in vacation_weeks for date in dates]
+        return heatmap, totals, labels, vacation
+
+
+async def setup(bot: commands.Bot) -> None:
+    logger.info("cogs.Activity_manager begin loading")
+    with bot.startup.phase(f"{__name__} setup"):
+        await bot.add_cog(ActivityManager(bot))
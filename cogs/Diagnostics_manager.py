@@ -0,0 +1,128 @@
+# -*- coding: UTF-8 -*-
+from discord.ext import commands
+from discord import app_commands
+import discord
+import logging
+from member_cache import discord_cache_usage
+from memory_report import format_report, resident_memory
+from metrics import metrics
+from sharding import record_shard_metrics
+
+logger = logging.getLogger(__name__)
+
+# ? global colour for the cog. Change this when we get around to a cohesive theme and whatnot.
+global colour
+colour = 0x7f8c8d
+
+
+class DiagnosticsManager(commands.Cog):
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+
+    @app_commands.command(description="Shows the bot's internal metrics")
+    @app_commands.default_permissions(manage_guild=True)
+    async def metrics(self, interaction: discord.Interaction, prefix: str = "") -> None:
+        """Sends all metrics the bot has gathered since it started. The
+        "shard." metrics cover the shards running in this process.
+
+        Args:
+            interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+            prefix (str, optional): Only show metrics whose name starts with this, e.g. "loop.". Defaults to "".
+        """
+        # The per shard gauges are only worth updating when someone looks.
+        record_shard_metrics(self.bot)
+        text = metrics.format(prefix) or "No metrics recorded yet."
+        # Embed descriptions are capped at 4096 characters.
+        if len(text) > 4000:
+            text = text[:4000] + "\n..."
+        embed = discord.Embed(
+            title="Bot metrics",
+            description=f"```\n{text}\n```",
+            colour=colour)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(description="Shows how much memory the bot's caches take up")
+    @app_commands.default_permissions(manage_guild=True)
+    async def memory(self, interaction: discord.Interaction) -> None:
+        """Sends the memory of every cache (discord.py's, the database's and
+        the cogs') next to the resident memory of the whole process.
+
+        Args:
+            interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+        """
+        usage = discord_cache_usage(self.bot) | self.bot.db.memory_usage() | \
+            self.bot.member_resolver.memory_usage()
+        # Every cog with caches of its own reports them the same way.
+        for cog in self.bot.cogs.values():
+            if hasattr(cog, "memory_usage"):
+                usage |= cog.memory_usage()
+        mode = "on" if self.bot.member_cache.enabled else "off"
+        embed = discord.Embed(
+            title="Memory per cache",
+            description=f"```\n{format_report(usage, resident_memory())}\n```",
+            colour=colour)
+        embed.set_footer(text=f"Entries and estimated bytes, low-memory mode is {mode}")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(description="Shows the scheduled jobs and when they ran")
+    @app_commands.default_permissions(manage_guild=True)
+    async def jobs(self, interaction: discord.Interaction) -> None:
+        """Sends every scheduled job with its last run, duration and next run.
+
+        Args:
+            interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+        """
+        lines = []
+        for job in self.bot.db.get_all_jobs():
+            guild = self.bot.get_guild(job.guild_id)
+            where = guild.name if guild else ("global" if job.guild_id == 0 else str(job.guild_id))
+            if self.bot.jobs.is_running(job.name, job.guild_id):
+                status = "running now"
+            elif job.last_run is None:
+                status = "never ran"
+            else:
+                status = f"ran <t:{job.last_run}:R> in {job.last_duration_ms:.0f} ms"
+                if job.last_error:
+                    status += f", **failed**: {job.last_error[:100]}"
+            if job.name not in self.bot.jobs.specs:
+                status += " (not loaded)"
+            elif not self.bot.jobs.owns(job.guild_id):
+                status += " (runs in another process)"
+            lines.append(f"**{job.name}** ({where})\n{status}, next <t:{job.next_run}:R>")
+
+        text = "\n".join(lines) or "No jobs scheduled yet."
+        # Embed descriptions are capped at 4096 characters.
+        if len(text) > 4000:
+            text = text[:4000] + "\n..."
+        embed = discord.Embed(title="Scheduled jobs", description=text, colour=colour)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(description="Shows the most expensive database queries of the last few minutes")
+    @app_commands.default_permissions(manage_guild=True)
+    async def slow_queries(self, interaction: discord.Interaction) -> None:
+        """Sends the query shapes that took the most time in total recently,
+        with how often they ran, were slow or failed. Needs SLOW_QUERY_MS.
+
+        Args:
+            interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+        """
+        query_log = self.bot.db.query_log
+        if query_log is None:
+            await interaction.response.send_message(
+                "Queries aren't timed, set ``SLOW_QUERY_MS`` to turn it on.", ephemeral=True)
+            return
+        text = query_log.format_summary()
+        # Embed descriptions are capped at 4096 characters.
+        if len(text) > 4000:
+            text = text[:4000] + "\n..."
+        embed = discord.Embed(
+            title=f"Slowest queries of the last {query_log.window // 60} minutes",
+            description=f"```\n{text}\n```",
+            colour=colour)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+async def setup(bot: commands.Bot) -> None:
+    logger.info("cogs.Diagnostics_manager begin loading")
+    with bot.startup.phase(f"{__name__} setup"):
+        await bot.add_cog(DiagnosticsManager(bot))
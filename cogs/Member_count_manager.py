@@ -1,39 +1,71 @@
 # -*- conding: UTF-8 -*-
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 import discord
+import logging
 from db_handler import DBHandler
+from outbound import Priority
+
+logger = logging.getLogger(__name__)
+
+# Seconds between member count updates. Discord only allows 2 channel
+# renames per 10 minutes, so there is no point in going faster.
+MEMBER_COUNT_INTERVAL = 600
 
 
 class MemberCountManager(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         self.db: DBHandler = bot.db
-        self.check_member_count.start()
-
-    @tasks.loop(minutes=10)
-    async def check_member_count(self):
-        guilds = self.db.get_all_guilds()
-        for guild in guilds:
-            discord_guild = self.bot.get_guild(guild.id)
-            if discord_guild is None:
-                # Guild has not been initalized, we don't have to worry about
-                # member count.
-                return
+        # Runs for every guild with a member count channel, see job_scheduler.py.
+        self.bot.jobs.register(
+            "member_count", self.update_member_count,
+            lambda guild: MEMBER_COUNT_INTERVAL if guild.member_count_channel_id else None)
 
-            channel = discord_guild.get_channel(guild.member_count_channel_id)
-            if channel is None:
-                # The member count channel is either gone or hasn't been set
-                # up.
-                return
+    async def cog_unload(self) -> None:
+        self.bot.jobs.unregister("member_count")
 
-            # Finally get the member count and edit the title.
-            member_count = discord_guild.member_count
-            await channel.edit(name=f"members - {member_count}")
+    async def update_member_count(self, guild_id: int) -> None:
+        """Scheduled job that queues a rename of the guild's member count channel.
+
+        Args:
+            guild_id (int): The id of the guild to update.
+        """
+        guild = self.db.get_guild(guild_id)
+        discord_guild = self.bot.get_guild(guild_id)
+        if guild is None or discord_guild is None:
+            # Guild has not been initalized, we don't have to worry about
+            # member count.
+            return
 
-    @check_member_count.before_loop
-    async def before_check_member_count(self):
-        await self.bot.wait_until_ready()
+        channel = discord_guild.get_channel(guild.member_count_channel_id)
+        if channel is None:
+            # The member count channel is either gone or hasn't been set
+            # up.
+            return
+
+        # Renames are heavily rate limited, so they wait behind everything
+        # else. A rename that is still waiting is replaced by this one.
+        self.bot.outbound.submit(
+            lambda: self.rename_member_count_channel(channel),
+            Priority.RENAME,
+            bucket=f"rename:{channel.id}",
+            merge_key=f"rename:{channel.id}")
+
+    async def rename_member_count_channel(self, channel: discord.abc.GuildChannel) -> None:
+        """Edits the title of the member count channel to the current count.
+
+        Args:
+            channel (discord.abc.GuildChannel): The member count channel.
+        """
+        # Finally get the member count and edit the title. Read the count
+        # only now, so a rename that waited still shows the newest number.
+        member_count = channel.guild.member_count
+        if channel.name == f"members - {member_count}":
+            return
+        await channel.edit(name=f"members - {member_count}")
+        logger.debug("updated member count of guild %s to %s",
+                     channel.guild.id, member_count)
 
     @app_commands.command()
     async def delete_member_count_channel(self, interaction: discord.Interaction):
@@ -85,5 +117,6 @@ class MemberCountManager(commands.Cog):
 
 
 async def setup(bot: commands.Bot) -> None:
-    print(f"\tcogs.Member_count_manager begin loading")
-    await bot.add_cog(MemberCountManager(bot))
+    logger.info("cogs.Member_count_manager begin loading")
+    with bot.startup.phase(f"{__name__} setup"):
+        await bot.add_cog(MemberCountManager(bot))
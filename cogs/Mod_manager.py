@@ -2,14 +2,34 @@
 from discord.ext import commands
 from discord import app_commands
 import discord
+from anomaly import Anomaly, AnomalyDetector
 from db_handler import DBHandler
+from interactions import defer, followup, run_deferred
+from member_resolver import MemberResolver
+from memory_report import deep_sizeof
+from metrics import metrics
+from outbound import Priority
 from datetime import datetime, timezone, timedelta
+import asyncio
+import logging
 import time
 
+logger = logging.getLogger(__name__)
+
 # ? global colour for the cog. Change this when we get around to a cohesive theme and whatnot.
 global colour
 colour = 0x1dff1a
 
+# How long (in seconds) a computed leaderboard is reused before the counts
+# are queried again.
+LEADERBOARD_TTL = 60
+LEADERBOARD_PAGE_SIZE = 10
+
+# Seconds between checks for moderators whose activity dropped, and how many
+# days of past actions the anomaly detector learns from at startup.
+ANOMALY_SWEEP_INTERVAL = 3600
+ANOMALY_SEED_DAYS = 60
+
 
 class ConfigView(discord.ui.View):
     """View for the config message."""
@@ -78,6 +98,10 @@ class ConfigView(discord.ui.View):
             await interaction.response.send_message("You have to select a default wait time!", ephemeral=True)
             return
 
+        # Creating the channel and registering every moderator can take a
+        # while, so acknowledge the click first.
+        await defer(interaction, "configure.confirm", thinking=False)
+
         # Get amount of seconds to wait by taking about of days * amount of
         # seconds in a day.
         wait_time = int(self.wait_time) * 86_400
@@ -86,21 +110,14 @@ class ConfigView(discord.ui.View):
         count = interaction.guild.member_count
         member_count_channel = await interaction.guild.create_voice_channel(f"members-{count}", reason="Setting up bot, creating channel for tracking member count", position=0, overwrites={interaction.guild.default_role: discord.PermissionOverwrite(view_channel=True, connect=False)})
 
-        guild = self.db.get_guild(interaction.guild_id)
-        if not guild:
-            # Set some initial config stuff from the values we just recieved.
-            self.db.add_guild(interaction.guild_id, (0, 0, 0),
-                              self.mod_category_id, time.time(),
-                              wait_time, member_count_channel.id)
-            guild = self.db.get_guild(interaction.guild_id)
-
-        # Register all users who have the selected roles as moderators in the
-        # database.
-        for role in self.roles:
-            for member in role.members:
-                if member.id not in [
-                        mod.id for mod in self.db.get_all_moderators()]:
-                    self.db.register_moderator(member.id, guild.default_quotas)
+        # Collect the ids here, the discord objects belong to the event loop.
+        member_cache = interaction.client.member_cache
+        member_ids = {member.id for member in await member_cache.members_with_roles(
+            interaction.guild, self.roles)}
+        await asyncio.to_thread(
+            self.save_config, interaction.guild_id, wait_time,
+            member_count_channel.id, member_ids)
+        await member_cache.load(interaction.guild)
 
         # Disable all the now used dropdowns (as well as the button).
         self.confirm.disabled = True
@@ -138,14 +155,149 @@ class ConfigView(discord.ui.View):
             inline=False)
 
         # Update the embed in the sent message.
-        await interaction.response.edit_message(view=None, embed=embed)
+        await interaction.edit_original_response(view=None, embed=embed)
         self.stop()
 
+    def save_config(self, guild_id: int, wait_time: int,
+                    member_count_channel_id: int, member_ids: set[int]) -> None:
+        """Stores the config and registers the moderators. Runs on a worker thread.
+
+        Args:
+            guild_id (int): The id of the guild being configured.
+            wait_time (int): Amount of seconds between moderator checks.
+            member_count_channel_id (int): The id of the member count channel.
+            member_ids (set[int]): Ids of every member with one of the selected roles.
+        """
+        guild = self.db.get_guild(guild_id)
+        if not guild:
+            # Set some initial config stuff from the values we just recieved.
+            self.db.add_guild(guild_id, (0, 0, 0),
+                              self.mod_category_id, time.time(),
+                              wait_time, member_count_channel_id)
+            guild = self.db.get_guild(guild_id)
+
+        # Register all users who have the selected roles as moderators in the
+        # database.
+        registered = {mod.id for mod in self.db.get_all_moderators(guild_id)}
+        for member_id in member_ids - registered:
+            self.db.register_moderator(guild_id, member_id, guild.default_quotas)
+
+
+class LeaderboardView(discord.ui.View):
+    """Paginated, sortable view for the moderator leaderboard."""
+
+    sort_labels = {
+        "sent": "Sent messages",
+        "edited": "Edited messages",
+        "deleted": "Deleted messages",
+        "completion": "Quota completion"}
+
+    def __init__(self, author_id: int, rows: list[dict], days: int, resolver: MemberResolver) -> None:
+        super().__init__(timeout=180)
+        self.author_id = author_id
+        self.rows = rows
+        self.days = days
+        self.resolver = resolver
+        self.sort_by = "sent"
+        self.page = 0
+        self.message: discord.Message = None
+        self._sort()
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self.rows) // LEADERBOARD_PAGE_SIZE))
+
+    def _sort(self) -> None:
+        # Moderators without any quota have no completion, they go last.
+        self.rows.sort(key=lambda row: row[self.sort_by] if row[self.sort_by] is not None else -1,
+                       reverse=True)
+
+    async def build_embed(self, guild: discord.Guild) -> discord.Embed:
+        """Builds the embed for the current page. Only the moderators on this
+        page are looked up (together, see member_resolver.py), the counts all
+        come from the cached rows.
+
+        Args:
+            guild (discord.Guild): The guild the leaderboard is for, used to look up names.
+
+        Returns:
+            discord.Embed: The embed for the current page.
+        """
+        start = self.page * LEADERBOARD_PAGE_SIZE
+        page = self.rows[start:start + LEADERBOARD_PAGE_SIZE]
+        names = await self.resolver.display_names(guild, [row["id"] for row in page])
+        lines = []
+        for rank, row in enumerate(page, start + 1):
+            name = names[row["id"]]
+            completion = "no quota" if row["completion"] is None else f"{row['completion']:.0%}"
+            lines.append(
+                f"**{rank}.** {name}\nsent: {row['sent']}, edited: {row['edited']}, deleted: {row['deleted']}, quota: {completion}")
+
+        embed = discord.Embed(
+            title="Moderator leaderboard",
+            description="\n".join(lines),
+            colour=discord.Colour.from_str("#ffffff"))
+        embed.set_footer(
+            text=f"Last {self.days} days, sorted by {self.sort_labels[self.sort_by].lower()} | page {self.page + 1}/{self.page_count}")
+        return embed
+
+    def _update_buttons(self) -> None:
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.page_count - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Only the person who asked for the leaderboard can flip through it.
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Run ``/list_moderators`` to get your own leaderboard.", ephemeral=True)
+            return False
+        return True
+
+    async def show(self, interaction: discord.Interaction) -> None:
+        self._update_buttons()
+        # Looking up the names can take up to the resolver's timeout, answer first.
+        await defer(interaction, "leaderboard.page", thinking=False)
+        await interaction.edit_original_response(embed=await self.build_embed(interaction.guild), view=self)
+
+    @discord.ui.select(
+        cls=discord.ui.Select,
+        options=[discord.SelectOption(label=label, value=value)
+                 for value, label in sort_labels.items()],
+        placeholder="Sort by")
+    async def sort_select(self, interaction: discord.Interaction, select: discord.ui.Select) -> None:
+        self.sort_by = select.values[0]
+        self.page = 0
+        self._sort()
+        await self.show(interaction)
+
+    @discord.ui.button(style=discord.ButtonStyle.secondary, label="Previous")
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.page = max(0, self.page - 1)
+        await self.show(interaction)
+
+    @discord.ui.button(style=discord.ButtonStyle.secondary, label="Next")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.page = min(self.page_count - 1, self.page + 1)
+        await self.show(interaction)
+
+    async def on_timeout(self) -> None:
+        # Leave the last page up, just without the controls.
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
 
 class ModManager(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         self.db: DBHandler = bot.db
+        # (guild id, days) -> (time computed, leaderboard rows)
+        self._leaderboard_cache: dict[tuple[int, int], tuple[float, list[dict]]] = {}
+        # Fed by the listeners below, see anomaly.py. Learns from the past
+        # actions of a guild on its first sweep.
+        self.anomalies = AnomalyDetector()
+        self._anomalies_seeded: set[int] = set()
 
         # Register context menu commands (right click commands)
         # and set their callbacks.
@@ -168,6 +320,127 @@ class ModManager(commands.Cog):
         self.bot.tree.add_command(self.ctx_set_quotas)
         self.bot.tree.add_command(self.ctx_get_quotas)
 
+        # Check the quotas of every guild on its own time_between_checks,
+        # see job_scheduler.py.
+        self.bot.jobs.register(
+            "quota_check", self.run_quota_check,
+            lambda guild: guild.time_between_checks)
+        self.bot.jobs.register(
+            "anomaly_sweep", self.run_anomaly_sweep,
+            lambda _: ANOMALY_SWEEP_INTERVAL)
+
+    async def cog_unload(self) -> None:
+        self.bot.jobs.unregister("quota_check")
+        self.bot.jobs.unregister("anomaly_sweep")
+
+    def memory_usage(self) -> dict[str, tuple[int, int]]:
+        """Measures the memory of the cog's caches, see memory_report.py.
+
+        Returns:
+            dict[str, tuple[int, int]]: Name of each cache -> (entries, bytes).
+        """
+        leaderboards = dict(self._leaderboard_cache)
+        return {
+            "anomaly detector": (len(self.anomalies), deep_sizeof(self.anomalies)),
+            "leaderboards": (len(leaderboards), deep_sizeof(leaderboards)),
+        }
+
+    async def run_quota_check(self, guild_id: int) -> None:
+        """Scheduled job that checks the quotas of all moderators.
+
+        Args:
+            guild_id (int): The id of the guild to check.
+        """
+        await asyncio.to_thread(self.check_quotas, guild_id)
+
+    def check_quotas(self, guild_id: int) -> None:
+        """Checks if every moderator reached their quotas since the last check,
+        and updates their streak of completed weeks. The quotas are lowered
+        for the weeks a moderator was on vacation, moderators on vacation the
+        whole period are skipped. Runs on a worker thread.
+
+        Args:
+            guild_id (int): The id of the guild to check.
+        """
+        guild = self.db.get_guild(guild_id)
+        if not guild or not guild.time_between_checks:
+            return
+        now = int(time.time())
+        start = int(guild.last_mod_check or now - guild.time_between_checks)
+        if now - start < guild.time_between_checks:
+            # Already checked this period, e.g. by an earlier run before a restart.
+            return
+
+        # Quotas are weekly, scale them to the length of the checked period.
+        weeks = (now - start) / 604_800
+        # Every calendar week the period touches, vacation weeks are stored by them.
+        period_weeks = {datetime.fromtimestamp(day, timezone.utc).strftime("%Y-%W")
+                        for day in [*range(start, now, 86_400), now]}
+        first_week, last_week = min(period_weeks), max(period_weeks)
+        counts = self.db.get_amount_of_actions_per_moderator(guild_id, start, now)
+        for mod in self.db.get_all_moderators(guild_id):
+            vacation = self.db.amount_of_vacation_weeks_during_period(
+                guild_id, mod.id, first_week, last_week)
+            if vacation >= len(period_weeks):
+                continue
+            # Only the part of the period they weren't on vacation counts.
+            worked = weeks * (len(period_weeks) - vacation) / len(period_weeks)
+            done = counts.get(mod.id, (0, 0, 0))
+            if all(count >= int(quota) * worked for count, quota in zip(done, mod.quotas)):
+                self.db.increment_consecutive_completed_weeks(guild_id, mod.id, max(1, round(worked)))
+            else:
+                self.db.set_consecutive_completed_weeks(guild_id, mod.id, 0)
+        self.db.set_last_mod_check(guild_id, now)
+        logger.info("checked quotas of guild %s for the last %.1f weeks", guild_id, weeks)
+
+    async def run_anomaly_sweep(self, guild_id: int) -> None:
+        """Scheduled job that looks for moderators whose activity dropped.
+        The first run for a guild teaches the detector its past few weeks first.
+
+        Args:
+            guild_id (int): The id of the guild to check.
+        """
+        now = int(time.time())
+        if guild_id not in self._anomalies_seeded:
+            start = time.perf_counter()
+            rows = await asyncio.to_thread(
+                self.db.get_action_columns, guild_id, now - ANOMALY_SEED_DAYS * 86_400, now)
+            await asyncio.to_thread(self.anomalies.seed, guild_id, rows, now)
+            self._anomalies_seeded.add(guild_id)
+            logger.info("seeded the anomaly detector with %d actions of guild %s in %.0f ms",
+                        len(rows), guild_id, (time.perf_counter() - start) * 1000)
+        self.report_anomalies(self.anomalies.sweep(now, guild_id))
+
+    def report_anomalies(self, anomalies: list[Anomaly]) -> None:
+        """Queues an alert in the alert channel for every anomaly. Drops of
+        moderators on vacation are expected and left out.
+
+        Args:
+            anomalies (list[Anomaly]): What the detector found.
+        """
+        for anomaly in anomalies:
+            metrics.increment(f"anomaly.{anomaly.kind}")
+            date = datetime.fromtimestamp(anomaly.bucket_start, timezone.utc)
+            if anomaly.kind == "drop" and self.db.is_vacation_week(
+                    anomaly.guild_id, anomaly.moderator_id, date.strftime("%Y-%W")):
+                continue
+            logger.info("%s of %s messages by moderator %s: %d against usually %.1f",
+                        anomaly.kind, anomaly.type, anomaly.moderator_id,
+                        anomaly.count, anomaly.mean)
+
+            embed = discord.Embed(
+                title=f"Unusual activity: {anomaly.kind} in {anomaly.type} messages",
+                description=f"<@{anomaly.moderator_id}>: {anomaly.count} {anomaly.type} messages on {date.strftime('%d/%m/%Y')}, usually about {anomaly.mean:.0f} ± {anomaly.std:.0f} a day.",
+                colour=colour)
+            guild = self.db.get_guild(anomaly.guild_id)
+            channel = self.bot.get_channel(guild.alert_channel_id) if guild and guild.alert_channel_id else None
+            if channel is None:
+                continue
+            self.bot.outbound.submit(
+                lambda channel=channel, embed=embed: channel.send(embed=embed),
+                Priority.ALERT,
+                bucket=f"channel:{channel.id}")
+
     @commands.Cog.listener()
     async def on_message(self, msg: discord.Message) -> None:
         # Check to make sure author isn't the bot itself.
@@ -178,23 +451,35 @@ class ModManager(commands.Cog):
         if not guild:
             return
         if not msg.channel.category_id == guild.mod_category_id and self.is_moderator(
-                msg.author):
-            self.db.create_action("sent", msg.author.id, int(
-                msg.created_at.timestamp()), msg.channel.id, msg.id)
+                msg.guild.id, msg.author):
+            timestamp = int(msg.created_at.timestamp())
+            self.db.create_action(msg.guild.id, "sent", msg.author.id, timestamp, msg.channel.id, msg.id)
+            self.report_anomalies(self.anomalies.observe(
+                msg.author.id, msg.guild.id, "sent", timestamp))
+            logger.debug("recorded sent message %s by moderator %s in channel %s",
+                         msg.id, msg.author.id, msg.channel.id)
 
     @commands.Cog.listener()
-    async def on_message_edit(self, before: discord.Message, after: discord.Message) -> None:
-        # Check to make sure author isn't the bot itself.
-        if before.author == self.bot.user:
-            pass
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        # on_message_edit only fires for messages still in the message cache,
+        # the raw event comes for every edit.
+        after = payload.message
+        # Check to make sure author isn't the bot itself, and that it's an
+        # actual edit and not discord filling in an embed.
+        if after.author == self.bot.user or after.guild is None or after.edited_at is None:
+            return
         # Make sure message is by moderator and not in moderator chats.
         guild = self.db.get_guild(after.guild.id)
         if not guild:
             return
         if not after.channel.category_id == guild.mod_category_id and self.is_moderator(
-                after.author):
-            self.db.create_action("edited", after.author.id, int(
-                after.edited_at.timestamp()), after.channel.id, after.id)
+                after.guild.id, after.author):
+            timestamp = int(after.edited_at.timestamp())
+            self.db.create_action(after.guild.id, "edited", after.author.id, timestamp, after.channel.id, after.id)
+            self.report_anomalies(self.anomalies.observe(
+                after.author.id, after.guild.id, "edited", timestamp))
+            logger.debug("recorded edit of message %s by moderator %s in channel %s",
+                         after.id, after.author.id, after.channel.id)
 
     @commands.Cog.listener()
     async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
@@ -216,11 +501,15 @@ class ModManager(commands.Cog):
             guild = self.db.get_guild(entry.guild.id)
             if not guild:
                 return
-            if not category_id == guild.mod_category_id and self.is_moderator(
-                    entry.user):
-                self.db.create_action(
-                    "deleted", entry.user.id, int(
-                        entry.created_at.timestamp()), channel_id)
+            # entry.user is None for members that aren't cached, go by the id.
+            if not category_id == guild.mod_category_id and entry.user_id and self.is_moderator(
+                    entry.guild.id, discord.Object(entry.user_id)):
+                timestamp = int(entry.created_at.timestamp())
+                self.db.create_action(entry.guild.id, "deleted", entry.user_id, timestamp, channel_id)
+                self.report_anomalies(self.anomalies.observe(
+                    entry.user_id, entry.guild.id, "deleted", timestamp))
+                logger.debug("recorded deletion by moderator %s in channel %s",
+                             entry.user_id, channel_id)
 
     async def register_moderator(self, interaction: discord.Interaction, user: discord.Member) -> None:
         """Command to register a user as a moderator with the bot.
@@ -230,9 +519,10 @@ class ModManager(commands.Cog):
             user (discord.Member): The user who the command should run on, is also passed automatically.
         """
         # TODO; Make this an embed
-        if not self.is_moderator(user):
+        if not self.is_moderator(interaction.guild_id, user):
             guild = self.db.get_guild(interaction.guild_id)
-            self.db.register_moderator(user.id, guild.default_quotas)
+            self.db.register_moderator(interaction.guild_id, user.id, guild.default_quotas)
+            self.bot.member_cache.keep(user)
             await interaction.response.send_message(f"Adding user {user.display_name} to the moderator list", ephemeral=True)
         else:
             await interaction.response.send_message(f"User {user.display_name} is already in the moderator list", ephemeral=True)
@@ -245,8 +535,10 @@ class ModManager(commands.Cog):
             user (discord.Member): The user who the command should run on, is also passed automatically.
         """
         # TODO; Make this an embed
-        if self.is_moderator(user):
-            self.db.de_register_moderator(user.id)
+        if self.is_moderator(interaction.guild_id, user):
+            self.db.de_register_moderator(interaction.guild_id, user.id)
+            self.anomalies.forget(interaction.guild_id, user.id)
+            self.bot.member_cache.drop(interaction.guild, user.id)
             await interaction.response.send_message(f"Removing user {user.display_name} from the moderator list", ephemeral=True)
         else:
             await interaction.response.send_message(f"User {user.display_name} is not in the moderator list", ephemeral=True)
@@ -259,10 +551,12 @@ class ModManager(commands.Cog):
             user (discord.Member): The user who the command should run on, is also passed automatically.
         """
         # TODO; Make this an embed
-        if self.is_moderator(user):
-            sent, edited, deleted = self.db.get_amount_of_actions_by_type(
-                0, int(time.time()), user.id)
-            await interaction.response.send_message(f"moderator {user.display_name} has sent {sent} messages, edited {edited} messages and deleted {deleted} messages.", ephemeral=True)
+        if self.is_moderator(interaction.guild_id, user):
+            sent, edited, deleted = await run_deferred(
+                interaction, self.db.get_amount_of_actions_by_type,
+                interaction.guild_id, 0, int(time.time()), user.id,
+                name="Get moderator stats", ephemeral=True)
+            await followup(interaction, f"moderator {user.display_name} has sent {sent} messages, edited {edited} messages and deleted {deleted} messages.", ephemeral=True)
         else:
             await interaction.response.send_message(f"{user.display_name} is not a moderator", ephemeral=True)
 
@@ -274,14 +568,14 @@ class ModManager(commands.Cog):
             user (discord.Member): The user who the command should run on, is also passed automatically.
         """
         # TODO; Make embed
-        if not self.is_moderator(user):
+        if not self.is_moderator(interaction.guild_id, user):
             await interaction.response.send_message(f"User {user.display_name} is not a moderator.")
             return
         await interaction.response.send_modal(SetUserQuotaModal(user, self))
 
     async def get_quotas(self, interaction: discord.Interaction, user: discord.Member) -> None:
         # TODO; Make this an embed
-        mod = self.db.get_moderator(user.id)
+        mod = self.db.get_moderator(interaction.guild_id, user.id)
         if not mod:
             await interaction.response.send_message(f"User {user.display_name} is not a moderator.")
             return
@@ -313,38 +607,86 @@ class ModManager(commands.Cog):
 
         await interaction.response.send_message(embed=embed)
 
-    @app_commands.command(description="Sends the current moderator list as an embed")
-    async def list_moderators(self, interaction: discord.Interaction) -> None:
-        """Slash command to send a list of all moderators and their stats as an embed.
+    @app_commands.command(description="Set the channel to post unusual moderator activity in")
+    @app_commands.describe(channel="Leave empty to turn the alerts off")
+    async def config_set_alert_channel(self, interaction: discord.Interaction, channel: discord.TextChannel = None) -> None:
+        """Slash command to set where alerts about sudden spikes and drops in
+        a moderator's activity are posted.
 
         Args:
             interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+            channel (discord.TextChannel, optional): The channel for the alerts. Defaults to None, no alerts.
         """
-        moderators = self.db.get_all_moderators()
-        if not moderators:
-            await interaction.response.send_message(embed = discord.Embed(title="Moderator list", description="There are no moderators in this server", color=discord.Color.from_str("#ffffff")))
+        if not self.db.get_guild(interaction.guild_id):
+            await interaction.response.send_message("Please run ``/configure`` first!", ephemeral=True)
             return
-        # Create embed object.
-        embed = discord.Embed(
-            title="Moderator list",
-            description="Here are all the moderators and how many messages they've sent:",
-            colour=discord.Colour.from_str("#ffffff"))
-        # Add new field to the embed for every moderator.
-        for id in [mod.id for mod in moderators]:
-            sent, edited, deleted = self.db.get_amount_of_actions_by_type(
-                0, int(time.time()), id)
-            embed.add_field(
-                name=interaction.guild.get_member(id).display_name,
-                value=f"sent: {sent}, edited: {edited}, deleted: {deleted}",
-                inline=False)
-
+        self.db.set_alert_channel_id(interaction.guild_id, channel.id if channel else None)
+        description = f"Unusual moderator activity will be posted in {channel.mention}" if channel \
+            else "Alerts about unusual moderator activity are turned off"
+        embed = discord.Embed(title="Set alert channel", description=description, colour=colour)
         await interaction.response.send_message(embed=embed)
 
+    @app_commands.command(description="Sends a leaderboard of all moderators and their stats")
+    @app_commands.describe(days="How many days back to count, defaults to a week")
+    async def list_moderators(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 3650] = 7) -> None:
+        """Slash command to send a paginated leaderboard of all moderators and their stats.
+
+        Args:
+            interaction (discord.Interaction): The discord interaction obj that is passed automatically.
+            days (int, optional): How many days back to count actions for. Defaults to 7.
+        """
+        rows = await run_deferred(interaction, self.get_leaderboard, interaction.guild_id, days)
+        if not rows:
+            await followup(interaction, embed = discord.Embed(title="Moderator list", description="There are no moderators in this server", color=discord.Color.from_str("#ffffff")))
+            return
+
+        # The view gets its own copy, so sorting it doesn't touch the cache.
+        view = LeaderboardView(interaction.user.id, list(rows), days, self.bot.member_resolver)
+        view._update_buttons()
+        view.message = await followup(interaction, embed=await view.build_embed(interaction.guild), view=view, wait=True)
+
+    def get_leaderboard(self, guild_id: int, days: int) -> list[dict]:
+        """Returns the leaderboard rows of a guild for the last given amount
+        of days. The result is reused for LEADERBOARD_TTL seconds, so several
+        people opening the leaderboard at once only query the database once.
+
+        Args:
+            guild_id (int): The id of the guild.
+            days (int): How many days back to count actions for.
+
+        Returns:
+            list[dict]: One dict per moderator with their id, sent, edited and deleted counts and quota completion (0-1, None without quotas).
+        """
+        cached = self._leaderboard_cache.get((guild_id, days))
+        if cached and time.monotonic() - cached[0] < LEADERBOARD_TTL:
+            return cached[1]
+
+        end_time = int(time.time())
+        counts = self.db.get_amount_of_actions_per_moderator(
+            guild_id, end_time - days * 86_400, end_time)
+        rows = []
+        for mod in self.db.get_all_moderators(guild_id):
+            sent, edited, deleted = counts.get(mod.id, (0, 0, 0))
+            # Quotas are weekly, scale them to the length of the timeframe.
+            done = [min(count / (int(quota) * days / 7), 1)
+                    for count, quota in zip((sent, edited, deleted), mod.quotas)
+                    if int(quota) > 0]
+            rows.append({
+                "id": mod.id,
+                "sent": sent,
+                "edited": edited,
+                "deleted": deleted,
+                "completion": sum(done) / len(done) if done else None})
+
+        self._leaderboard_cache[(guild_id, days)] = (time.monotonic(), rows)
+        return rows
+
     @app_commands.command(description="Gets the moderator stats for a user in a timeframe")
     async def get_moderator_stats(self, interaction: discord.Interaction, user: discord.Member, earlier_time: str, later_time: str = None) -> None:
 
-        if not self.is_moderator(user):
+        if not self.is_moderator(interaction.guild_id, user):
             await interaction.response.send_message(f"User {user.display_name} is not a moderator.")
+            return
 
         # Check if first input was in the x days ago format:
         if earlier_time[-1:] == 'd':
@@ -419,8 +761,9 @@ class ModManager(commands.Cog):
             later_date = later_date.strftime("%d/%m/%Y")
 
         # We now have checked and both the timestamps are valid.
-        sent, edited, deleted = self.db.get_amount_of_actions_by_type(
-            start_time, end_time, user.id)
+        sent, edited, deleted = await run_deferred(
+            interaction, self.db.get_amount_of_actions_by_type,
+            interaction.guild_id, start_time, end_time, user.id)
 
         embed = discord.Embed(
             title=f"Moderator stats for {user.display_name}",
@@ -430,7 +773,7 @@ class ModManager(commands.Cog):
         embed.add_field(name=f"edited: {edited}", value="", inline=False)
         embed.add_field(name=f"deleted: {deleted}", value="", inline=False)
 
-        await interaction.response.send_message(embed=embed)
+        await followup(interaction, embed=embed)
 
     def is_moderator_channel(self, channel: discord.abc.GuildChannel) -> bool:
         """Function that checks if the given channel is under the moderator category in it's server.
@@ -444,16 +787,17 @@ class ModManager(commands.Cog):
         return channel.category.id == self.db.get_guild(
             channel.guild.id,).mod_category_id
 
-    def is_moderator(self, user: discord.Member) -> bool:
-        """Function that checks if the given user is a moderator.
+    def is_moderator(self, guild_id: int, user: discord.abc.User) -> bool:
+        """Function that checks if the given user is a moderator in the given guild.
 
         Args:
-            user (discord.Member): The user to check.
+            guild_id (int): The id of the guild to check in.
+            user (discord.abc.User): The user to check.
 
         Returns:
             bool: If the user is a moderator or not.
         """
-        if self.db.get_moderator(user.id):
+        if self.db.get_moderator(guild_id, user.id):
             return True
         return False
 
@@ -467,7 +811,7 @@ class SetUserQuotaModal(discord.ui.Modal):
         self.db = cog.db
 
         # Setting the default values to be the moderator's current quota.
-        moderator = cog.db.get_moderator(user.id)
+        moderator = cog.db.get_moderator(user.guild.id, user.id)
 
         self.sent_messages.default = str(moderator.send_quota)
         self.edited_messages.default = str(moderator.edit_quota)
@@ -500,7 +844,7 @@ class SetUserQuotaModal(discord.ui.Modal):
                 self.edited_messages.value,
                 self.deleted_messages.value,
             )
-            self.db.set_quota(self.user.id, quotas)
+            self.db.set_quota(self.user.guild.id, self.user.id, quotas)
             await interaction.response.send_message(f"Updated quotas for {self.user.display_name} to be: sent: {quotas[0]}, edited: {quotas[1]}, deleted: {quotas[2]}", ephemeral=True)
         except ValueError:
             await interaction.response.send_message(f"one of the following is not a number: {self.sent_messages.value}, {self.edited_messages.value}, {self.deleted_messages.value}", ephemeral=True)
@@ -516,5 +860,6 @@ class SetUserQuotaModal(discord.ui.Modal):
 # This setup is required for the cog to setup and run,
 # and is run when the cog is loaded with bot.load_extensions()
 async def setup(bot: commands.Bot) -> None:
-    print(f"\tcogs.Mod_manager begin loading")
-    await bot.add_cog(ModManager(bot))
+    logger.info("cogs.Mod_manager begin loading")
+    with bot.startup.phase(f"{__name__} setup"):
+        await bot.add_cog(ModManager(bot))
@@ -2,7 +2,11 @@
 from discord.ext import commands
 from discord import app_commands
 import discord
+import logging
 from db_handler import DBHandler
+from outbound import Priority
+
+logger = logging.getLogger(__name__)
 
 # ? global colour for the cog. Change this when we get around to a cohesive theme and whatnot.
 global colour
@@ -16,25 +20,45 @@ class StickyManager(commands.Cog):
 
     @commands.Cog.listener()
     async def on_message(self, msg: discord.Message) -> None:
-        # Don't resend if the message is from the bot:
-        if msg.author.id == self.bot.user.id:
+        # Don't resend if the message is from the bot, and DMs have no stickies:
+        if msg.author.id == self.bot.user.id or msg.guild is None:
             return
 
         # Make sure we have a sticky in the current channel.
-        sticky = self.db.get_sticky(msg.channel.id)
-        if sticky:
-            # Create and then send the sticky embed.
-            sticky_embed = discord.Embed(
-                title=sticky.title,
-                description=sticky.description,
-                colour=colour)
-            sticky_embed.set_footer(
-                text=f"Stickied by {self.bot.user.display_name}")
-            new_sticky = await msg.channel.send(embed=sticky_embed)
-
-            # Delete the old sticky message and update database
-            await msg.channel.get_partial_message(sticky.message_id).delete()
-            self.db.update_sticky(sticky.channel_id, new_sticky.id)
+        if self.db.get_sticky(msg.guild.id, msg.channel.id):
+            # A burst of messages only needs one repost at the end, so a
+            # repost that is still waiting gets merged with this one.
+            self.bot.outbound.submit(
+                lambda: self.repost_sticky(msg.channel),
+                Priority.STICKY,
+                bucket=f"channel:{msg.channel.id}",
+                merge_key=f"sticky:{msg.channel.id}")
+
+    async def repost_sticky(self, channel: discord.abc.GuildChannel) -> None:
+        """Sends the sticky of the channel again and deletes the old one.
+
+        Args:
+            channel (discord.abc.GuildChannel): The channel to repost the sticky in.
+        """
+        # Read the sticky only now, it may have been removed while we waited.
+        sticky = self.db.get_sticky(channel.guild.id, channel.id)
+        if not sticky:
+            return
+
+        # Create and then send the sticky embed.
+        sticky_embed = discord.Embed(
+            title=sticky.title,
+            description=sticky.description,
+            colour=colour)
+        sticky_embed.set_footer(
+            text=f"Stickied by {self.bot.user.display_name}")
+        new_sticky = await channel.send(embed=sticky_embed)
+
+        # Delete the old sticky message and update database
+        await channel.get_partial_message(sticky.message_id).delete()
+        self.db.update_sticky(channel.guild.id, sticky.channel_id, new_sticky.id)
+        logger.debug("reposted sticky in channel %s as message %s",
+                     sticky.channel_id, new_sticky.id)
 
     @app_commands.command()
     async def create_sticky(self, interaction: discord.Interaction) -> None:
@@ -43,7 +67,7 @@ class StickyManager(commands.Cog):
         Args:
             interaction (discord.Interaction): The discord interaction obj that is passed automatically.
         """
-        if self.db.get_sticky(interaction.channel_id):
+        if self.db.get_sticky(interaction.guild_id, interaction.channel_id):
             await interaction.response.send_message("There is already a sticky in this channel.", ephemeral=True)
             return
         await interaction.response.send_modal(CreateStickyModal(self, interaction, self.bot.user.display_name))
@@ -56,11 +80,11 @@ class StickyManager(commands.Cog):
             interaction (discord.Interaction): The discord interaction obj that is passed automatically.
             del_message (bool): Whether or not to delete the sticky message.
         """
-        sticky = self.db.get_sticky(interaction.channel_id)
+        sticky = self.db.get_sticky(interaction.guild_id, interaction.channel_id)
         if sticky:
             if del_message:
                 await interaction.channel.get_partial_message(sticky.message_id).delete()
-            self.db.del_sticky(interaction.channel_id)
+            self.db.del_sticky(interaction.guild_id, interaction.channel_id)
             await interaction.response.send_message(f"Removed sticky in {interaction.channel.name}.", ephemeral=True)
         else:
             await interaction.response.send_message("There isn't a sticky in this channel.", ephemeral=True)
@@ -103,6 +127,7 @@ class CreateStickyModal(discord.ui.Modal):
 
         # Create database entry for sticky message.
         self.db.create_sticky(
+            interaction.guild_id,
             interaction.channel_id,
             new_sticky.id,
             self.sticky_title.value,
@@ -119,5 +144,6 @@ class CreateStickyModal(discord.ui.Modal):
 
 
 async def setup(bot: commands.Bot) -> None:
-    print(f"\tcogs.sticky_manager begin loading")
-    await bot.add_cog(StickyManager(bot))
+    logger.info("cogs.sticky_manager begin loading")
+    with bot.startup.phase(f"{__name__} setup"):
+        await bot.add_cog(StickyManager(bot))
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import logging
+from os import path as os_path
+import discord
+from discord import app_commands
+
+logger = logging.getLogger(__name__)
+
+
+def command_tree_hash(tree: app_commands.CommandTree, guild: discord.abc.Snowflake = None) -> str:
+    """Computes a stable hash of every app command (slash commands, groups and
+    context menus) registered in the tree, as discord would receive it on sync.
+
+    Args:
+        tree (app_commands.CommandTree): The command tree of the bot.
+        guild (discord.abc.Snowflake, optional): Hash the guild's commands instead of the global ones. Defaults to None.
+
+    Returns:
+        str: The hex digest of the hash.
+    """
+    payload = [command.to_dict(tree) for command in tree.get_commands(guild=guild)]
+    # The tree has no fixed order, so sort the commands to keep the hash stable.
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _read_hashes(path: str) -> dict[str, str]:
+    if not os_path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read %s, syncing commands again: %s", path, e)
+        return {}
+
+
+async def sync_if_changed(tree: app_commands.CommandTree, path: str,
+                          guild: discord.abc.Snowflake = None) -> bool:
+    """Syncs the command tree with discord, but only when the commands changed
+    since the last sync. The hash of the last synced tree is kept in a small
+    json file, one entry per scope (global or a guild id).
+
+    Args:
+        tree (app_commands.CommandTree): The command tree of the bot.
+        path (str): Path of the json file the hashes are stored in.
+        guild (discord.abc.Snowflake, optional): Sync the guild's commands instead of the global ones. Defaults to None.
+
+    Returns:
+        bool: If the tree was synced.
+    """
+    scope = str(guild.id) if guild else "global"
+    current = command_tree_hash(tree, guild=guild)
+    hashes = _read_hashes(path)
+    if hashes.get(scope) == current:
+        logger.info("commands unchanged (%s), skipping sync", scope)
+        return False
+
+    synced = await tree.sync(guild=guild)
+    logger.info("synced %d commands (%s)", len(synced), scope)
+
+    # Only store the hash once the sync went through, so a failed sync is
+    # retried on the next start.
+    hashes[scope] = current
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, indent=4)
+    return True
@@ -1,18 +1,168 @@
+import json
+import logging
+import os
 import sqlite3
+import threading
+import time
+from typing import Callable
 from sqlite3 import Error
-from helpers import Action, Moderator, StickyMessage, VacationWeek, Guild
+from archive import ActionArchive, month_of, month_start, next_month
+from metrics import metrics
+from helpers import Action, Moderator, StickyMessage, VacationWeek, Guild, ScheduledJob
+from memory_report import deep_sizeof
+from metrics import TimingStats
+from query_log import SlowQueryLog
+from stats_cache import StatsCache
+
+logger = logging.getLogger(__name__)
+
+# Actions store their type as a small number, the index into this.
+ACTION_TYPES = ("sent", "edited", "deleted")
+
+# Bumped whenever the layout of a table changes, see _migrate().
+SCHEMA_VERSION = 3
+
+# Rows the guild partitioning couldn't place yet, see assign_unowned_rows().
+UNASSIGNED_GUILD = 0
+
+# Every table with per server data leads its key with guild_id, so a guild's
+# rows sit together and no query has to look at the other guilds.
+MODERATORS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS moderators (
+    "user_id" INTEGER NOT NULL,
+    "send_quota" INTEGER NOT NULL,
+    "edit_quota" INTEGER NOT NULL,
+    "delete_quota" INTEGER NOT NULL,
+    "consecutive_completed_weeks" INTEGER NOT NULL,
+    "vacation_days" INTEGER NOT NULL,
+    "active" INTEGER NOT NULL,
+    "guild_id" INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+);
+"""
+STICKIES_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS stickies (
+    "channel_id" INTEGER NOT NULL,
+    "message_id" INTEGER UNIQUE NOT NULL,
+    "title" TEXT NOT NULL,
+    "description" TEXT NOT NULL,
+    "guild_id" INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, channel_id)
+);
+"""
+VACATION_WEEKS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS vacation_weeks (
+    "date" TEXT NOT NULL,
+    "mod_id" INTEGER NOT NULL,
+    "guild_id" INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, mod_id, date),
+    FOREIGN KEY (guild_id, mod_id) REFERENCES moderators (guild_id, user_id)
+);
+"""
+# Clustered on (guild_id, mod_id, timestamp), so the actions of a moderator
+# in a timeframe sit next to each other on disk. The monthly archives use
+# the same layout.
+ACTIONS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS {schema}actions (
+    "guild_id" INTEGER NOT NULL,
+    "mod_id" INTEGER NOT NULL,
+    "timestamp" INTEGER NOT NULL,
+    "id" INTEGER NOT NULL,
+    "type" INTEGER NOT NULL,
+    "channel_id" INTEGER NOT NULL,
+    "message_id" INTEGER,
+    PRIMARY KEY (guild_id, mod_id, timestamp, id),
+    FOREIGN KEY (guild_id, mod_id) REFERENCES moderators (guild_id, user_id)
+) WITHOUT ROWID;
+"""
+ACTION_COLUMNS = '"id", "type", "channel_id", "mod_id", "timestamp", "message_id", "guild_id"'
 
 
 class DBHandler():
-    def __init__(self, path: str):
+    def __init__(self, path: str, slow_query_ms: float = None, archive_dir: str = None,
+                 owns_guild: Callable[[int], bool] = None, action_id_slot: tuple[int, int] = (0, 1)):
         """A class that handles any needed queries to the database.
 
         Args:
             path (str): The filepath of the database to load from
-        """
-        self.connection = sqlite3.connect(path)
-        self.connection.execute("PRAGMA foreign_keys = ON;")
-        print("Connection to SQLite DB successful")
+            slow_query_ms (float, optional): If set, every query is timed and any query slower than this many milliseconds is logged with its query plan. Defaults to None.
+            archive_dir (str, optional): Where the monthly archives of old actions are kept, see archive_actions(). Defaults to None, no archive.
+            owns_guild (Callable[[int], bool], optional): Tells if a guild is served by this process, only those guilds are kept in the caches and the others are always read from the database (see sharding.py). Defaults to None, every guild.
+            action_id_slot (tuple[int, int], optional): (remainder, modulus), the action ids this process hands out. Processes sharing the database each need their own remainder, so they never pick the same id. Defaults to (0, 1), every id.
+        """
+        self.path = path
+        self.owns_guild = owns_guild
+        self.action_id_slot = action_id_slot
+        self.connection = self._connect()
+        # Only has an effect on a new database, older ones are converted by
+        # create_tables(). Lets archive_actions() give the space back.
+        self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        # WAL lets reads on worker threads (see interactions.py) run while the
+        # bot keeps writing on the main connection, instead of locking it out.
+        self.connection.execute("PRAGMA journal_mode = WAL;")
+        # The main connection belongs to the thread that made the handler,
+        # every other thread gets its own connection on first use. They are
+        # kept by thread id so close() can reach them.
+        self._owner_thread = threading.get_ident()
+        self._thread_connections: dict[int, sqlite3.Connection] = {}
+        self.query_log = None
+        # Set while a backup runs, to see how long writes take meanwhile.
+        self.write_timings: TimingStats | None = None
+        if slow_query_ms is not None:
+            self.query_log = SlowQueryLog(self.connection, slow_query_ms)
+
+        # In memory copies of the small tables, filled by warm_up(). Rows are
+        # kept as tuples and turned into objects on every read, so callers
+        # can't change the cached data by editing what they get back. All but
+        # the config are split per guild first: guild id -> key -> row.
+        self.cache_ready = False
+        self._guilds: dict[int, tuple] = {}
+        self._moderators: dict[int, dict[int, tuple]] = {}
+        self._stickies: dict[int, dict[int, tuple]] = {}
+        self._vacation_weeks: dict[int, dict[int, set[str]]] = {}
+        # Writes come from worker threads too. They build a new dict and swap
+        # it in, so readers never see one halfway through a change, and take
+        # this lock so two of them can't swap over each other's change.
+        self._cache_lock = threading.Lock()
+
+        # Action counts per ((guild, moderator), start, end), see StatsCache.
+        self.stats_cache = StatsCache()
+        # Actions from before archive.boundary live here instead of in the
+        # actions table.
+        self.archive = ActionArchive(archive_dir) if archive_dir else None
+        # Action ids are handed out here, the table has no rowid to do it.
+        self._last_action_id: int = None
+        self._action_id_lock = threading.Lock()
+        logger.info("Connection to SQLite DB successful")
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        connection.execute("PRAGMA foreign_keys = ON;")
+        return connection
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """The connection to use from the calling thread. sqlite3 connections
+        can't be shared between threads."""
+        thread = threading.get_ident()
+        if thread == self._owner_thread:
+            return self.connection
+        connection = self._thread_connections.get(thread)
+        if connection is None:
+            # Only ever used by this thread, but close() runs on the owner's.
+            connection = self._thread_connections[thread] = self._connect(check_same_thread=False)
+        return connection
+
+    def close(self) -> None:
+        """Closes every connection of the handler, used when the bot shuts
+        down. Call it from the thread that made the handler, once nothing
+        runs queries on worker threads anymore."""
+        for connection in self._thread_connections.values():
+            connection.close()
+        self._thread_connections = {}
+        if self.archive:
+            self.archive.close()
+        self.connection.close()
 
     def _execute_query(self, query: str, vars: tuple = ()) -> None:
         """Execute the given query with the object's database.
@@ -21,12 +171,22 @@ class DBHandler():
             query (str): The query string.
             vars (tuple, optional): The vars to replace the spots in the query string. Defaults to ()
         """
-        cursor = self.connection.cursor()
+        connection = self._connection
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        failed = True
         try:
             cursor.execute(query, vars)
+            failed = False
         except Error as e:
-            print(f"The error '{e}' occurred")
-        self.connection.commit()
+            logger.error("The error '%s' occurred while running: %s", e, query)
+        finally:
+            connection.commit()
+            duration_ms = (time.perf_counter() - start) * 1000
+            if self.write_timings is not None:
+                self.write_timings.add(duration_ms)
+            if self.query_log:
+                self.query_log.record(query, vars, duration_ms, connection, failed)
 
     def _execute_read_query(self, query: str, vars: tuple = ()) -> tuple:
         """Executes the given query with the object's database, returning
@@ -39,14 +199,23 @@ class DBHandler():
         Returns:
             tuple: A Touple containing the data at the found row.
         """
-        cursor = self.connection.cursor()
+        connection = self._connection
+        cursor = connection.cursor()
         result = None
+        start = time.perf_counter()
+        failed = True
         try:
             cursor.execute(query, vars)
             result = cursor.fetchone()
+            failed = False
             return result
         except Error as e:
-            print(f"The error '{e}' occurred")
+            logger.error("The error '%s' occurred while running: %s", e, query)
+        finally:
+            # Failed queries count too, they took their time as well.
+            if self.query_log:
+                self.query_log.record(
+                    query, vars, (time.perf_counter() - start) * 1000, connection, failed)
 
     def _execute_multiple_read_query(
             self,
@@ -61,20 +230,159 @@ class DBHandler():
         Returns:
             list[tuple]: a list containing all the data found from the query.
         """
-        cursor = self.connection.cursor()
+        connection = self._connection
+        cursor = connection.cursor()
         result = None
+        start = time.perf_counter()
+        failed = True
         try:
             cursor.execute(query, vars)
             result = cursor.fetchall()
+            failed = False
             return result
         except Error as e:
-            print(f"The error '{e}' occurred")
+            logger.error("The error '%s' occurred while running: %s", e, query)
+        finally:
+            # Failed queries count too, they took their time as well.
+            if self.query_log:
+                self.query_log.record(
+                    query, vars, (time.perf_counter() - start) * 1000, connection, failed)
+
+
+# -------------------------- CACHE HANDLING ---------------------------
+
+    def warm_up(self) -> dict[str, int]:
+        """Loads the config, moderators, stickies and vacation_weeks tables into
+        memory from one read transaction, so they all come from the same
+        snapshot. After this, the getters for those tables no longer query
+        the database and every write keeps the cache up to date.
+
+        Returns:
+            dict[str, int]: The amount of rows loaded per table.
+        """
+        tables = ["config", "moderators", "stickies", "vacation_weeks"]
+        rows = {}
+        start = time.perf_counter()
+        # Plain SELECTs don't open a transaction on their own, without one
+        # every table could be read from a different state of the file.
+        self.connection.execute("BEGIN")
+        try:
+            for table in tables:
+                rows[table] = self.connection.execute(
+                    f"SELECT * FROM {table}").fetchall()
+        finally:
+            self.connection.commit()
+        metrics.observe("db.warm_up", (time.perf_counter() - start) * 1000)
+
+        self._fill_caches(rows)
+        self.cache_ready = True
+        # Finding the highest action id reads the whole table, better now
+        # than on the event loop when the first action comes in.
+        with self._action_id_lock:
+            self._last_action_id = self._max_action_id()
+        return {table: len(rows[table]) for table in tables}
+
+    def _fill_caches(self, rows: dict[str, list[tuple]]) -> None:
+        """Replaces the cached tables with the given rows, see warm_up().
+        Rows of guilds this process doesn't serve are left out.
+
+        Args:
+            rows (dict[str, list[tuple]]): Every row of the config, moderators, stickies and vacation_weeks tables.
+        """
+        owns = self.owns_guild or (lambda guild_id: True)
+        moderators, stickies, vacation_weeks = {}, {}, {}
+        for row in rows["moderators"]:
+            if owns(row[7]):
+                moderators.setdefault(row[7], {})[row[0]] = row
+        for row in rows["stickies"]:
+            if owns(row[4]):
+                stickies.setdefault(row[4], {})[row[0]] = row
+        for date, mod_id, guild_id in rows["vacation_weeks"]:
+            if owns(guild_id):
+                vacation_weeks.setdefault(guild_id, {}).setdefault(mod_id, set()).add(date)
+        with self._cache_lock:
+            self._guilds = {row[0]: row for row in rows["config"] if owns(row[0])}
+            self._moderators = moderators
+            self._stickies = stickies
+            self._vacation_weeks = vacation_weeks
+
+    def memory_usage(self) -> dict[str, tuple[int, int]]:
+        """Measures the memory of the caches, see memory_report.py.
+
+        Returns:
+            dict[str, tuple[int, int]]: Name of each cache -> (entries, bytes).
+        """
+        # Changes swap in new dicts, so these stay as they are while we measure.
+        guilds = self._guilds
+        moderators = self._moderators
+        stickies = self._stickies
+        vacation_weeks = self._vacation_weeks
+        return {
+            "db config": (len(guilds), deep_sizeof(guilds)),
+            "db moderators": (sum(map(len, moderators.values())), deep_sizeof(moderators)),
+            "db stickies": (sum(map(len, stickies.values())), deep_sizeof(stickies)),
+            "db vacation weeks": (sum(len(dates) for rows in vacation_weeks.values() for dates in rows.values()),
+                                  deep_sizeof(vacation_weeks)),
+            "stats cache": (len(self.stats_cache), deep_sizeof(self.stats_cache)),
+        }
+
+    def _cached(self, guild_id: int) -> bool:
+        """Checks if the rows of a guild can be read from the caches."""
+        return self.cache_ready and (self.owns_guild is None or self.owns_guild(guild_id))
+
+    def _refresh_cached_row(self, cache: str, table: str, key_column: str, key: int,
+                            guild_id: int = None) -> None:
+        """Re-reads a single row after a write, if the cache is in use.
+
+        Args:
+            cache (str): The attribute holding the cached rows of the table, e.g. "_guilds".
+            table (str): The name of the table.
+            key_column (str): The key column of the table, next to guild_id.
+            key (int): The key of the row that changed.
+            guild_id (int, optional): The guild of the row, for the tables that are split per guild. Defaults to None.
+        """
+        if not self._cached(key if guild_id is None else guild_id):
+            return
+        with self._cache_lock:
+            if guild_id is None:
+                row = self._execute_read_query(
+                    f"SELECT * FROM {table} WHERE {key_column} = ?", (key,))
+                rows = dict(getattr(self, cache))
+            else:
+                row = self._execute_read_query(
+                    f"SELECT * FROM {table} WHERE guild_id = ? AND {key_column} = ?", (guild_id, key))
+                rows = dict(getattr(self, cache).get(guild_id, {}))
+            if row:
+                rows[key] = row
+            else:
+                rows.pop(key, None)
+            if guild_id is None:
+                setattr(self, cache, rows)
+            else:
+                setattr(self, cache, {**getattr(self, cache), guild_id: rows})
+
+    def _refresh_cached_guild(self, cache: str, table: str, guild_id: int) -> None:
+        """Re-reads the rows of one guild after a write that touched several
+        of them, if the cache is in use.
+
+        Args:
+            cache (str): The attribute holding the cached rows of the table, e.g. "_moderators".
+            table (str): The name of the table.
+            guild_id (int): The guild whose rows changed.
+        """
+        if not self._cached(guild_id):
+            return
+        with self._cache_lock:
+            rows = self._execute_multiple_read_query(
+                f"SELECT * FROM {table} WHERE guild_id = ?", (guild_id,)) or []
+            setattr(self, cache, {**getattr(self, cache), guild_id: {row[0]: row for row in rows}})
 
 
 # -------------------------- STICKY HANDLING --------------------------
 
     def create_sticky(
             self,
+            guild_id: int,
             channel_id: int,
             message_id: int,
             title: str,
@@ -82,6 +390,7 @@ class DBHandler():
         """Adds a new sticky to the object's database.
 
         Args:
+            guild_id (int): The id of the guild the channel is in.
             channel_id (int): The discord Channel id of the message.
             message_id (int): The id of the message itself.
             title (str): The title of the embed message.
@@ -89,22 +398,26 @@ class DBHandler():
         """
         sticky_add_query = """
         INSERT INTO
-            stickies (channel_id, message_id, title, description)
+            stickies (channel_id, message_id, title, description, guild_id)
         VALUES
-            (?, ?, ?, ?);
+            (?, ?, ?, ?, ?);
         """
         self._execute_query(
             sticky_add_query,
             (channel_id,
              message_id,
              title,
-             description))
+             description,
+             guild_id))
+        self._refresh_cached_row(
+            "_stickies", "stickies", "channel_id", channel_id, guild_id)
 
-    def update_sticky(self, channel_id: int, message_id: int) -> None:
+    def update_sticky(self, guild_id: int, channel_id: int, message_id: int) -> None:
         """Updates the DB entry for a given channel to point to another
         message
 
         Args:
+            guild_id (int): The id of the guild the channel is in.
             channel_id (int): The id of the discord channel the sticky is in.
             message_id (int): The id of the new sticky.
         """
@@ -113,53 +426,72 @@ class DBHandler():
         SET
             message_id = ?
         WHERE
+            guild_id = ?
+        AND
             channel_id = ?
         """
-        self._execute_query(sticky_update_query, (message_id, channel_id,))
+        self._execute_query(sticky_update_query, (message_id, guild_id, channel_id,))
+        self._refresh_cached_row(
+            "_stickies", "stickies", "channel_id", channel_id, guild_id)
 
-    def del_sticky(self, channel_id: int) -> None:
+    def del_sticky(self, guild_id: int, channel_id: int) -> None:
         """Remove a sticky from the object's db given a channel id
 
         Args:
+            guild_id (int): The id of the guild the channel is in.
             channel_id (int): The Id of the channel to remove the sticky from
         """
-        sticky_del_query = "DELETE FROM stickies WHERE channel_id = ?"
-        self._execute_query(sticky_del_query, (channel_id,))
+        sticky_del_query = "DELETE FROM stickies WHERE guild_id = ? AND channel_id = ?"
+        self._execute_query(sticky_del_query, (guild_id, channel_id,))
+        self._refresh_cached_row(
+            "_stickies", "stickies", "channel_id", channel_id, guild_id)
 
-    def get_sticky(self, channel_id: int) -> StickyMessage:
+    def get_sticky(self, guild_id: int, channel_id: int) -> StickyMessage:
         """Returns the id of a sticky message given the id of the channel it's in.
 
         Args:
+            guild_id (int): The id of the guild the channel is in.
             channel_id (int): The id of the channel the sticky is in.
 
         Returns:
             StickyMessage: A sticky message object containing all info pertaining to the sticky message.
         """
+        if self._cached(guild_id):
+            result = self._stickies.get(guild_id, {}).get(channel_id)
+            return StickyMessage(*result) if result else None
+
         sticky_query = """
         SELECT * FROM stickies
-        WHERE channel_id = ?"""
+        WHERE guild_id = ? AND channel_id = ?"""
 
         # Return the message_id of the entry in the database as a StickyMessage
         # (second value of the tuple)
 
         result = self._execute_read_query(
-            sticky_query, (channel_id,))
+            sticky_query, (guild_id, channel_id,))
 
         if result:
             return StickyMessage(*result)
         return None
 
-    def get_all_stickies(self) -> list[StickyMessage]:
-        """Returns a list of all stickies in the object's database.
+    def get_all_stickies(self, guild_id: int) -> list[StickyMessage]:
+        """Returns a list of all stickies of a guild in the object's database.
+
+        Args:
+            guild_id (int): The id of the guild.
 
         Returns:
             list[StickyMessage]: A list of StickyMessage objects
         """
+        if self._cached(guild_id):
+            return [StickyMessage(*sticky) for sticky in self._stickies.get(guild_id, {}).values()]
+
         sticky_query = """
         SELECT * FROM stickies
+        WHERE guild_id = ?
         """
 
-        result = self._execute_multiple_read_query(sticky_query)
+        result = self._execute_multiple_read_query(sticky_query, (guild_id,))
 
         if result:
             return [StickyMessage(*sticky) for sticky in result]
@@ -169,14 +501,17 @@ class DBHandler():
 # --------------------------- MOD HANDLING ----------------------------
 
     def register_moderator(
-            self, user_id: int, quotas: tuple[int, int, int]) -> None:
-        """Adds a new moderator to the object's database.
+            self, guild_id: int, user_id: int, quotas: tuple[int, int, int]) -> None:
+        """Adds a new moderator to the object's database. A moderator kept
+        aside under the unassigned guild by the migration is moved into the
+        guild, with their streak and vacation.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user.
             quotas (tuple[int, int, int]): The quotas the user should reach weekly.
         """
-        mod_test = self.get_moderator(user_id)
+        mod_test = self.get_moderator(guild_id, user_id)
         if mod_test:
             if mod_test.active == 0:
                 moderator_registration_query = """
@@ -188,26 +523,35 @@ class DBHandler():
                     vacation_days = 0,
                     active = 1
                 WHERE
+                    guild_id = ?
+                AND
                     user_id = ?
                 """
                 self._execute_query(
-                    moderator_registration_query, (*quotas, user_id,))
+                    moderator_registration_query, (*quotas, guild_id, user_id,))
+                self._refresh_cached_row(
+                    "_moderators", "moderators", "user_id", user_id, guild_id)
                 return
             else:
-                raise (ValueError(f"User with id: {user_id} already exists."))
+                raise (ValueError(f"User with id: {user_id} already exists in guild {guild_id}."))
+        if self._claim_unassigned_moderator(guild_id, user_id, quotas):
+            return
 
         moderator_registration_query = """
         INSERT INTO
-            moderators (user_id, send_quota, edit_quota, delete_quota, consecutive_completed_weeks, active, vacation_days)
+            moderators (user_id, send_quota, edit_quota, delete_quota, consecutive_completed_weeks, active, vacation_days, guild_id)
         VALUES
-            (?, ?, ?, ?, 0, 1, 0);
+            (?, ?, ?, ?, 0, 1, 0, ?);
         """
-        self._execute_query(moderator_registration_query, (user_id, *quotas,))
+        self._execute_query(moderator_registration_query, (user_id, *quotas, guild_id,))
+        self._refresh_cached_row(
+            "_moderators", "moderators", "user_id", user_id, guild_id)
 
-    def set_quota(self, user_id: int, quotas: tuple[int, int, int]) -> None:
+    def set_quota(self, guild_id: int, user_id: int, quotas: tuple[int, int, int]) -> None:
         """Edits the weekly quota for the given user in the object's database.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user to edit.
             quotas (tuple[int, int, int]): The new weekly quotas for the user.
         """
@@ -218,14 +562,19 @@ class DBHandler():
             edit_quota = ?,
             delete_quota = ?
         WHERE
+            guild_id = ?
+        AND
             user_id == ?
         """
-        self._execute_query(moderator_edit_query, (*quotas, user_id,))
+        self._execute_query(moderator_edit_query, (*quotas, guild_id, user_id,))
+        self._refresh_cached_row(
+            "_moderators", "moderators", "user_id", user_id, guild_id)
 
-    def set_all_quotas(self, quotas: tuple[int, int, int]) -> None:
-        """Edits the weekly quota for all the users in the object's database.
+    def set_all_quotas(self, guild_id: int, quotas: tuple[int, int, int]) -> None:
+        """Edits the weekly quota for all the users of a guild in the object's database.
 
         Args:
+            guild_id (int): The id of the guild.
             quotas (tuple[int, int, int]): The new weekly quota for all users.
         """
         # make sure we don't change removed moderators
@@ -236,15 +585,19 @@ class DBHandler():
             edit_quota = ?,
             delete_quota = ?
         WHERE
+            guild_id = ?
+        AND
             active == 1
         """
-        self._execute_query(moderator_edit_query, (*quotas,))
+        self._execute_query(moderator_edit_query, (*quotas, guild_id,))
+        self._refresh_cached_guild("_moderators", "moderators", guild_id)
 
     def set_consecutive_completed_weeks(
-            self, user_id: int, new_value: int) -> None:
+            self, guild_id: int, user_id: int, new_value: int) -> None:
         """Sets the amount of consecutive completed weeks for the given user in the object's database.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user to edit.
             new_value (int): The new value to set consecutive_completed_weeks to.
         """
@@ -253,15 +606,20 @@ class DBHandler():
         SET
             consecutive_completed_weeks = ?
         WHERE
+            guild_id = ?
+        AND
             user_id = ?
         """
-        self._execute_query(moderator_edit_query, (new_value, user_id,))
+        self._execute_query(moderator_edit_query, (new_value, guild_id, user_id,))
+        self._refresh_cached_row(
+            "_moderators", "moderators", "user_id", user_id, guild_id)
 
     def increment_consecutive_completed_weeks(
-            self, user_id: int, amount: int = 1) -> None:
+            self, guild_id: int, user_id: int, amount: int = 1) -> None:
         """Increments the amount consecutive completed weeks for the given user by the given amount in the object's database.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user to edit.
             amount (int, optional): The amount to increment the field with. Defaults to 1.
         """
@@ -270,14 +628,19 @@ class DBHandler():
         SET
             consecutive_completed_weeks = consecutive_completed_weeks + ?
         WHERE
+            guild_id = ?
+        AND
             user_id = ?
         """
-        self._execute_query(moderator_edit_query, (amount, user_id,))
+        self._execute_query(moderator_edit_query, (amount, guild_id, user_id,))
+        self._refresh_cached_row(
+            "_moderators", "moderators", "user_id", user_id, guild_id)
 
-    def set_vacation_days(self, user_id: int, new_value: int) -> None:
+    def set_vacation_days(self, guild_id: int, user_id: int, new_value: int) -> None:
         """Sets the amount of vacation days for the given user in the object's database.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user to edit.
             new_value (int): The new value to set vacation_days to.
         """
@@ -286,14 +649,19 @@ class DBHandler():
         SET
             vacation_days = ?
         WHERE
+            guild_id = ?
+        AND
             user_id = ?
         """
-        self._execute_query(moderator_edit_query, (new_value, user_id,))
+        self._execute_query(moderator_edit_query, (new_value, guild_id, user_id,))
+        self._refresh_cached_row(
+            "_moderators", "moderators", "user_id", user_id, guild_id)
 
-    def increment_vacation_days(self, user_id: int, amount: int = 1) -> None:
+    def increment_vacation_days(self, guild_id: int, user_id: int, amount: int = 1) -> None:
         """Increments the amount of vacation days for the given user by the given amount in the object's database.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user to edit.
             amount (int, optional): The amount to increment the field with. Defaults to 1.
         """
@@ -302,14 +670,19 @@ class DBHandler():
         SET
             vacation_days = vacation_days + ?
         WHERE
+            guild_id = ?
+        AND
             user_id = ?
         """
-        self._execute_query(moderator_edit_query, (amount, user_id,))
+        self._execute_query(moderator_edit_query, (amount, guild_id, user_id,))
+        self._refresh_cached_row(
+            "_moderators", "moderators", "user_id", user_id, guild_id)
 
-    def de_register_moderator(self, user_id: int) -> None:
+    def de_register_moderator(self, guild_id: int, user_id: int) -> None:
         """Modifies a moderator entry to no longer be active, and no longer have any quotas to fill, given the id of a user to edit.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user to edit
         """
         moderator_de_registration_query = """
@@ -321,62 +694,89 @@ class DBHandler():
             edit_quota = 0,
             delete_quota = 0
         WHERE
+            guild_id = ?
+        AND
             user_id = ?
         """
-        self._execute_query(moderator_de_registration_query, (user_id,))
+        self._execute_query(moderator_de_registration_query, (guild_id, user_id,))
+        self._refresh_cached_row(
+            "_moderators", "moderators", "user_id", user_id, guild_id)
 
-    def get_moderator(self, user_id: int) -> Moderator:
+    def get_moderator(self, guild_id: int, user_id: int) -> Moderator:
         """Returns a moderator given their discord user id.
 
         Args:
+            guild_id (int): The id of the guild the user moderates.
             user_id (int): Discord id of the user to get.
 
         Returns:
             Moderator: A moderator object containing all data pertaining to the user
         """
+        if self._cached(guild_id):
+            result = self._moderators.get(guild_id, {}).get(user_id)
+            return Moderator(*result) if result else None
+
         moderator_get_query = """
         SELECT * FROM moderators
         WHERE
+            guild_id = ?
+        AND
             user_id = ?
         """
         result = self._execute_read_query(
-            moderator_get_query, (user_id,))
+            moderator_get_query, (guild_id, user_id,))
 
         if result:
             return Moderator(*result)
         return None
 
-    def get_all_moderators(self) -> list[Moderator]:
-        """Returns a list of all active moderators in the object's database
+    def get_all_moderators(self, guild_id: int) -> list[Moderator]:
+        """Returns a list of all active moderators of a guild in the object's database
+
+        Args:
+            guild_id (int): The id of the guild.
 
         Returns:
             list[Moderator]: List of Moderator objects
         """
+        if self._cached(guild_id):
+            return [Moderator(*mod) for mod in self._moderators.get(guild_id, {}).values() if mod[6] == 1]
+
         moderator_get_query = """
         SELECT * FROM moderators
         WHERE
+            guild_id = ?
+        AND
             active = 1
         """
         result = self._execute_multiple_read_query(
-            moderator_get_query)
+            moderator_get_query, (guild_id,))
 
         if result:
             return [Moderator(*mod) for mod in result]
         return []
 
-    def get_all_inactive_moderators(self) -> list[Moderator]:
-        """Returns a list of all inactive moderators in the object's database
+    def get_all_inactive_moderators(self, guild_id: int) -> list[Moderator]:
+        """Returns a list of all inactive moderators of a guild in the object's database
+
+        Args:
+            guild_id (int): The id of the guild.
 
         Returns:
             list[Moderator]: List of Moderator objects
         """
+        if self._cached(guild_id):
+            return [Moderator(*mod) for mod in self._moderators.get(guild_id, {}).values() if mod[6] == 0]
+
         moderator_get_query = """
         SELECT * FROM moderators
         WHERE
+            guild_id = ?
+        AND
             active = 0
         """
         result = self._execute_multiple_read_query(
-            moderator_get_query)
+            moderator_get_query, (guild_id,))
 
         if result:
             return [Moderator(*mod) for mod in result]
@@ -387,6 +787,7 @@ class DBHandler():
 
     def create_action(
             self,
+            guild_id: int,
             action_type: str,
             moderator_id: int,
             timestamp: int,
@@ -395,31 +796,94 @@ class DBHandler():
         """Adds a new action to the object's database
 
         Args:
+            guild_id (int): The id of the guild the action happened in.
             action_type (str): Type of action, "sent", "edited" or "deleted".
             moderator_id (int): Discord ID of the moderator that executed the action.
             timestamp (int): Unix timestamp of when the action was executed.
             channel_id (int): Discord ID of the channel the action occured in.
             message_id (int, optional): Discord ID of the message the action is referencing. Defaults to None.
         """
+        if action_type not in ACTION_TYPES:
+            raise ValueError(
+                f'"{action_type}" is not a valid type ("sent", "edited" or "deleted")')
         action_registration_query = """
         INSERT INTO
-            actions (type, message_id, channel_id, mod_id, timestamp)
+            actions (guild_id, mod_id, timestamp, id, type, channel_id, message_id)
         VALUES
-            (?, ?, ?, ?, ?)
+            (?, ?, ?, ?, ?, ?, ?)
         """
         self._execute_query(
             action_registration_query,
-            (action_type,
-             message_id,
-             channel_id,
+            (guild_id,
              moderator_id,
-             timestamp))
+             timestamp,
+             self._next_action_id(),
+             ACTION_TYPES.index(action_type),
+             channel_id,
+             message_id))
+        self.stats_cache.bump((guild_id, moderator_id))
+
+    def _next_action_id(self) -> int:
+        """Returns the id for a new action, the next one after any before it
+        that falls in this process' action_id_slot."""
+        remainder, modulus = self.action_id_slot
+        with self._action_id_lock:
+            if self._last_action_id is None:
+                self._last_action_id = self._max_action_id()
+            self._last_action_id += 1
+            self._last_action_id += (remainder - self._last_action_id) % modulus
+            return self._last_action_id
+
+    def _max_action_id(self) -> int:
+        """Returns the highest action id in use, archived actions included."""
+        result = self._execute_read_query("SELECT MAX(id) FROM actions;")
+        highest = result[0] if result and result[0] is not None else 0
+        if self.archive:
+            highest = max(highest, self.archive.max_id())
+        return highest
+
+    @staticmethod
+    def _to_actions(rows: list[tuple]) -> list[Action]:
+        """Turns rows selected with ACTION_COLUMNS into Action objects."""
+        return [
+            Action(id, ACTION_TYPES[type], channel_id, mod_id, timestamp,
+                   message_id=message_id, guild_id=guild_id)
+            for id, type, channel_id, mod_id, timestamp, message_id, guild_id in rows]
+
+    def _read_actions(self, query: str, start_time: int, end_time: int,
+                      vars: tuple = ()) -> list[tuple]:
+        """Runs a read query on the actions of a timeframe, wherever they are
+        stored. The part of the range from before the archive boundary is
+        read from the archived months, the rest from the actions table. The
+        query has to filter on "timestamp" BETWEEN ? AND ? with those as its
+        first two parameters.
 
-    def get_all_actions(self, start_time: int, end_time: int,
+        Args:
+            query (str): The query string.
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            vars (tuple, optional): The vars for the rest of the query. Defaults to ().
+
+        Returns:
+            list[tuple]: The rows from the archive followed by the ones from the actions table.
+        """
+        boundary = self.archive.boundary if self.archive else 0
+        result = []
+        if start_time < boundary:
+            result += self.archive.read(query, start_time, min(end_time, boundary - 1), vars)
+        if end_time >= boundary:
+            # Rows from before the boundary can still be here while they are
+            # being moved out, they are already counted from the archive.
+            result += self._execute_multiple_read_query(
+                query, (max(start_time, boundary), end_time) + vars) or []
+        return result
+
+    def get_all_actions(self, guild_id: int, start_time: int, end_time: int,
                         moderator_id: int) -> list[Action]:
         """Returns a list of all action sent by the given moderator in the given timeframe.
 
         Args:
+            guild_id (int): The id of the guild.
             start_time (int): Beginning of the timeframe (unix timestamp).
             end_time (int): End of the timeframe (unix timestamp).
             moderator_id (int): Id of the given moderator.
@@ -427,35 +891,25 @@ class DBHandler():
         Returns:
             list[Action]: A list containing Action objects.
         """
-        action_get_query = """
-        SELECT * FROM actions
+        action_get_query = f"""
+        SELECT {ACTION_COLUMNS} FROM actions
         WHERE
             "timestamp"
         BETWEEN
             ?
         AND
             ?
+        AND
+            "guild_id" = ?
         AND
             "mod_id" = ?
         """
-        result = list(self._execute_multiple_read_query(
-            action_get_query,
-            (start_time, end_time, moderator_id,)))
-        result_list = []
-
-        if result:
-            result = [list(entry) for entry in result]
-            message_ids = [m.pop(2) for m in result]
-            for i in range(0, len(result)):
-                result_list.append(
-                    Action(
-                        *result[i],
-                        message_id=message_ids[i]))
-
-        return result_list
+        return self._to_actions(self._read_actions(
+            action_get_query, start_time, end_time, (guild_id, moderator_id,)))
 
     def get_all_actions_of_type(
             self,
+            guild_id: int,
             start_time: int,
             end_time: int,
             moderator_id: int,
@@ -463,6 +917,7 @@ class DBHandler():
         """Returns a list of of all actions with the specified type by the given moderator in the given timeframe
 
         Args:
+            guild_id (int): The id of the guild.
             start_time (int): Beginning of the timeframe (unix timestamp).
             end_time (int): End of the timeframe (unix timestamp).
             moderator_id (int): Id of the given moderator.
@@ -471,41 +926,34 @@ class DBHandler():
         Returns:
             list[Action]: A list containing all Action objects of the given type.
         """
+        if type not in ACTION_TYPES:
+            return []
 
-        action_get_query = """
-        SELECT * FROM actions
+        action_get_query = f"""
+        SELECT {ACTION_COLUMNS} FROM actions
         WHERE "timestamp"
         BETWEEN
             ?
         AND
             ?
+        AND
+            "guild_id" = ?
         AND
             "mod_id" = ?
         AND
             "type" = ?"""
 
-        result = list(self._execute_multiple_read_query(
-            action_get_query, (start_time, end_time, moderator_id, type,)))
-        result_list = []
-
-        if result:
-            result = [list(entry) for entry in result]
-            message_ids = [m.pop(2) for m in result]
-            for i in range(0, len(result)):
-                if result[i][1] == type:
-                    result_list.append(
-                        Action(
-                            *result[i],
-                            message_id=message_ids[i]))
-
-        return result_list
+        return self._to_actions(self._read_actions(
+            action_get_query, start_time, end_time,
+            (guild_id, moderator_id, ACTION_TYPES.index(type),)))
 
     def get_amount_of_actions_by_type(
-            self, start_time: int, end_time: int, moderator_id: int) -> tuple[int, int, int]:
+            self, guild_id: int, start_time: int, end_time: int, moderator_id: int) -> tuple[int, int, int]:
         """Returns a tuple containing the amount of sent, edited and deleted messages by the given moderator in the given timeframe.
         Format is always (sent, edited, deleted)
 
         Args:
+            guild_id (int): The id of the guild.
             start_time (int): Beginning of the timeframe (unix timestamp).
             end_time (int): End of the timeframe (unix timestamp).
             moderator_id (int): Id of the given moderator.
@@ -513,67 +961,318 @@ class DBHandler():
         Returns:
             tuple[int, int, int]: A tuple containg the amount of hits for each category.
         """
-        return (
+        key = (guild_id, moderator_id)
+        cached = self.stats_cache.get(key, start_time, end_time)
+        if cached is not None:
+            return cached
+
+        # Read before querying, so an action recorded while we count makes
+        # the stored result stale instead of silently missing from it.
+        watermark = self.stats_cache.watermark(key)
+        counts = (
             len(
                 self.get_all_actions_of_type(
-                    start_time, end_time, moderator_id, "sent")),
+                    guild_id, start_time, end_time, moderator_id, "sent")),
             len(
                 self.get_all_actions_of_type(
-                    start_time, end_time, moderator_id, "edited")),
+                    guild_id, start_time, end_time, moderator_id, "edited")),
             len(
                 self.get_all_actions_of_type(
-                    start_time, end_time, moderator_id, "deleted")))
+                    guild_id, start_time, end_time, moderator_id, "deleted")))
+        self.stats_cache.put(
+            key, start_time, end_time, counts, watermark)
+        return counts
+
+    def _moderator_ids(self, guild_id: int) -> list[int]:
+        """Returns the ids of every moderator of a guild, active or not. Every
+        action of the guild belongs to one of them."""
+        if self._cached(guild_id):
+            return list(self._moderators.get(guild_id, {}))
+        return [row[0] for row in self._execute_multiple_read_query(
+            "SELECT user_id FROM moderators WHERE guild_id = ?;", (guild_id,)) or []]
+
+    def get_amount_of_actions_per_moderator(
+            self, guild_id: int, start_time: int, end_time: int) -> dict[int, tuple[int, int, int]]:
+        """Returns the amount of sent, edited and deleted messages of every moderator of a guild in the given timeframe, counted in a single query.
+        Format is always (sent, edited, deleted)
+
+        Args:
+            guild_id (int): The id of the guild.
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+
+        Returns:
+            dict[int, tuple[int, int, int]]: The counts per moderator id. Moderators without any actions are left out.
+        """
+        # Seeks to each moderator's range like get_action_columns() does.
+        action_count_query = """
+        SELECT mod_id, type, COUNT(*) FROM actions
+        WHERE
+            "timestamp"
+        BETWEEN
+            ?
+        AND
+            ?
+        AND
+            "guild_id" = ?
+        AND
+            "mod_id" IN (SELECT value FROM json_each(?))
+        GROUP BY
+            mod_id, type
+        """
+        result = self._read_actions(action_count_query, start_time, end_time,
+                                    (guild_id, json.dumps(self._moderator_ids(guild_id))))
+
+        counts: dict[int, list[int]] = {}
+        # Hot and archived months come back as separate rows, add them up.
+        for mod_id, type, amount in result:
+            counts.setdefault(mod_id, [0, 0, 0])[type] += amount
+        return {mod_id: tuple(amounts) for mod_id, amounts in counts.items()}
+
+    def get_action_columns(self, guild_id: int, start_time: int, end_time: int,
+                           moderator_ids: list[int] = None) -> list[tuple[int, int, int, int]]:
+        """Returns the bare facts of every action of a guild in the given
+        timeframe, for analytics.py to turn into arrays. Types are returned as
+        their code, the index into ACTION_TYPES.
+
+        Args:
+            guild_id (int): The id of the guild.
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            moderator_ids (list[int], optional): Only return the actions of these moderators. Defaults to None, every moderator.
+
+        Returns:
+            list[tuple[int, int, int, int]]: (id, timestamp, mod_id, type code) of every action, in no particular order.
+        """
+        if moderator_ids is None:
+            moderator_ids = self._moderator_ids(guild_id)
+        # Naming the moderators lets sqlite seek to each one's range in the
+        # primary key, instead of reading the whole guild for a short range.
+        action_columns_query = """
+        SELECT id, timestamp, mod_id, type FROM actions
+        WHERE
+            "timestamp"
+        BETWEEN
+            ?
+        AND
+            ?
+        AND
+            "guild_id" = ?
+        AND
+            "mod_id" IN (SELECT value FROM json_each(?))
+        """
+        return self._read_actions(
+            action_columns_query, start_time, end_time, (guild_id, json.dumps(moderator_ids),))
+
+    def count_actions(self, guild_id: int, start_time: int, end_time: int) -> int:
+        """Returns the amount of actions of a guild in the given timeframe,
+        the archived ones included.
+
+        Args:
+            guild_id (int): The id of the guild.
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+
+        Returns:
+            int: The amount of actions.
+        """
+        action_count_query = """
+        SELECT COUNT(*) FROM actions
+        WHERE
+            "timestamp"
+        BETWEEN
+            ?
+        AND
+            ?
+        AND
+            "guild_id" = ?
+        AND
+            "mod_id" IN (SELECT value FROM json_each(?))
+        """
+        return sum(count for count, in self._read_actions(
+            action_count_query, start_time, end_time,
+            (guild_id, json.dumps(self._moderator_ids(guild_id)),)))
+
+
+# ------------------------- ARCHIVE HANDLING --------------------------
+
+    def archive_actions(self, cutoff: int, batch: int = 5000) -> int:
+        """Moves the actions of every month that ended before the cutoff into
+        the monthly archive databases, and gives the freed space back.
+
+        Each month is copied into its own file first and only removed from
+        the actions table (in small batches, so other writes get a turn)
+        once the file is complete. Reads switch over to the file as soon as
+        it exists, so no action is ever missing or counted twice.
+
+        Args:
+            cutoff (int): Actions from months that ended before this unix timestamp get archived.
+            batch (int, optional): The amount of rows to remove per transaction. Defaults to 5000.
+
+        Returns:
+            int: The amount of actions that were moved.
+        """
+        if self.archive is None:
+            return 0
+        os.makedirs(self.archive.directory, exist_ok=True)
+        # A connection of our own, so attaching the archive files doesn't
+        # show up on connections other code is using.
+        connection = sqlite3.connect(self.path)
+        moved = 0
+        try:
+            oldest = connection.execute("SELECT MIN(timestamp) FROM actions;").fetchone()[0]
+            if oldest is None:
+                return 0
+            year, month = month_of(max(oldest, self.archive.boundary))
+            while month_start(*next_month(year, month)) <= cutoff:
+                moved += self._archive_month(connection, year, month)
+                year, month = next_month(year, month)
+
+            # Rows that are archived already, including leftovers from a move
+            # that was interrupted.
+            while moved or oldest < self.archive.boundary:
+                cursor = connection.execute(
+                    """DELETE FROM actions WHERE (guild_id, mod_id, timestamp, id) IN
+                    (SELECT guild_id, mod_id, timestamp, id FROM actions WHERE timestamp < ? LIMIT ?);""",
+                    (self.archive.boundary, batch))
+                connection.commit()
+                if cursor.rowcount < batch:
+                    break
+
+            # A few pages at a time, every call is a write transaction. The
+            # pragma frees one page per step, executescript() steps it to the
+            # end where execute() would stop after the first.
+            freed = connection.execute("PRAGMA freelist_count;").fetchone()[0]
+            if connection.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2:
+                while connection.execute("PRAGMA freelist_count;").fetchone()[0]:
+                    connection.executescript("PRAGMA incremental_vacuum(1000);")
+        finally:
+            connection.close()
+
+        if moved:
+            logger.info("archived %d actions from before %s, freed %d pages",
+                        moved, self.archive.boundary, freed)
+        return moved
+
+    def _archive_month(self, connection: sqlite3.Connection, year: int, month: int) -> int:
+        """Copies the actions of one month into its archive file.
+
+        Args:
+            connection (sqlite3.Connection): The connection to copy with.
+            year (int): The year of the month.
+            month (int): The month.
+
+        Returns:
+            int: The amount of actions that were copied.
+        """
+        start, end = month_start(year, month), month_start(*next_month(year, month))
+        path = self.archive.path(year, month)
+        partial = path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+
+        connection.execute("ATTACH DATABASE ? AS archive;", (partial,))
+        try:
+            connection.execute(ACTIONS_TABLE_QUERY.format(schema="archive."))
+            connection.execute(f"PRAGMA archive.user_version = {SCHEMA_VERSION};")
+            copied = connection.execute(
+                f"""INSERT INTO archive.actions ({ACTION_COLUMNS})
+                SELECT {ACTION_COLUMNS} FROM main.actions
+                WHERE timestamp >= ? AND timestamp < ?;""", (start, end)).rowcount
+            connection.commit()
+        finally:
+            connection.execute("DETACH DATABASE archive;")
+
+        if copied:
+            os.replace(partial, path)
+            self.archive.add(year, month)
+        else:
+            os.remove(partial)
+        return copied
 
 
 # ---------------------- VACATION WEEK HANDLING -----------------------
 
-    def add_vacation_week(self, moderator_id: int, date: str) -> None:
+    def add_vacation_week(self, guild_id: int, moderator_id: int, date: str) -> None:
         """Adds a new action to the object's database.
 
         Args:
+            guild_id (int): The id of the guild the moderator is in.
             moderator_id (int): Discord ID of the moderator to bind the vacation to.
             date (str): The week that is being taken as vacation, format "YYYY-WW".
         """
         vacation_week_add_query = """
         INSERT INTO
-            vacation_weeks (date, mod_id)
+            vacation_weeks (date, mod_id, guild_id)
         VALUES
-            (?,?);
+            (?, ?, ?);
         """
-        self._execute_query(vacation_week_add_query, (date, moderator_id,))
+        self._execute_query(vacation_week_add_query, (date, moderator_id, guild_id,))
+        self._refresh_cached_vacation_weeks(guild_id, moderator_id)
 
-    def remove_vacation_week(self, user_id: int, date: str) -> None:
+    def remove_vacation_week(self, guild_id: int, user_id: int, date: str) -> None:
         """Remove an action from the object's database given a user_id and date.
 
         Args:
+            guild_id (int): The id of the guild the moderator is in.
             user_id (int): Discord ID of the moderator to bind the vacation to.
             date (str): The week that of the vacation, format "YYYY-WW".
         """
         vacation_week_remove_query = """
         DELETE FROM vacation_weeks
         WHERE
-            date = ?
+            guild_id = ?
         AND
             mod_id = ?
+        AND
+            date = ?
         """
-        self._execute_query(vacation_week_remove_query, (date, user_id,))
+        self._execute_query(vacation_week_remove_query, (guild_id, user_id, date,))
+        self._refresh_cached_vacation_weeks(guild_id, user_id)
+
+    def _refresh_cached_vacation_weeks(self, guild_id: int, user_id: int) -> None:
+        """Re-reads the vacation weeks of one moderator after a write, if the
+        cache is in use.
 
-    def get_all_vacation_weeks(self, user_id: int) -> list[VacationWeek]:
+        Args:
+            guild_id (int): The id of the guild the moderator is in.
+            user_id (int): Discord ID of the moderator whose vacation changed.
+        """
+        if not self._cached(guild_id):
+            return
+        with self._cache_lock:
+            rows = self._execute_multiple_read_query(
+                "SELECT date FROM vacation_weeks WHERE guild_id = ? AND mod_id = ?",
+                (guild_id, user_id)) or []
+            weeks = {**self._vacation_weeks.get(guild_id, {}), user_id: {row[0] for row in rows}}
+            self._vacation_weeks = {**self._vacation_weeks, guild_id: weeks}
+
+    def _cached_vacation_weeks(self, guild_id: int, user_id: int) -> set[str]:
+        return self._vacation_weeks.get(guild_id, {}).get(user_id, set())
+
+    def get_all_vacation_weeks(self, guild_id: int, user_id: int) -> list[VacationWeek]:
         """Returns a list of all vacation weeks in the object's database.
 
         Args:
+            guild_id (int): The id of the guild the moderator is in.
             user_id (int): Discord ID of the moderator to get the vacation from.
 
         Returns:
             list[VacationWeek]: List of all vacation weeks for the given user.
         """
+        if self._cached(guild_id):
+            return [VacationWeek(date, user_id, guild_id)
+                    for date in sorted(self._cached_vacation_weeks(guild_id, user_id))]
+
         vacation_week_get_query = """
         SELECT * FROM vacation_weeks
         WHERE
+            guild_id = ?
+        AND
             mod_id = ?
         """
         result = self._execute_multiple_read_query(
-            vacation_week_get_query, (user_id,))
+            vacation_week_get_query, (guild_id, user_id,))
 
         if result:
             return [VacationWeek(*week) for week in result]
@@ -581,12 +1280,14 @@ class DBHandler():
 
     def get_all_vacation_weeks_during_period(
             self,
+            guild_id: int,
             user_id: int,
             start_date: str,
             end_date: str) -> list[VacationWeek]:
         """Returns a list of all vacation weeks during a period in the object's database given a user_id and the time frame.
 
         Args:
+            guild_id (int): The id of the guild the moderator is in.
             user_id (int): Discord ID of the moderator to get the vacation from.
             start_date (str): Beginning of the timeframe (format "YYYY-MM").
             end_date (str): End of the timeframe (format "YYYY-MM").
@@ -594,70 +1295,91 @@ class DBHandler():
         Returns:
             list[VacationWeek]: List of all vacation weeks for the given user during the given time period.
         """
+        if self._cached(guild_id):
+            return [VacationWeek(date, user_id, guild_id)
+                    for date in sorted(self._cached_vacation_weeks(guild_id, user_id))
+                    if start_date <= date <= end_date]
+
         vacation_week_get_query = """
         SELECT * FROM vacation_weeks
         WHERE
+            "guild_id" = ?
+        AND
+            "mod_id" = ?
+        AND
             date
         BETWEEN
             ?
         AND
             ?
-        AND
-            "mod_id" = ?
         """
         result = self._execute_multiple_read_query(
             vacation_week_get_query,
-            (start_date,
-             end_date,
-             user_id,))
+            (guild_id,
+             user_id,
+             start_date,
+             end_date,))
         if result:
             return [VacationWeek(*w) for w in result]
         return []
 
-    def is_vacation_week(self, user_id: int, date: str) -> bool:
+    def is_vacation_week(self, guild_id: int, user_id: int, date: str) -> bool:
         """Checks if a given user has taken the given week as vacation.
 
         Args:
+            guild_id (int): The id of the guild the moderator is in.
             user_id (int): Discord ID of the moderator the check vacation for.
             date (str): The week of the vacation to check, format "YYYY-WW".
 
         Returns:
             bool: If the given week was vacation for the given user.
         """
+        if self._cached(guild_id):
+            return date in self._cached_vacation_weeks(guild_id, user_id)
+
         vacation_week_check_query = """
         SELECT * FROM vacation_weeks
         WHERE
+            guild_id = ?
+        AND
             mod_id = ?
         AND
             date = ?
         """
         if self._execute_read_query(
-                vacation_week_check_query, (user_id, date,)):
+                vacation_week_check_query, (guild_id, user_id, date,)):
             return True
         return False
 
-    def amount_of_vacation_weeks(self, user_id: int) -> int:
+    def amount_of_vacation_weeks(self, guild_id: int, user_id: int) -> int:
         """Returns the number of total vacation weeks a user has taken.
 
         Args:
+            guild_id (int): The id of the guild the moderator is in.
             user_id (int): Discord ID of the moderator to count vacation weeks for.
 
         Returns:
             int: The amount of total vacation weeks.
         """
+        if self._cached(guild_id):
+            return len(self._cached_vacation_weeks(guild_id, user_id))
+
         vacation_week_count_query = """
         SELECT * FROM vacation_weeks
         WHERE
+            guild_id = ?
+        AND
             mod_id = ?
         """
         return len(self._execute_multiple_read_query(
-            vacation_week_count_query, (user_id,)))
+            vacation_week_count_query, (guild_id, user_id,)))
 
     def amount_of_vacation_weeks_during_period(
-            self, user_id: int, start_date: str, end_date: str) -> int:
+            self, guild_id: int, user_id: int, start_date: str, end_date: str) -> int:
         """Returns the number of vacation weeks a user has taken between the given dates.
 
         Args:
+            guild_id (int): The id of the guild the moderator is in.
             user_id (int): Discord ID of the moderator to count vacation weeks for.
             start_date (str): The beginning of the time period to check. Format "YYYY-WW".
             end_date (str): The end of the time period to check (inclusive). Format "YYYY-WW".
@@ -665,19 +1387,25 @@ class DBHandler():
         Returns:
             int: The amount of vacation weeks during the period.
         """
+        if self._cached(guild_id):
+            return len(self.get_all_vacation_weeks_during_period(
+                guild_id, user_id, start_date, end_date))
+
         vacation_week_count_query = """
         SELECT * FROM vacation_weeks
         WHERE
+            "guild_id" = ?
+        AND
+            "mod_id" = ?
+        AND
             date
         BETWEEN
             ?
         AND
             ?
-        AND
-            "mod_id" = ?
         """
         return len(self._execute_multiple_read_query(
-            vacation_week_count_query, (start_date, end_date, user_id,)))
+            vacation_week_count_query, (guild_id, user_id, start_date, end_date,)))
 
 
 # -------------------------- CONFIG HANDLING --------------------------
@@ -715,6 +1443,7 @@ class DBHandler():
                                 time_between_checks,
                                 member_count_channel_id,
                              ))
+        self._refresh_cached_row("_guilds", "config", "guild_id", guild_id)
 
     def set_mod_category_id(self, guild_id: int, mod_category_id: int) -> None:
         """Sets the mod category ID in the given guild to the given value.
@@ -732,6 +1461,7 @@ class DBHandler():
         """
         self._execute_query(mod_category_id_edit_query,
                             (mod_category_id, guild_id,))
+        self._refresh_cached_row("_guilds", "config", "guild_id", guild_id)
 
     def set_last_mod_check(self, guild_id: int, last_mod_check: int) -> None:
         """Sets the last_mod_check timestamp in the given guild to the given value.
@@ -749,6 +1479,7 @@ class DBHandler():
         """
         self._execute_query(last_mod_check_edit_query,
                             (last_mod_check, guild_id,))
+        self._refresh_cached_row("_guilds", "config", "guild_id", guild_id)
 
     def set_time_between_checks(
             self,
@@ -769,6 +1500,7 @@ class DBHandler():
         """
         self._execute_query(time_between_checks_edit_query,
                             (time_between_checks, guild_id,))
+        self._refresh_cached_row("_guilds", "config", "guild_id", guild_id)
 
     def set_default_quotas(self, guild_id: int,
                            default_quotas: tuple[int, int, int]) -> None:
@@ -787,6 +1519,7 @@ class DBHandler():
         """
         self._execute_query(default_quotas_edit_query,
                             (",".join(map(str, default_quotas)), guild_id,))
+        self._refresh_cached_row("_guilds", "config", "guild_id", guild_id)
 
     def set_member_count_channel_id(
             self,
@@ -801,6 +1534,25 @@ class DBHandler():
         """
         self._execute_query(member_count_channel_id_edit_query,
                             (member_count_channel_id, guild_id,))
+        self._refresh_cached_row("_guilds", "config", "guild_id", guild_id)
+
+    def set_alert_channel_id(self, guild_id: int, alert_channel_id: int | None) -> None:
+        """Sets the channel that activity alerts are posted in.
+
+        Args:
+            guild_id (int): The id of the guild to update the value for.
+            alert_channel_id (int | None): The id of the channel, None turns the alerts off.
+        """
+        alert_channel_id_edit_query = """
+        UPDATE config
+        SET
+            alert_channel_id = ?
+        WHERE
+            guild_id = ?
+        """
+        self._execute_query(alert_channel_id_edit_query,
+                            (alert_channel_id, guild_id,))
+        self._refresh_cached_row("_guilds", "config", "guild_id", guild_id)
 
     def get_guild(self, guild_id: int) -> Guild:
         """Gets a guild given it's id.
@@ -811,6 +1563,10 @@ class DBHandler():
         Returns:
             Guild: A Guild option with all the config info from the guild.
         """
+        if self._cached(guild_id):
+            result = self._guilds.get(guild_id)
+            return Guild(*result) if result else None
+
         guild_get_query = """
         SELECT * FROM config
         WHERE
@@ -827,6 +1583,10 @@ class DBHandler():
         Returns:
             list[Guild]: A list of all guilds in the database as Guild objects.
         """
+        # With a guild filter the cache only holds the local guilds.
+        if self.cache_ready and self.owns_guild is None:
+            return [Guild(*guild) for guild in self._guilds.values()]
+
         guild_get_query = """
         SELECT * FROM config
         """
@@ -836,58 +1596,456 @@ class DBHandler():
         return []
 
 
+# --------------------------- JOB HANDLING ----------------------------
+
+    def add_job(self, name: str, guild_id: int, interval: int, next_run: int) -> None:
+        """Adds the timer for a scheduled job, if it doesn't exist yet.
+
+        Args:
+            name (str): Name of the job.
+            guild_id (int): The guild the job runs for, 0 for jobs that aren't tied to a guild.
+            interval (int): Amount of seconds between runs.
+            next_run (int): Unix timestamp of the first run.
+        """
+        job_add_query = """
+        INSERT OR IGNORE INTO
+            jobs (name, guild_id, interval, next_run)
+        VALUES
+            (?, ?, ?, ?);
+        """
+        self._execute_query(job_add_query, (name, guild_id, interval, next_run,))
+
+    def set_job_schedule(self, name: str, guild_id: int,
+                         interval: int, next_run: int) -> None:
+        """Changes when a scheduled job runs.
+
+        Args:
+            name (str): Name of the job.
+            guild_id (int): The guild the job runs for.
+            interval (int): The new amount of seconds between runs.
+            next_run (int): Unix timestamp of the next run.
+        """
+        job_edit_query = """
+        UPDATE jobs
+        SET
+            interval = ?,
+            next_run = ?
+        WHERE
+            name = ?
+        AND
+            guild_id = ?
+        """
+        self._execute_query(job_edit_query, (interval, next_run, name, guild_id,))
+
+    def record_job_run(self, name: str, guild_id: int, last_run: int,
+                       duration_ms: float, error: str | None, next_run: int) -> None:
+        """Stores the outcome of a run of a scheduled job and when it runs next.
+
+        Args:
+            name (str): Name of the job.
+            guild_id (int): The guild the job ran for.
+            last_run (int): Unix timestamp of when the run started.
+            duration_ms (float): How long the run took, in milliseconds.
+            error (str | None): The error if the run failed, None otherwise.
+            next_run (int): Unix timestamp of the next run.
+        """
+        job_run_query = """
+        UPDATE jobs
+        SET
+            last_run = ?,
+            last_duration_ms = ?,
+            last_error = ?,
+            next_run = ?
+        WHERE
+            name = ?
+        AND
+            guild_id = ?
+        """
+        self._execute_query(job_run_query,
+                            (last_run, duration_ms, error, next_run, name, guild_id,))
+
+    def remove_job(self, name: str, guild_id: int) -> None:
+        """Removes the timer of a scheduled job.
+
+        Args:
+            name (str): Name of the job.
+            guild_id (int): The guild the job runs for.
+        """
+        job_remove_query = "DELETE FROM jobs WHERE name = ? AND guild_id = ?"
+        self._execute_query(job_remove_query, (name, guild_id,))
+
+    def get_all_jobs(self) -> list[ScheduledJob]:
+        """Returns the timers of all scheduled jobs.
+
+        Returns:
+            list[ScheduledJob]: A list of all jobs, ordered by their next run.
+        """
+        job_get_query = """
+        SELECT * FROM jobs
+        ORDER BY next_run
+        """
+        result = self._execute_multiple_read_query(job_get_query)
+        if result:
+            return [ScheduledJob(*job) for job in result]
+        return []
+
+
+# -------------------------- SCHEMA HANDLING --------------------------
+
+    def create_tables(self) -> None:
+        """Creates all the tables the bot needs, if they don't exist yet."""
+        self._enable_incremental_vacuum()
+        self._migrate()
+
+        self._execute_query(STICKIES_TABLE_QUERY)
+        self._execute_query(MODERATORS_TABLE_QUERY)
+        self._execute_query(ACTIONS_TABLE_QUERY.format(schema=""))
+        self._execute_query(VACATION_WEEKS_TABLE_QUERY)
+
+        config_table_query = """
+        CREATE TABLE IF NOT EXISTS config (
+            "guild_id" INTEGER PRIMARY KEY,
+            "mod_category_id" INTEGER,
+            "last_mod_check" INTEGER,
+            "time_between_checks" INTEGER,
+            "default_quotas" TEXT NOT NULL,
+            "member_count_channel_id" INTEGER,
+            "alert_channel_id" INTEGER
+        );"""
+        self._execute_query(config_table_query)
+
+        jobs_table_query = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            "name" TEXT NOT NULL,
+            "guild_id" INTEGER NOT NULL,
+            "interval" INTEGER NOT NULL,
+            "next_run" INTEGER NOT NULL,
+            "last_run" INTEGER,
+            "last_duration_ms" REAL,
+            "last_error" TEXT,
+            PRIMARY KEY (name, guild_id)
+        );"""
+        self._execute_query(jobs_table_query)
+
+    def _migrate(self) -> None:
+        """Brings a database made by an older version of the bot up to the
+        current layout. The layout version is kept in PRAGMA user_version,
+        the monthly archives each track their own."""
+        version = self._execute_read_query("PRAGMA user_version;")[0]
+        tables = {row[0] for row in self._execute_multiple_read_query(
+            "SELECT name FROM sqlite_master WHERE type = 'table';") or []}
+        if version < 2 and "config" in tables:
+            logger.info("adding alert_channel_id to the config table")
+            self._execute_query("ALTER TABLE config ADD COLUMN alert_channel_id INTEGER;")
+
+        # Before version 3 the tables had no guild_id. With a single guild
+        # in the config everything is that guild's, otherwise the rows wait
+        # in UNASSIGNED_GUILD until assign_unowned_rows() can tell by channel.
+        guilds = self._execute_multiple_read_query(
+            "SELECT guild_id FROM config;") if "config" in tables else []
+        owner = guilds[0][0] if len(guilds) == 1 else UNASSIGNED_GUILD
+        if version < 3 and tables & {"moderators", "stickies", "vacation_weeks", "actions"}:
+            self._rebuild_tables(self.connection, "the database", tables, version, owner)
+        self._execute_query(f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+        for year, month in self.archive.months if self.archive else []:
+            connection = sqlite3.connect(self.archive.path(year, month))
+            try:
+                archive_version = connection.execute("PRAGMA user_version;").fetchone()[0]
+                if archive_version < 3:
+                    self._rebuild_tables(connection, f"archive {year:04d}-{month:02d}",
+                                         {"actions"}, archive_version, owner)
+                    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+                    connection.execute("VACUUM;")
+            finally:
+                connection.close()
+
+    def _rebuild_tables(self, connection: sqlite3.Connection, name: str, tables: set[str],
+                        version: int, owner: int) -> None:
+        """Moves the moderators, stickies, vacation_weeks and actions tables
+        from an older layout to the current one, in one transaction. Every
+        row gets the given guild, action ids are kept.
+
+        Args:
+            connection (sqlite3.Connection): The connection to the database that holds the tables.
+            name (str): What to call the database in the logs.
+            tables (set[str]): The tables that exist in the database.
+            version (int): The layout version of the database.
+            owner (int): The guild id to give every row.
+        """
+        if version < 1:
+            # Types were stored as text, with a rowid and AUTOINCREMENT.
+            action_type = "CASE type WHEN 'sent' THEN 0 WHEN 'edited' THEN 1 ELSE 2 END"
+            known_types = "WHERE type IN ('sent', 'edited', 'deleted')"
+        else:
+            action_type, known_types = "type", ""
+        rebuilds = {
+            "moderators": (MODERATORS_TABLE_QUERY, """
+            INSERT INTO moderators
+            SELECT user_id, send_quota, edit_quota, delete_quota,
+                consecutive_completed_weeks, vacation_days, active, ?
+            FROM moderators_old;"""),
+            "stickies": (STICKIES_TABLE_QUERY, """
+            INSERT INTO stickies
+            SELECT channel_id, message_id, title, description, ?
+            FROM stickies_old;"""),
+            "vacation_weeks": (VACATION_WEEKS_TABLE_QUERY, """
+            INSERT OR IGNORE INTO vacation_weeks
+            SELECT date, mod_id, ?
+            FROM vacation_weeks_old;"""),
+            "actions": (ACTIONS_TABLE_QUERY.format(schema=""), f"""
+            INSERT INTO actions
+            SELECT ?, mod_id, timestamp, id, {action_type}, channel_id, message_id
+            FROM actions_old
+            {known_types}
+            ORDER BY mod_id, timestamp, id;"""),
+        }
+        rebuilds = {table: queries for table, queries in rebuilds.items() if table in tables}
+
+        logger.info("migrating %s to the guild partitioned layout", name)
+        start = time.perf_counter()
+        # The tables point at each other, renaming one mustn't rewrite the
+        # references in the others and the rows can't be checked until all
+        # of them are copied.
+        connection.execute("PRAGMA foreign_keys = OFF;")
+        connection.execute("PRAGMA legacy_alter_table = ON;")
+        connection.execute("BEGIN;")
+        try:
+            for table, (create_query, _) in rebuilds.items():
+                connection.execute(f"ALTER TABLE {table} RENAME TO {table}_old;")
+                connection.execute(create_query)
+            copied = {}
+            for table, (_, copy_query) in rebuilds.items():
+                copied[table] = connection.execute(copy_query, (owner,)).rowcount
+            skipped = {table: connection.execute(
+                f"SELECT COUNT(*) FROM {table}_old;").fetchone()[0] - copied[table]
+                for table in rebuilds}
+            for table in rebuilds:
+                connection.execute(f"DROP TABLE {table}_old;")
+            connection.commit()
+        except Error:
+            connection.rollback()
+            raise
+        finally:
+            connection.execute("PRAGMA legacy_alter_table = OFF;")
+            connection.execute("PRAGMA foreign_keys = ON;")
+        if skipped.get("actions"):
+            # These never loaded into an Action anyway.
+            logger.warning("dropped %d actions with an unknown type", skipped["actions"])
+        if skipped.get("vacation_weeks"):
+            logger.warning("dropped %d duplicate vacation weeks", skipped["vacation_weeks"])
+        # The old tables' pages are free now, give them back (see archive_actions()).
+        connection.executescript("PRAGMA incremental_vacuum;")
+        logger.info("migrated %s in %.0f ms", ", ".join(
+            f"{count} {table}" for table, count in copied.items()),
+            (time.perf_counter() - start) * 1000)
+
+    def assign_unowned_rows(self, channel_guilds: dict[int, int]) -> int:
+        """Hands the rows the migration couldn't give a guild (see _migrate())
+        to their guild, now that it's known which guild every channel is in.
+        Actions and stickies go to the guild of their channel. Moderators are
+        copied into every guild they have actions in and take their vacation
+        weeks along. Rows of channels that aren't in the map stay unassigned.
+        Blocks, call it from a worker thread.
+
+        Args:
+            channel_guilds (dict[int, int]): The guild id of every channel id the bot can see.
+
+        Returns:
+            int: The amount of actions and stickies that were assigned.
+        """
+        # A connection of our own for the temporary table and the transaction.
+        connection = self._connect()
+        try:
+            if not connection.execute(
+                    """SELECT EXISTS (SELECT 1 FROM moderators WHERE guild_id = ?)
+                    OR EXISTS (SELECT 1 FROM stickies WHERE guild_id = ?);""",
+                    (UNASSIGNED_GUILD, UNASSIGNED_GUILD)).fetchone()[0]:
+                return 0
+            start = time.perf_counter()
+            archives = [self.archive.path(year, month) for year, month in self.archive.months] \
+                if self.archive else []
+
+            # The guilds every moderator acted in, archived actions included.
+            memberships = set()
+            for path in [None] + archives:
+                rows = self._unowned_action_channels(connection, path)
+                memberships.update((mod_id, channel_guilds[channel_id])
+                                   for mod_id, channel_id in rows if channel_id in channel_guilds)
+
+            connection.execute("BEGIN;")
+            try:
+                connection.executemany(
+                    """INSERT OR IGNORE INTO moderators
+                    SELECT user_id, send_quota, edit_quota, delete_quota,
+                        consecutive_completed_weeks, vacation_days, active, ?
+                    FROM moderators WHERE guild_id = ? AND user_id = ?;""",
+                    [(guild_id, UNASSIGNED_GUILD, mod_id) for mod_id, guild_id in memberships])
+                connection.executemany(
+                    """INSERT OR IGNORE INTO vacation_weeks
+                    SELECT date, mod_id, ? FROM vacation_weeks WHERE guild_id = ? AND mod_id = ?;""",
+                    [(guild_id, UNASSIGNED_GUILD, mod_id) for mod_id, guild_id in memberships])
+                assigned = self._assign_by_channel(connection, "actions", channel_guilds)
+                assigned += self._assign_by_channel(connection, "stickies", channel_guilds)
+                connection.commit()
+            except Error:
+                connection.rollback()
+                raise
+
+            for path in archives:
+                archive = sqlite3.connect(path)
+                try:
+                    assigned += self._assign_by_channel(archive, "actions", channel_guilds)
+                    archive.commit()
+                finally:
+                    archive.close()
+
+            # Moderators that are in their guilds now, and have nothing
+            # unassigned left anywhere, don't need the unassigned copy.
+            left = set()
+            for path in [None] + archives:
+                left.update(mod_id for mod_id, _ in self._unowned_action_channels(connection, path))
+            done = [(UNASSIGNED_GUILD, mod_id) for mod_id in {mod_id for mod_id, _ in memberships} - left]
+            connection.executemany(
+                "DELETE FROM vacation_weeks WHERE guild_id = ? AND mod_id = ?;", done)
+            connection.executemany(
+                "DELETE FROM moderators WHERE guild_id = ? AND user_id = ?;", done)
+            connection.commit()
+
+            # The caches are rebuilt from the new rows in one go, the main
+            # connection belongs to another thread.
+            connection.execute("BEGIN;")
+            try:
+                self._fill_caches({table: connection.execute(f"SELECT * FROM {table};").fetchall()
+                                   for table in ("config", "moderators", "stickies", "vacation_weeks")})
+            finally:
+                connection.commit()
+            self.stats_cache.clear()
+
+            unassigned = connection.execute(
+                """SELECT (SELECT COUNT(*) FROM moderators WHERE guild_id = ?),
+                (SELECT COUNT(*) FROM stickies WHERE guild_id = ?);""",
+                (UNASSIGNED_GUILD, UNASSIGNED_GUILD)).fetchone()
+        finally:
+            connection.close()
+
+        logger.info("assigned %d actions and stickies to %d guilds in %.0f ms",
+                    assigned, len({guild_id for _, guild_id in memberships}),
+                    (time.perf_counter() - start) * 1000)
+        if any(unassigned):
+            logger.warning("%d moderators and %d stickies are still unassigned: moderators "
+                           "without actions in a channel of the bot's guilds are kept until "
+                           "they are registered again in their guild, stickies belong to "
+                           "channels the bot can no longer see", *unassigned)
+        return assigned
+
+    def _claim_unassigned_moderator(
+            self, guild_id: int, user_id: int, quotas: tuple[int, int, int]) -> bool:
+        """Moves a moderator the migration couldn't place into the given guild,
+        their vacation weeks included. The unassigned copy stays while it
+        still has unassigned actions.
+
+        Args:
+            guild_id (int): The id of the guild that claims the moderator.
+            user_id (int): Discord id of the moderator.
+            quotas (tuple[int, int, int]): The new weekly quotas of the moderator.
+
+        Returns:
+            bool: Whether there was an unassigned moderator to claim.
+        """
+        if guild_id == UNASSIGNED_GUILD or not self._execute_read_query(
+                "SELECT 1 FROM moderators WHERE guild_id = ? AND user_id = ?;",
+                (UNASSIGNED_GUILD, user_id)):
+            return False
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN;")
+            try:
+                claimed = connection.execute(
+                    """INSERT INTO moderators
+                    SELECT user_id, ?, ?, ?, consecutive_completed_weeks, vacation_days, 1, ?
+                    FROM moderators WHERE guild_id = ? AND user_id = ?;""",
+                    (*quotas, guild_id, UNASSIGNED_GUILD, user_id)).rowcount
+                if not claimed:
+                    connection.rollback()
+                    return False
+                connection.execute(
+                    """INSERT OR IGNORE INTO vacation_weeks
+                    SELECT date, mod_id, ? FROM vacation_weeks WHERE guild_id = ? AND mod_id = ?;""",
+                    (guild_id, UNASSIGNED_GUILD, user_id))
+                connection.commit()
+            except Error:
+                connection.rollback()
+                raise
+
+            archives = [self.archive.path(year, month) for year, month in self.archive.months] \
+                if self.archive else []
+            if not any(mod_id == user_id for path in [None] + archives
+                       for mod_id, _ in self._unowned_action_channels(connection, path)):
+                connection.execute(
+                    "DELETE FROM vacation_weeks WHERE guild_id = ? AND mod_id = ?;",
+                    (UNASSIGNED_GUILD, user_id))
+                connection.execute(
+                    "DELETE FROM moderators WHERE guild_id = ? AND user_id = ?;",
+                    (UNASSIGNED_GUILD, user_id))
+                connection.commit()
+        finally:
+            connection.close()
+
+        logger.info("moderator %d claimed from the unassigned rows by guild %d", user_id, guild_id)
+        for guild in (guild_id, UNASSIGNED_GUILD):
+            self._refresh_cached_row("_moderators", "moderators", "user_id", user_id, guild)
+            self._refresh_cached_vacation_weeks(guild, user_id)
+        return True
+
+    @staticmethod
+    def _unowned_action_channels(connection: sqlite3.Connection, path: str = None) -> list[tuple[int, int]]:
+        """Returns every (mod_id, channel_id) pair of the unassigned actions,
+        in the main database or the given archive file."""
+        query = "SELECT DISTINCT mod_id, channel_id FROM actions WHERE guild_id = ?;"
+        if path is None:
+            return connection.execute(query, (UNASSIGNED_GUILD,)).fetchall()
+        archive = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        try:
+            return archive.execute(query, (UNASSIGNED_GUILD,)).fetchall()
+        finally:
+            archive.close()
+
+    @staticmethod
+    def _assign_by_channel(connection: sqlite3.Connection, table: str,
+                           channel_guilds: dict[int, int]) -> int:
+        """Moves the unassigned rows of a table with a channel_id column to
+        the guild of their channel. Doesn't commit.
+
+        Returns:
+            int: The amount of rows that were moved.
+        """
+        connection.execute(
+            """CREATE TEMP TABLE IF NOT EXISTS channel_guilds (
+                "channel_id" INTEGER PRIMARY KEY, "guild_id" INTEGER NOT NULL);""")
+        connection.execute("DELETE FROM channel_guilds;")
+        connection.executemany("INSERT INTO channel_guilds VALUES (?, ?);", channel_guilds.items())
+        return connection.execute(
+            f"""UPDATE {table}
+            SET guild_id = (SELECT guild_id FROM channel_guilds WHERE channel_id = {table}.channel_id)
+            WHERE guild_id = ? AND channel_id IN (SELECT channel_id FROM channel_guilds);""",
+            (UNASSIGNED_GUILD,)).rowcount
+
+    def _enable_incremental_vacuum(self) -> None:
+        """Converts a database made before incremental vacuum was turned on.
+        That takes a full VACUUM, which rewrites the whole file, so it only
+        ever happens once, at startup."""
+        mode = self._execute_read_query("PRAGMA auto_vacuum;")
+        tables = self._execute_read_query("SELECT COUNT(*) FROM sqlite_master;")
+        if mode is None or mode[0] == 2 or not tables[0]:
+            return
+        logger.info("converting the database to incremental vacuum, this happens once")
+        start = time.perf_counter()
+        self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        self.connection.execute("VACUUM;")
+        logger.info("converted the database in %.0f ms", (time.perf_counter() - start) * 1000)
+
+
 if __name__ == "__main__":
     DB = DBHandler("db.sqlite")
-
-    stickies_table_query = """
-    CREATE TABLE IF NOT EXISTS stickies (
-        "channel_id" INTEGER PRIMARY KEY,
-        "message_id" INTEGER UNIQUE NOT NULL,
-        "title" TEXT NOT NULL,
-        "description" TEXT NOT NULL
-    );
-    """
-    DB._execute_query(stickies_table_query)
-
-    moderator_table_query = """
-    CREATE TABLE IF NOT EXISTS moderators (
-        "user_id" INTEGER PRIMARY KEY,
-        "send_quota" INTEGER NOT NULL,
-        "edit_quota" INTEGER NOT NULL,
-        "delete_quota" INTEGER NOT NULL,
-        "consecutive_completed_weeks" INTEGER NOT NULL,
-        "vacation_days" INTEGER NOT NULL,
-        "active" INTEGER NOT NULL
-    );
-    """
-    DB._execute_query(moderator_table_query)
-
-    action_table_query = """
-    CREATE TABLE IF NOT EXISTS actions (
-        "id" INTEGER PRIMARY KEY AUTOINCREMENT,
-        "type" TEXT NOT NULL,
-        "message_id" INTEGER,
-        "channel_id" INTEGER NOT NULL,
-        "mod_id" INTEGER REFERENCES moderators NOT NULL,
-        "timestamp" INTEGER NOT NULL
-    );
-    """
-    DB._execute_query(action_table_query)
-
-    vacation_table_query = """
-    CREATE TABLE IF NOT EXISTS vacation_weeks (
-        "date" TEXT UNIQUE NOT NULL,
-        "mod_id" INTEGER REFERENCES moderators NOT NULL
-    )"""
-    DB._execute_query(vacation_table_query)
-
-    config_table_query = """
-    CREATE TABLE IF NOT EXISTS config (
-        "guild_id" INTEGER PRIMARY KEY,
-        "mod_category_id" INTEGER,
-        "last_mod_check" INTEGER,
-        "time_between_checks" INTEGER,
-        "default_quotas" TEXT NOT NULL,
-        "member_count_channel_id" INTEGER
-    );"""
-    DB._execute_query(config_table_query)
+    DB.create_tables()
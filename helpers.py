@@ -9,7 +9,8 @@ class Action:
             channel_id: int,
             mod_id: int,
             timestamp: int,
-            message_id: int = None):
+            message_id: int = None,
+            guild_id: int = None):
         """Represents an action.
 
         Args:
@@ -19,6 +20,7 @@ class Action:
             mod_id (int): Id of the moderator that executed the action.
             timestamp (int): Unix timestamp of when the action was executed.
             message_id (int, optional): Id of the message the action is referencing (does not exist when action is "deleted"). Defaults to None.
+            guild_id (int, optional): Id of the guild the action occured in. Defaults to None.
         """
         self.id = id
         if type.lower() not in ["sent", "edited", "deleted"]:
@@ -29,6 +31,7 @@ class Action:
         self.mod_id = mod_id
         self.timestamp = timestamp
         self.message_id = message_id
+        self.guild_id = guild_id
 
 
 class Moderator:
@@ -40,7 +43,8 @@ class Moderator:
             delete_quota: int,
             consecutive_completed_weeks: int,
             vacation_days: int,
-            active: int) -> None:
+            active: int,
+            guild_id: int = None) -> None:
         """Represents a moderator.
 
         Args:
@@ -51,6 +55,7 @@ class Moderator:
             consecutive_completed_weeks (int): The amount of consecutive weeks the moderator has fufilled their quota.
             vacation_days (int): The total amount of vacation days the moderator has taken since joining the team.
             active (int): either 0 or 1, if the moderator is active and registered or not.
+            guild_id (int, optional): Id of the guild the user moderates. Defaults to None.
         """
         self.id = user_id
         self.send_quota = send_quota
@@ -59,6 +64,7 @@ class Moderator:
         self.consecutive_completed_weeks = consecutive_completed_weeks
         self.vacation_days = vacation_days
         self.active = active
+        self.guild_id = guild_id
 
     @property
     def quotas(self) -> tuple[int, int, int]:
@@ -82,7 +88,8 @@ class Moderator:
 
 
 class StickyMessage:
-    def __init__(self, channel_id: int, message_id: int, title: str, description: str):
+    def __init__(self, channel_id: int, message_id: int, title: str, description: str,
+                 guild_id: int = None):
         """Represents a sticky message object.
 
         Args:
@@ -90,23 +97,27 @@ class StickyMessage:
             message_id (int): Discord id of the message sent.
             title (str): The title of the embed message.
             description (str): The descrition of the embed message.
+            guild_id (int, optional): Discord id of the guild with the channel. Defaults to None.
         """
         self.message_id = message_id
         self.channel_id = channel_id
         self.title = title
         self.description = description
+        self.guild_id = guild_id
 
 
 class VacationWeek:
-    def __init__(self, date: str, mod_id: int) -> None:
+    def __init__(self, date: str, mod_id: int, guild_id: int = None) -> None:
         """Represents a vaction week.
 
         Args:
             date (str): Date of the week in the form yyyy-ww.
             mod_id (int): Discord id of the moderator that took the vacation.
+            guild_id (int, optional): Discord id of the guild the moderator took the vacation in. Defaults to None.
         """
         self.date = date
         self.mod_id = mod_id
+        self.guild_id = guild_id
 
     @property
     def dateobj(self) -> date:
@@ -127,6 +138,36 @@ class VacationWeek:
         self.date = date.strftime('%Y-%W')
 
 
+class ScheduledJob:
+    def __init__(
+            self,
+            name: str,
+            guild_id: int,
+            interval: int,
+            next_run: int,
+            last_run: int = None,
+            last_duration_ms: float = None,
+            last_error: str = None) -> None:
+        """Represents the timer of a scheduled job.
+
+        Args:
+            name (str): Name of the job, e.g. "member_count".
+            guild_id (int): The guild the job runs for, 0 for jobs that aren't tied to a guild.
+            interval (int): Amount of seconds between runs.
+            next_run (int): Unix timestamp of when the job should run next.
+            last_run (int, optional): Unix timestamp of when the job last started. Defaults to None.
+            last_duration_ms (float, optional): How long the last run took, in milliseconds. Defaults to None.
+            last_error (str, optional): The error of the last run, if it failed. Defaults to None.
+        """
+        self.name = name
+        self.guild_id = guild_id
+        self.interval = interval
+        self.next_run = next_run
+        self.last_run = last_run
+        self.last_duration_ms = last_duration_ms
+        self.last_error = last_error
+
+
 class Guild:
     def __init__(
             self,
@@ -135,7 +176,8 @@ class Guild:
             last_mod_check: int,
             time_between_checks: int,
             default_quotas: str | tuple[int, int, int],
-            member_count_channel_id: int) -> None:
+            member_count_channel_id: int,
+            alert_channel_id: int = None) -> None:
         """Represents a guild config entry.
 
         Args:
@@ -145,6 +187,7 @@ class Guild:
             time_between_checks (int): The amount of seconds that we should wait before next mod check.
             default_quota (str | tuple): The default quota for any new moderators.
             member_cont_channel_id (int): The id of the channel to use for member counts
+            alert_channel_id (int, optional): The id of the channel to post activity alerts in. Defaults to None.
         """
 
         if isinstance(default_quotas, str):
@@ -156,3 +199,4 @@ class Guild:
         self.time_between_checks = time_between_checks
         self.default_quotas: tuple[int, int, int] = default_quotas
         self.member_count_channel_id = member_count_channel_id
+        self.alert_channel_id = alert_channel_id
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable
+import discord
+from metrics import metrics
+from outbound import Priority
+
+logger = logging.getLogger(__name__)
+
+# Discord drops an interaction that isn't answered within 3 seconds, warn
+# when a command gets anywhere near that.
+FIRST_RESPONSE_WARN_MS = 2000
+
+
+def interaction_name(interaction: discord.Interaction) -> str:
+    """Returns a readable name for the interaction to file metrics under.
+
+    Args:
+        interaction (discord.Interaction): The interaction.
+
+    Returns:
+        str: The command's name, or the component's custom id.
+    """
+    if interaction.command:
+        return interaction.command.qualified_name
+    if interaction.data and interaction.data.get("custom_id"):
+        return interaction.data["custom_id"]
+    return "unknown"
+
+
+def record_first_response(interaction: discord.Interaction, name: str = None) -> float:
+    """Records how long it took from the user invoking the interaction until
+    the bot first responded to it. Call it right after the first response.
+
+    Args:
+        interaction (discord.Interaction): The interaction that was just responded to.
+        name (str, optional): Name to record the time under. Defaults to the command name.
+
+    Returns:
+        float: The time to first response, in milliseconds.
+    """
+    name = name or interaction_name(interaction)
+    # created_at comes from the interaction's snowflake, so this includes
+    # the time the event spent getting to us and waiting on the loop.
+    elapsed_ms = max(0.0, (discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000)
+    metrics.observe(f"interaction.first_response.{name}", elapsed_ms)
+    if elapsed_ms > FIRST_RESPONSE_WARN_MS:
+        logger.warning("Interaction %s took %.0f ms to get a first response", name, elapsed_ms)
+    return elapsed_ms
+
+
+async def defer(interaction: discord.Interaction, name: str = None,
+                ephemeral: bool = False, thinking: bool = True) -> None:
+    """Acknowledges the interaction right away, so the 3 second limit no
+    longer matters. Send the actual result with interaction.followup.send()
+    (or edit_original_response() when thinking is False) afterwards.
+
+    Args:
+        interaction (discord.Interaction): The interaction to defer.
+        name (str, optional): Name to record the time to first response under. Defaults to the command name.
+        ephemeral (bool, optional): If the follow up should only be visible to the user. Defaults to False.
+        thinking (bool, optional): Show "Bot is thinking...". Pass False for buttons and selects that edit their own message. Defaults to True.
+    """
+    await interaction.client.outbound.run(
+        lambda: interaction.response.defer(ephemeral=ephemeral, thinking=thinking),
+        Priority.INTERACTION,
+        bucket=f"interaction:{interaction.id}")
+    record_first_response(interaction, name)
+
+
+async def followup(interaction: discord.Interaction, *args, **kwargs) -> discord.WebhookMessage | None:
+    """Sends a follow up message to a deferred interaction, ahead of any
+    queued sticky reposts or channel renames. Takes the same arguments as
+    interaction.followup.send().
+
+    Args:
+        interaction (discord.Interaction): The deferred interaction.
+
+    Returns:
+        discord.WebhookMessage | None: The sent message if wait=True was passed.
+    """
+    return await interaction.client.outbound.run(
+        lambda: interaction.followup.send(*args, **kwargs),
+        Priority.INTERACTION,
+        bucket=f"interaction:{interaction.id}")
+
+
+async def run_deferred(interaction: discord.Interaction, func: Callable[..., Any], *args,
+                       name: str = None, ephemeral: bool = False, thinking: bool = True) -> Any:
+    """Defers the interaction and then runs a blocking function (like a heavy
+    database query) on a worker thread, so neither the interaction timeout
+    nor the event loop has to wait on it.
+
+    Args:
+        interaction (discord.Interaction): The interaction to defer.
+        func (Callable[..., Any]): The blocking function to run.
+        *args: The arguments to call func with.
+        name (str, optional): Name to record the timings under. Defaults to the command name.
+        ephemeral (bool, optional): If the follow up should only be visible to the user. Defaults to False.
+        thinking (bool, optional): Show "Bot is thinking...". Defaults to True.
+
+    Returns:
+        Any: Whatever func returned.
+    """
+    name = name or interaction_name(interaction)
+    await defer(interaction, name, ephemeral=ephemeral, thinking=thinking)
+    start = time.perf_counter()
+    try:
+        return await asyncio.to_thread(func, *args)
+    finally:
+        metrics.observe(f"interaction.work.{name}", (time.perf_counter() - start) * 1000)
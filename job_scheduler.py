@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+from db_handler import DBHandler
+from helpers import Guild, ScheduledJob
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class JobSpec():
+    def __init__(self, name: str, handler: Callable[[int], Awaitable[None]],
+                 interval: Callable[[Guild | None], int | None], per_guild: bool) -> None:
+        """What to run for a scheduled job and how often.
+
+        Args:
+            name (str): Name of the job.
+            handler (Callable[[int], Awaitable[None]]): Runs the job, gets the guild id (0 for jobs that aren't tied to a guild).
+            interval (Callable[[Guild | None], int | None]): Returns the seconds between runs for a guild (None for jobs that aren't tied to a guild), or None to not run the job there.
+            per_guild (bool): If the job runs once per configured guild or just once.
+        """
+        self.name = name
+        self.handler = handler
+        self.interval = interval
+        self.per_guild = per_guild
+
+
+class JobScheduler():
+    def __init__(self, db: DBHandler, max_concurrent: int = 2,
+                 jitter: float = 0.1, tick: int = 60,
+                 owns_guild: Callable[[int], bool] = None) -> None:
+        """Runs periodic work (member counts, quota checks, backups, ...) on
+        timers that are stored in the jobs table, so they survive restarts.
+
+        Every job gets its own timer per guild. Runs are pushed back by a
+        random part of the interval, so jobs of different guilds drift apart
+        instead of all firing at the same moment. A job whose run was missed
+        while the bot was down runs once as soon as the bot is back, however
+        many runs it missed.
+
+        When the bot's shards are split over several processes, every process
+        only runs the jobs of its own guilds. The jobs that aren't tied to a
+        guild count as guild 0, see sharding.py.
+
+        Args:
+            db (DBHandler): The database the timers are stored in.
+            max_concurrent (int, optional): The max amount of jobs running at once. Defaults to 2.
+            jitter (float, optional): Up to this part of the interval is added to every next run. Defaults to 0.1.
+            tick (int, optional): Max amount of seconds between checking for due jobs. Defaults to 60.
+            owns_guild (Callable[[int], bool], optional): Tells if a guild's jobs run in this process. Defaults to None, every guild.
+        """
+        self.db = db
+        self.owns_guild = owns_guild
+        self.jitter = jitter
+        self.tick = tick
+        self.specs: dict[str, JobSpec] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._running: dict[tuple[str, int], asyncio.Task] = {}
+        self._task: asyncio.Task = None
+        self._wake = asyncio.Event()
+
+    def register(self, name: str, handler: Callable[[int], Awaitable[None]],
+                 interval: Callable[[Guild | None], int | None], per_guild: bool = True) -> None:
+        """Adds a job. Call it when the cog that owns the job is loaded.
+
+        Args:
+            name (str): Name of the job, also the name of its timers in the database.
+            handler (Callable[[int], Awaitable[None]]): Runs the job, gets the guild id (0 for jobs that aren't tied to a guild).
+            interval (Callable[[Guild | None], int | None]): Returns the seconds between runs for a guild, or None to not run the job there.
+            per_guild (bool, optional): If the job runs once per configured guild or just once. Defaults to True.
+        """
+        self.specs[name] = JobSpec(name, handler, interval, per_guild)
+        self._wake.set()
+
+    def unregister(self, name: str) -> None:
+        """Removes a job, its timers are kept for when it's registered again.
+
+        Args:
+            name (str): Name of the job.
+        """
+        self.specs.pop(name, None)
+
+    def is_running(self, name: str, guild_id: int) -> bool:
+        return (name, guild_id) in self._running
+
+    def owns(self, guild_id: int) -> bool:
+        return self.owns_guild is None or self.owns_guild(guild_id)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running.values():
+            task.cancel()
+
+    def _next_run(self, now: float, interval: int) -> int:
+        return int(now + interval + random.uniform(0, self.jitter * interval))
+
+    def _sync(self, now: float) -> list[ScheduledJob]:
+        """Makes sure every registered job has a timer for every guild it
+        should run in, with the right interval.
+
+        Returns:
+            list[ScheduledJob]: The timers of the registered jobs.
+        """
+        existing = {(job.name, job.guild_id): job for job in self.db.get_all_jobs()}
+        guilds = [guild for guild in self.db.get_all_guilds() if self.owns(guild.id)]
+        jobs = []
+        for spec in self.specs.values():
+            targets = [(guild.id, guild) for guild in guilds] if spec.per_guild else [(0, None)]
+            for name, guild_id in existing:
+                if name == spec.name and (guild_id == 0) == spec.per_guild:
+                    # Left over from before the job changed between global and per guild.
+                    self.db.remove_job(name, guild_id)
+            for guild_id, guild in targets:
+                if not self.owns(guild_id):
+                    continue
+                interval = spec.interval(guild)
+                job = existing.get((spec.name, guild_id))
+                if not interval:
+                    if job:
+                        self.db.remove_job(spec.name, guild_id)
+                    continue
+
+                if job is None:
+                    # Spread the first runs out over a tick, so a fresh
+                    # install doesn't run every job at the same moment.
+                    next_run = int(now + random.uniform(0, self.tick))
+                    self.db.add_job(spec.name, guild_id, interval, next_run)
+                    job = ScheduledJob(spec.name, guild_id, interval, next_run)
+                elif job.interval != interval:
+                    # The guild changed its settings, don't wait out the old interval.
+                    job.next_run = min(job.next_run, self._next_run(now, interval))
+                    job.interval = interval
+                    self.db.set_job_schedule(spec.name, guild_id, interval, job.next_run)
+                jobs.append(job)
+        return jobs
+
+    async def _loop(self) -> None:
+        while True:
+            self._wake.clear()
+            now = time.time()
+            try:
+                jobs = self._sync(now)
+            except Exception:
+                logger.exception("Failed to load the job timers")
+                jobs = []
+
+            for job in jobs:
+                key = (job.name, job.guild_id)
+                if job.next_run <= now and key not in self._running:
+                    missed = int((now - job.next_run) // job.interval)
+                    if missed:
+                        # We were down, run it once now instead of once per missed run.
+                        metrics.increment(f"jobs.missed.{job.name}", missed)
+                        logger.info("catching up on job %s for guild %s, %d runs missed",
+                                    job.name, job.guild_id, missed)
+                    self._running[key] = asyncio.create_task(self._run(job))
+
+            waiting = [job.next_run for job in jobs
+                       if (job.name, job.guild_id) not in self._running]
+            delay = min(waiting, default=now + self.tick) - time.time()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(1, min(delay, self.tick)))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: ScheduledJob) -> None:
+        key = (job.name, job.guild_id)
+        try:
+            async with self._semaphore:
+                spec = self.specs.get(job.name)
+                if spec is None:
+                    return
+                metrics.set_gauge("jobs.running", len(self._running))
+                started = time.time()
+                start = time.perf_counter()
+                error = None
+                try:
+                    await spec.handler(job.guild_id)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    metrics.increment(f"jobs.failed.{job.name}")
+                    logger.exception("Job %s for guild %s failed", job.name, job.guild_id)
+                duration_ms = (time.perf_counter() - start) * 1000
+                metrics.observe(f"jobs.run.{job.name}", duration_ms)
+                self.db.record_job_run(
+                    job.name, job.guild_id, int(started), round(duration_ms, 1),
+                    error, self._next_run(started, job.interval))
+        finally:
+            self._running.pop(key, None)
+            metrics.set_gauge("jobs.running", len(self._running))
+            # The loop may be waiting on this job to schedule its next run.
+            self._wake.set()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Frames from files under this directory are "ours" and are the ones we
+# report when the loop gets blocked.
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopLagMonitor():
+    def __init__(self, interval: float = 0.25, threshold_ms: float = 200) -> None:
+        """Measures how late the event loop runs scheduled callbacks, and
+        samples the loop thread's stack when it's blocked for too long to find
+        out which cog, listener or DBHandler method is responsible.
+
+        Args:
+            interval (float, optional): Seconds between lag measurements. Defaults to 0.25.
+            threshold_ms (float, optional): Lag (in milliseconds) above which the loop counts as blocked. Defaults to 200.
+        """
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task: asyncio.Task = None
+        self._watchdog: threading.Thread = None
+        self._stopped = threading.Event()
+        # Culprits sampled during the block that is currently going on.
+        self._samples: dict[str, int] = {}
+
+    def start(self) -> None:
+        """Starts measuring. Has to be called from within the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        """Stops both the measuring task and the watchdog thread."""
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _measure(self) -> None:
+        # Sleep for a fixed interval and see how much later than asked we
+        # get woken up, that delay is time the loop spent on something else.
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = (time.perf_counter() - start - self.interval) * 1000
+            self._heartbeat = time.monotonic()
+            metrics.observe("loop.lag", lag_ms)
+
+            if lag_ms >= self.threshold_ms:
+                self._report(lag_ms)
+
+    def _watch(self) -> None:
+        # Runs on its own thread, so it keeps going while the loop is stuck.
+        # If the heartbeat is stale we sample what the loop thread is doing.
+        while not self._stopped.wait(self.interval / 2):
+            behind_ms = (time.monotonic() - self._heartbeat -
+                         self.interval) * 1000
+            if behind_ms < self.threshold_ms:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            culprit = self.describe_stack(frame)
+            self._samples[culprit] = self._samples.get(culprit, 0) + 1
+
+    def _report(self, lag_ms: float) -> None:
+        """Records a finished block in the metrics and logs it.
+
+        Args:
+            lag_ms (float): How long the loop was blocked for.
+        """
+        samples, self._samples = self._samples, {}
+        metrics.increment("loop.blocked")
+        if not samples:
+            # The block was too short for the watchdog to catch it in the act.
+            logger.warning("Event loop blocked for %.0f ms (no stack sample)", lag_ms)
+            return
+
+        for culprit, count in samples.items():
+            metrics.increment(f"loop.blocked_samples.{culprit}", count)
+        worst = max(samples, key=samples.get)
+        logger.warning("Event loop blocked for %.0f ms, mostly in: %s", lag_ms, worst)
+
+    @staticmethod
+    def describe_stack(frame) -> str:
+        """Turns a stack into a short description made of only our own code,
+        outermost call first, e.g. "ModManager.on_message > DBHandler.get_guild".
+
+        Args:
+            frame (FrameType): The innermost frame of the stack.
+
+        Returns:
+            str: The description, or "<external>" if none of our code is on the stack.
+        """
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename.startswith(PROJECT_DIR) and code.co_filename != __file__:
+                names.append(getattr(code, "co_qualname", code.co_name))
+            frame = frame.f_back
+        if not names:
+            return "<external>"
+        return " > ".join(reversed(names))
@@ -1,65 +1,319 @@
 # -*- coding: UTF-8 -*-
+import asyncio
 import discord
 import logging
-import traceback
+import time
+import yarl
 from discord.ext import commands
 from dotenv import load_dotenv
 from os import environ, listdir
+from backup import BackupManager
+from bot_logging import setup_logging
+from command_sync import sync_if_changed
 from db_handler import DBHandler
+from job_scheduler import JobScheduler
+from loop_monitor import LoopLagMonitor
+from member_cache import ModeratorMemberCache
+from member_resolver import MemberResolver
+from metrics import metrics
+from outbound import OutboundScheduler
+from sharding import ShardPlan, shard_of
+from startup import StartupTimer
 
 load_dotenv()
 token = environ["TEST_TOKEN"]
 
-# set up logging
-logging_handler = logging.FileHandler(
-    filename="discord.log", encoding="utf-8", mode="w")
+# Logging level for the whole bot, set to DEBUG to get way more detail.
+LOG_LEVEL = environ.get("LOG_LEVEL", "INFO").upper()
+
+logger = logging.getLogger("main")
 
 # test guild (so we can easily sync and test commands)
 TEST_GUILD = discord.Object(environ["TEST_GUILD_ID"])
 
+# Point the bot at a different API and gateway than discord's own, used to
+# run against the local stand-in in benchmarks/fake_discord.py.
+if environ.get("DISCORD_API_BASE"):
+    discord.http.Route.BASE = environ["DISCORD_API_BASE"]
+if environ.get("DISCORD_GATEWAY_URL"):
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(
+        environ["DISCORD_GATEWAY_URL"])
+
+# If set, log every database query slower than this many milliseconds
+# (together with its query plan).
+SLOW_QUERY_MS = environ.get("SLOW_QUERY_MS")
+
+# Cogs that aren't needed right away. They are loaded in the background once
+# the bot is ready instead of holding up startup.
+LAZY_COGS = {c.strip() for c in environ.get(
+    "LAZY_COGS", "cogs.Diagnostics_manager,cogs.Activity_manager").split(",") if c.strip()}
+
+# Where to sync the slash commands to: "global", "guild" (only the test guild,
+# shows up instantly, handy while debugging) or "off".
+COMMAND_SYNC = environ.get("COMMAND_SYNC", "global").lower()
+# Hash of the last synced command tree, so we only sync when it changed.
+COMMAND_HASH_PATH = "./command_tree.json"
+
+# Where to keep the database backups, how many to keep and how often (in
+# seconds) to take one. An interval of 0 turns backups off.
+BACKUP_DIR = environ.get("BACKUP_DIR", "./backups")
+BACKUP_KEEP = int(environ.get("BACKUP_KEEP", 7))
+BACKUP_INTERVAL = int(environ.get("BACKUP_INTERVAL", 24 * 60 * 60))
+
+# Where the monthly archives of old actions go, and after how many days
+# actions are moved there. 0 keeps every action in the main database.
+ARCHIVE_DIR = environ.get("ARCHIVE_DIR", "./archive")
+ARCHIVE_AFTER_DAYS = int(environ.get("ARCHIVE_AFTER_DAYS", 365))
+
+# Event loop lag (in milliseconds) above which we sample what's blocking it.
+LOOP_LAG_MS = float(environ.get("LOOP_LAG_MS", 200))
+
+# How many shards the bot connects with (defaults to what discord recommends)
+# and which of them run in this process (comma separated, defaults to all).
+# Processes that split the shards share the database, each one only does the
+# work of the guilds on its own shards, see sharding.py.
+SHARD_COUNT = int(environ["SHARD_COUNT"]) if environ.get("SHARD_COUNT") else None
+SHARD_IDS = [int(id) for id in environ["SHARD_IDS"].split(",")] if environ.get("SHARD_IDS") else None
+
+# Low-memory mode: only the registered moderators are kept in the member
+# cache (see member_cache.py) and the message cache is off unless a size is
+# given. Otherwise discord.py caches every member and the last 1000 messages.
+LOW_MEMORY = environ.get("LOW_MEMORY", "").lower() in ("1", "true", "yes")
+MESSAGE_CACHE_SIZE = int(environ.get("MESSAGE_CACHE_SIZE", 0 if LOW_MEMORY else 1000))
+
 
-class BTBot(commands.Bot):
+class BTBot(commands.AutoShardedBot):
     def __init__(self, command_prefix: str) -> None:
         intents = discord.Intents.default()
         intents.members = True
         intents.message_content = True
+        self.shard_plan = ShardPlan(SHARD_COUNT, SHARD_IDS)
+        caches = {}
+        if LOW_MEMORY:
+            # Moderators are put in the cache by hand, nobody else is.
+            caches = {"member_cache_flags": discord.MemberCacheFlags.none(),
+                      "chunk_guilds_at_startup": False}
         super().__init__(
             intents=intents,
             command_prefix=command_prefix,
             description="Battle Talent Bot",
             activity=discord.Game(
-                name="Battle Talent"))
+                name="Battle Talent"),
+            shard_count=self.shard_plan.shard_count,
+            shard_ids=self.shard_plan.shard_ids,
+            max_messages=MESSAGE_CACHE_SIZE or None,
+            **caches)
+        self._extension_locks: dict[str, asyncio.Lock] = {}
+        # Bot.on_message handles the prefix commands, so count next to it.
+        self.add_listener(self._count_shard_message, "on_message")
 
     async def on_ready(self) -> None:
         # When we're all loaded in and ready, send this to give a clear indication in the console
         # mostly for when logging things
-        print(f'logged in as {self.user} (ID: {self.user.id})')
-        print("-----------------")
+        logger.info("logged in as %s (ID: %s) on %s", self.user, self.user.id,
+                    self.shard_plan.describe())
 
-    async def setup_hook(self) -> None:
-        # any data processing to get stuff into memory goes here
-        self.db = DBHandler("./db.sqlite")
-        # load cogs:
-        print("loading cogs:")
-        cogs = [f"cogs.{c[:-3]}" for c in listdir("./cogs") if c[-3:] == ".py"]
+# -------------------------- SHARD HANDLING --------------------------
+
+    async def on_shard_ready(self, shard_id: int) -> None:
+        logger.info("shard %s ready", shard_id)
+
+    async def on_shard_connect(self, shard_id: int) -> None:
+        metrics.increment(f"shard.{shard_id}.connects")
+
+    async def on_shard_disconnect(self, shard_id: int) -> None:
+        metrics.increment(f"shard.{shard_id}.disconnects")
+        logger.info("shard %s disconnected", shard_id)
+
+    async def on_shard_resumed(self, shard_id: int) -> None:
+        metrics.increment(f"shard.{shard_id}.resumes")
+
+    async def _count_shard_message(self, message: discord.Message) -> None:
+        if message.guild is not None:
+            metrics.increment(f"shard.{message.guild.shard_id}.messages")
+
+    async def on_interaction(self, interaction: discord.Interaction) -> None:
+        if interaction.guild_id is not None:
+            metrics.increment(f"shard.{shard_of(interaction.guild_id, self.shard_count)}.interactions")
 
-        for cog in cogs:
+    async def close(self) -> None:
+        # Log the most expensive recent queries before shutting down.
+        if getattr(self, "db", None) and self.db.query_log:
+            logger.info("slowest query shapes of the last %d minutes:\n%s",
+                        self.db.query_log.window // 60, self.db.query_log.format_summary())
+        if getattr(self, "loop_monitor", None):
+            self.loop_monitor.stop()
+        if getattr(self, "jobs", None):
+            self.jobs.stop()
+        if getattr(self, "outbound", None):
+            await self.outbound.close()
+        await super().close()
+        if getattr(self, "db", None):
+            self.db.close()
+
+    async def ensure_extension(self, cog: str) -> bool:
+        """Loads the given cog if it isn't loaded yet. Safe to call from several
+        places at once, the cog is only loaded once.
+
+        Args:
+            cog (str): Name of the cog module, e.g. "cogs.Mod_manager".
+
+        Returns:
+            bool: If the cog is loaded after the call.
+        """
+        lock = self._extension_locks.setdefault(cog, asyncio.Lock())
+        async with lock:
+            if cog in self.extensions:
+                return True
             try:
-                await bot.load_extension(cog)
-                print(f'\t{cog} loaded')
-            except Exception as e:
-                # if we fail to load the cog we want to print the cog's error
+                # load_extension() always executes the module itself, so it
+                # can't be imported ahead. Each cog times its own setup(), the
+                # rest of the load is importing it.
+                start = time.perf_counter()
+                await self.load_extension(cog)
+                load_ms = (time.perf_counter() - start) * 1000
+                self.startup.record(f"{cog} import", load_ms - self.startup.duration(f"{cog} setup"))
+                logger.info("%s loaded", cog)
+                return True
+            except Exception:
+                # if we fail to load the cog we want to log the cog's error
                 # thus the traceback
-                print(f'Failed to load extension {cog}!')
-                traceback.print_exc()
+                logger.exception("Failed to load extension %s!", cog)
+                return False
+
+    async def sync_commands(self) -> bool:
+        """Syncs the slash commands and context menus with discord, if they
+        changed since the last sync.
+
+        Returns:
+            bool: If the commands were synced.
+        """
+        if COMMAND_SYNC == "off":
+            return False
+        try:
+            with self.startup.phase("command sync"):
+                if COMMAND_SYNC == "guild":
+                    self.tree.copy_global_to(guild=TEST_GUILD)
+                    return await sync_if_changed(self.tree, COMMAND_HASH_PATH, guild=TEST_GUILD)
+                return await sync_if_changed(self.tree, COMMAND_HASH_PATH)
+        except discord.HTTPException:
+            logger.exception("Failed to sync commands")
+            return False
+
+    async def _finish_startup(self, lazy_cogs: list[str]) -> None:
+        await self.wait_until_ready()
+        # Rows from before the database was split per guild that couldn't be
+        # given a guild then, see DBHandler.assign_unowned_rows().
+        channel_guilds = {channel.id: guild.id for guild in self.guilds
+                          for channel in [*guild.channels, *guild.threads]}
+        try:
+            assigned = await asyncio.to_thread(self.db.assign_unowned_rows, channel_guilds)
+        except Exception:
+            # The rows stay unowned until the next start, that's no reason to
+            # leave the lazy cogs and the jobs off.
+            logger.exception("Failed to assign the unowned rows to their guilds")
+        else:
+            if assigned and self.member_cache.enabled:
+                # The guilds got moderators they didn't have when they became available.
+                with self.startup.phase("moderator members"):
+                    await asyncio.gather(*(self.member_cache.load(guild) for guild in self.guilds))
+        await asyncio.gather(*(self.ensure_extension(cog) for cog in lazy_cogs))
+        # Sync once every cog is loaded, otherwise the lazy cogs' commands
+        # would be missing from the tree.
+        await self.sync_commands()
+        # Every cog has registered its jobs by now.
+        self.jobs.start()
+        logger.info("startup finished, timings:\n%s", self.startup.format())
+
+    def _log_startup_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.error("Failed to finish startup", exc_info=task.exception())
+
+    async def archive_actions(self, guild_id: int = 0) -> None:
+        """Moves old actions into the monthly archives, used as the "archive" job.
+
+        Args:
+            guild_id (int, optional): Unused, archiving isn't tied to a guild. Defaults to 0.
+        """
+        cutoff = int(time.time()) - ARCHIVE_AFTER_DAYS * 24 * 60 * 60
+        await asyncio.to_thread(self.db.archive_actions, cutoff)
+
+    async def setup_hook(self) -> None:
+        self.startup = StartupTimer()
+        # Start watching the event loop first so slow startup work shows up too.
+        self.loop_monitor = LoopLagMonitor(threshold_ms=LOOP_LAG_MS)
+        self.loop_monitor.start()
+
+        # Every request we make on our own goes through here, see outbound.py.
+        self.outbound = OutboundScheduler()
+
+        # Guilds on the shards of other processes are left to them.
+        owns_guild = self.shard_plan.owns if self.shard_plan.is_partial else None
+        logger.info("running %s", self.shard_plan.describe())
+
+        # any data processing to get stuff into memory goes here
+        with self.startup.phase("db open"):
+            self.db = DBHandler(
+                "./db.sqlite",
+                slow_query_ms=float(SLOW_QUERY_MS) if SLOW_QUERY_MS else None,
+                archive_dir=ARCHIVE_DIR,
+                # Only the guilds on our own shards are cached.
+                owns_guild=owns_guild,
+                action_id_slot=self.shard_plan.action_id_slot)
+            # Adds any tables added since the database was made.
+            self.db.create_tables()
+        # Fill the caches before anything can use them. setup_hook runs before
+        # we connect to the gateway, so no events come in until this is done.
+        with self.startup.phase("cache warm-up"):
+            loaded = self.db.warm_up()
+        logger.info("cache warmed up: %s", ", ".join(
+            f"{count} {table}" for table, count in loaded.items()))
+
+        # Decides which members stay cached, see member_cache.py.
+        self.member_cache = ModeratorMemberCache(self.db, LOW_MEMORY)
+        self.add_listener(self.member_cache.on_guild_available, "on_guild_available")
+        self.add_listener(self.member_cache.on_member_join, "on_member_join")
+        if LOW_MEMORY:
+            logger.info("low-memory mode, only the moderators are kept in the member cache")
+        # Names of members for embeds, see member_resolver.py.
+        self.member_resolver = MemberResolver()
+
+        # Cogs register their periodic work with this while loading. The
+        # global jobs (backups, archiving) run next to shard 0.
+        self.jobs = JobScheduler(self.db, owns_guild=owns_guild)
+        self.backups = BackupManager(self.db, BACKUP_DIR, keep=BACKUP_KEEP)
+        self.jobs.register("backup", self.backups.run,
+                           lambda guild: BACKUP_INTERVAL or None, per_guild=False)
+        self.jobs.register("archive", self.archive_actions,
+                           lambda guild: 24 * 60 * 60 if ARCHIVE_AFTER_DAYS else None,
+                           per_guild=False)
+
+        # load cogs, the ones we need right away all at once and the
+        # lazy ones in the background after we're ready.
+        cogs = [f"cogs.{c[:-3]}" for c in listdir("./cogs") if c[-3:] == ".py"]
+        eager = [cog for cog in cogs if cog not in LAZY_COGS]
+        lazy = [cog for cog in cogs if cog in LAZY_COGS]
+        logger.info("loading cogs: %s", ", ".join(eager))
+        with self.startup.phase("cogs"):
+            await asyncio.gather(*(self.ensure_extension(cog) for cog in eager))
+        if lazy:
+            logger.info("deferring cogs: %s", ", ".join(lazy))
+        # Loads the lazy cogs and syncs the commands in the background. The
+        # loop only keeps a weak reference to the task.
+        self._startup_task = asyncio.create_task(self._finish_startup(lazy))
+        self._startup_task.add_done_callback(self._log_startup_failure)
 
-        # * If we are debugging, sync slash commands with discord here
-        # await self.tree.sync()
-        # self.tree.copy_global_to(guild=TEST_GUILD)
-        # await self.tree.sync(guild=TEST_GUILD)
+        logger.info("startup timings:\n%s", self.startup.format())
 
 
 # ------------------------------MAIN CODE------------------------------
-bot = BTBot(command_prefix="!")
 if __name__ == "__main__":
-    bot.run(token, log_handler=logging_handler)  # Run our bot!
+    # Only here, the chart workers (see charts.py) import this module again.
+    bot = BTBot(command_prefix="!")
+    # File and console writes happen on the listener's thread, never on the
+    # event loop. Stopping it at the end flushes whatever is still queued.
+    log_listener = setup_logging("discord.log", LOG_LEVEL)
+    try:
+        bot.run(token, log_handler=None)  # Run our bot!
+    finally:
+        log_listener.stop()
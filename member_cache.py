@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import discord
+from discord.state import ConnectionState
+from db_handler import DBHandler
+from memory_report import estimate_size
+
+logger = logging.getLogger(__name__)
+
+# query_members() looks up at most 100 user ids per request.
+QUERY_BATCH = 100
+
+# What members and messages point to without owning it.
+DISCORD_SHARED = (discord.Client, ConnectionState, discord.Guild,
+                  discord.abc.GuildChannel, discord.Thread, discord.Role)
+
+
+class ModeratorMemberCache():
+    def __init__(self, db: DBHandler, enabled: bool) -> None:
+        """The member cache policy of the low-memory mode. discord.py is told
+        to not cache any members (MemberCacheFlags.none()), and this keeps
+        the registered moderators of every guild in its cache, so they can
+        still be looked up with get_member() (names on the leaderboard,
+        the moderator behind an audit log entry).
+
+        Every other member only lives as long as the event that brought it,
+        or is fetched on demand, see members_with_roles(). With the mode off
+        discord.py caches every member and this does nothing.
+
+        Args:
+            db (DBHandler): The database the moderators are registered in.
+            enabled (bool): If the low-memory mode is on.
+        """
+        self.db = db
+        self.enabled = enabled
+
+    async def load(self, guild: discord.Guild) -> int:
+        """Caches every registered moderator of a guild that isn't cached yet,
+        a hundred per gateway request. Runs every time the guild becomes
+        available, see on_guild_available().
+
+        Args:
+            guild (discord.Guild): The guild to load the moderators of.
+
+        Returns:
+            int: The amount of moderators that were loaded.
+        """
+        if not self.enabled:
+            return 0
+        missing = [mod.id for mod in await asyncio.to_thread(self.db.get_all_moderators, guild.id)
+                   if guild.get_member(mod.id) is None]
+        loaded = 0
+        for start in range(0, len(missing), QUERY_BATCH):
+            try:
+                members = await guild.query_members(
+                    user_ids=missing[start:start + QUERY_BATCH], limit=QUERY_BATCH, cache=True)
+            except asyncio.TimeoutError:
+                logger.warning("timed out loading the moderators of guild %s", guild.id)
+                break
+            loaded += len(members)
+        return loaded
+
+    def keep(self, member: discord.Member) -> None:
+        """Caches a member that just became a moderator, or came back.
+
+        Args:
+            member (discord.Member): The member to keep.
+        """
+        if self.enabled and member.guild.get_member(member.id) is None:
+            # discord.py has no public way to put a member we already have
+            # into its cache (or take one out), query_members() would ask
+            # the gateway for it again.
+            member.guild._add_member(member)
+
+    def drop(self, guild: discord.Guild, member_id: int) -> None:
+        """Removes a member that is no longer a moderator from the cache.
+
+        Args:
+            guild (discord.Guild): The guild the member was a moderator in.
+            member_id (int): Discord id of the member.
+        """
+        member = guild.get_member(member_id)
+        if self.enabled and member is not None and member.id != guild.me.id:
+            guild._remove_member(member)
+
+    async def on_guild_available(self, guild: discord.Guild) -> None:
+        # Fires at startup and again whenever a shard had to reconnect without
+        # resuming, discord.py starts over with empty guilds then.
+        loaded = await self.load(guild)
+        if loaded:
+            logger.debug("cached %d moderators of guild %s", loaded, guild.id)
+
+    async def on_member_join(self, member: discord.Member) -> None:
+        # A moderator that left and came back is still registered.
+        if self.enabled and self.db.get_moderator(member.guild.id, member.id):
+            self.keep(member)
+
+    async def members_with_roles(self, guild: discord.Guild, roles: list[discord.Role]) -> list[discord.Member]:
+        """Returns every member holding any of the roles. In the low-memory
+        mode they aren't cached, so the whole member list is fetched from the
+        gateway (without caching it). That takes a while on a big server,
+        only use it for rare things like /configure.
+
+        Args:
+            guild (discord.Guild): The guild to look in.
+            roles (list[discord.Role]): The roles to look for.
+
+        Returns:
+            list[discord.Member]: The members with at least one of the roles.
+        """
+        if not self.enabled:
+            return list({member for role in roles for member in role.members})
+        role_ids = [role.id for role in roles]
+        members = await guild.chunk(cache=False)
+        return [member for member in members
+                if any(member.get_role(role_id) for role_id in role_ids)]
+
+
+def discord_cache_usage(bot: discord.Client) -> dict[str, tuple[int, int]]:
+    """Estimates the memory of discord.py's own caches, see memory_report.py.
+
+    Args:
+        bot (discord.Client): The bot.
+
+    Returns:
+        dict[str, tuple[int, int]]: Name of each cache -> (entries, bytes).
+    """
+    members = [member for guild in bot.guilds for member in guild.members]
+    # The user behind a member counts towards the member.
+    member_ids = {member.id for member in members}
+    users = [user for user in bot.users if user.id not in member_ids]
+    messages = list(bot.cached_messages)
+    return {
+        "discord members": (len(members), estimate_size(members, DISCORD_SHARED)),
+        "discord users": (len(users), estimate_size(users, DISCORD_SHARED)),
+        "discord messages": (len(messages), estimate_size(messages, DISCORD_SHARED + (discord.User,))),
+    }
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+import discord
+from member_cache import QUERY_BATCH
+from memory_report import deep_sizeof
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MemberResolver():
+    def __init__(self, ttl: int = 600, timeout: float = 2.0, maxsize: int = 10_000) -> None:
+        """Looks up the display names of members for embeds, shared by every
+        cog (bot.member_resolver).
+
+        Cached members are read straight from discord.py. The others (in the
+        low-memory mode, or members that left) are asked for in one
+        query_members() request per hundred ids, however many a caller needs,
+        and lookups of the same member that come in while a request is
+        running wait for that request instead of making their own. Names
+        (and members that weren't found) are kept for ttl seconds.
+
+        Args:
+            ttl (int, optional): Seconds a looked up name is reused. Defaults to 600.
+            timeout (float, optional): Seconds to wait for a lookup before falling back to a mention, interactions have to be answered quickly. The lookup still finishes and fills the cache. Defaults to 2.0.
+            maxsize (int, optional): The max amount of names to keep. Defaults to 10_000.
+        """
+        self.ttl = ttl
+        self.timeout = timeout
+        self.maxsize = maxsize
+        # (guild id, user id) -> (expires at, display name or None if not in the guild)
+        self._names: OrderedDict[tuple[int, int], tuple[float, str | None]] = OrderedDict()
+        # Lookups that wait for a request, and the ids of a guild that are
+        # waiting to be sent.
+        self._pending: dict[tuple[int, int], asyncio.Future] = {}
+        self._queued: dict[int, list[int]] = {}
+        # The loop only keeps weak references to tasks.
+        self._flushes: set[asyncio.Task] = set()
+
+    async def display_names(self, guild: discord.Guild, user_ids: list[int]) -> dict[int, str]:
+        """Returns the display name of every given member, in at most one round
+        trip to the gateway per hundred members that aren't cached.
+
+        Args:
+            guild (discord.Guild): The guild the members are in.
+            user_ids (list[int]): Discord ids of the members.
+
+        Returns:
+            dict[int, str]: User id -> display name, or a mention for members that couldn't be found.
+        """
+        names: dict[int, str | None] = {}
+        missing = []
+        now = time.monotonic()
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            cached = self._names.get((guild.id, user_id))
+            if member is not None:
+                names[user_id] = member.display_name
+            elif cached is not None and cached[0] > now:
+                metrics.increment("members.names.hit")
+                names[user_id] = cached[1]
+            else:
+                missing.append(user_id)
+
+        if missing:
+            metrics.increment("members.names.miss", len(missing))
+            lookups = {user_id: self._lookup(guild, user_id) for user_id in missing}
+            # Waiting doesn't cancel them, late answers still fill the cache.
+            await asyncio.wait(lookups.values(), timeout=self.timeout)
+            for user_id, lookup in lookups.items():
+                if lookup.done():
+                    names[user_id] = lookup.result()
+        return {user_id: names.get(user_id) or f"<@{user_id}>" for user_id in user_ids}
+
+    def _lookup(self, guild: discord.Guild, user_id: int) -> asyncio.Future:
+        """Returns the future of a member's name, queueing the member for the
+        next request of its guild if nobody asked for it yet."""
+        key = (guild.id, user_id)
+        lookup = self._pending.get(key)
+        if lookup is None:
+            lookup = self._pending[key] = asyncio.get_running_loop().create_future()
+            queued = self._queued.setdefault(guild.id, [])
+            if not queued:
+                flush = asyncio.create_task(self._flush(guild))
+                self._flushes.add(flush)
+                flush.add_done_callback(self._flushes.discard)
+            queued.append(user_id)
+        return lookup
+
+    async def _flush(self, guild: discord.Guild) -> None:
+        """Asks the gateway for every queued member of a guild."""
+        # Lookups made in the same pass of the loop go in the same request.
+        await asyncio.sleep(0)
+        user_ids = self._queued.pop(guild.id, [])
+        try:
+            for start in range(0, len(user_ids), QUERY_BATCH):
+                batch = user_ids[start:start + QUERY_BATCH]
+                started = time.perf_counter()
+                try:
+                    members = await guild.query_members(user_ids=batch, limit=QUERY_BATCH, cache=False)
+                except (asyncio.TimeoutError, discord.ClientException, RuntimeError):
+                    # Not cached, the next render tries again.
+                    logger.warning("failed to look up %d members of guild %s", len(batch), guild.id)
+                    continue
+                metrics.observe("members.query", (time.perf_counter() - started) * 1000)
+                found = {member.id: member.display_name for member in members}
+                expires = time.monotonic() + self.ttl
+                for user_id in batch:
+                    self._store((guild.id, user_id), expires, found.get(user_id))
+                    self._resolve(guild.id, user_id, found.get(user_id))
+        finally:
+            # Whatever failed falls back to a mention.
+            for user_id in user_ids:
+                self._resolve(guild.id, user_id, None)
+
+    def _resolve(self, guild_id: int, user_id: int, name: str | None) -> None:
+        lookup = self._pending.pop((guild_id, user_id), None)
+        if lookup is not None and not lookup.done():
+            lookup.set_result(name)
+
+    def _store(self, key: tuple[int, int], expires: float, name: str | None) -> None:
+        self._names[key] = (expires, name)
+        self._names.move_to_end(key)
+        while len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+
+    def memory_usage(self) -> dict[str, tuple[int, int]]:
+        """Measures the memory of the name cache, see memory_report.py.
+
+        Returns:
+            dict[str, tuple[int, int]]: Name of the cache -> (entries, bytes).
+        """
+        names = dict(self._names)
+        return {"member names": (len(names), deep_sizeof(names))}
@@ -0,0 +1,106 @@
+import enum
+import os
+import sys
+import types
+from collections import deque
+
+# Sizes are estimated from this many objects of a cache at most, walking
+# every member of a big server would hold up the event loop.
+SAMPLE_SIZE = 200
+
+# Never counted as part of a cached object, they're shared with everything.
+ALWAYS_SHARED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                 types.MethodType, enum.Enum)
+
+
+def deep_sizeof(obj: object, shared: tuple[type, ...] = (), seen: set[int] = None) -> int:
+    """Returns the bytes an object takes up together with everything it
+    references. Objects of the shared types (and whatever is only reachable
+    through them) aren't counted, nor is anything already in seen.
+
+    Args:
+        obj (object): The object to measure.
+        shared (tuple[type, ...], optional): Types of objects the measured one only points to, e.g. the guild a member belongs to. Defaults to ().
+        seen (set[int], optional): Ids of objects that were counted already, pass the same set to measure several objects without counting what they share twice. Defaults to None.
+
+    Returns:
+        int: The size in bytes.
+    """
+    seen = set() if seen is None else seen
+    skip = ALWAYS_SHARED + shared
+    size = 0
+    todo = [obj]
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen or isinstance(obj, skip):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            todo += obj.keys()
+            todo += obj.values()
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            todo += obj
+        if hasattr(obj, "__dict__"):
+            todo.append(vars(obj))
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(obj, slot):
+                    todo.append(getattr(obj, slot))
+    return size
+
+
+def estimate_size(objects: list, shared: tuple[type, ...] = ()) -> int:
+    """Estimates the size of a whole cache from an even sample of its
+    objects, see deep_sizeof().
+
+    Args:
+        objects (list): Every object in the cache.
+        shared (tuple[type, ...], optional): Types that don't count towards the cache. Defaults to ().
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    if not objects:
+        return 0
+    sample = objects[::max(1, len(objects) // SAMPLE_SIZE)]
+    seen = set()
+    sampled = sum(deep_sizeof(obj, shared, seen) for obj in sample)
+    return sampled * len(objects) // len(sample)
+
+
+def resident_memory() -> int | None:
+    """Returns the resident memory of the process in bytes, or None where
+    /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def format_report(usage: dict[str, tuple[int, int]], resident: int | None) -> str:
+    """Formats the memory used per cache, biggest first.
+
+    Args:
+        usage (dict[str, tuple[int, int]]): Name of each cache -> (entries, bytes).
+        resident (int | None): The resident memory of the whole process in bytes, see resident_memory().
+
+    Returns:
+        str: One line per cache and a total.
+    """
+    width = max((len(name) for name in usage), default=0)
+    lines = [f"{name:<{width}} {entries:>8} {format_bytes(size):>10}"
+             for name, (entries, size) in sorted(usage.items(), key=lambda item: -item[1][1])]
+    lines.append(f"{'caches total':<{width}} {'':>8} {format_bytes(sum(size for _, size in usage.values())):>10}")
+    if resident is not None:
+        lines.append(f"{'process resident':<{width}} {'':>8} {format_bytes(resident):>10}")
+    return "\n".join(lines)
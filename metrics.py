@@ -0,0 +1,122 @@
+from collections import deque
+import threading
+
+
+class TimingStats():
+    def __init__(self, window: int = 1024) -> None:
+        """Running stats for a timed operation. Keeps totals for the whole
+        run and the last few samples to get percentiles from.
+
+        Args:
+            window (int, optional): How many recent samples to keep for percentiles. Defaults to 1024.
+        """
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, value_ms: float) -> None:
+        """Records one sample.
+
+        Args:
+            value_ms (float): The sample, in milliseconds.
+        """
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+        self.recent.append(value_ms)
+
+    @property
+    def mean_ms(self) -> float:
+        """The mean of all samples, in milliseconds."""
+        if self.count == 0:
+            return 0.0
+        return self.total_ms / self.count
+
+    def percentile(self, p: float) -> float:
+        """Returns the p-th percentile of the recent samples.
+
+        Args:
+            p (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The value at that percentile, or 0 if there are no samples.
+        """
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+class Metrics():
+    def __init__(self) -> None:
+        """A small in-process metrics registry. Everything in the bot that wants
+        to expose numbers (counters, current values or timings) records them
+        here, and the diagnostics cog shows them to admins."""
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self.timings: dict[str, TimingStats] = {}
+        # Timings and counters can be recorded from worker threads as well.
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Increments a counter.
+
+        Args:
+            name (str): Name of the counter.
+            amount (int, optional): The amount to increment the counter with. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Sets a value that represents the current state of something.
+
+        Args:
+            name (str): Name of the gauge.
+            value (float): The new value.
+        """
+        self.gauges[name] = value
+
+    def observe(self, name: str, value_ms: float) -> None:
+        """Records one timing sample.
+
+        Args:
+            name (str): Name of the timed operation.
+            value_ms (float): How long the operation took, in milliseconds.
+        """
+        with self._lock:
+            stats = self.timings.get(name)
+            if stats is None:
+                stats = self.timings[name] = TimingStats()
+            stats.add(value_ms)
+
+    def format(self, prefix: str = "") -> str:
+        """Returns all metrics whose name starts with the given prefix as text.
+
+        Args:
+            prefix (str, optional): Only include metrics starting with this. Defaults to "".
+
+        Returns:
+            str: One line per metric.
+        """
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                if name.startswith(prefix):
+                    lines.append(f"{name}: {value}")
+            for name, value in sorted(self.gauges.items()):
+                if name.startswith(prefix):
+                    lines.append(f"{name}: {value:g}")
+            for name, stats in sorted(self.timings.items()):
+                if name.startswith(prefix):
+                    lines.append(
+                        f"{name}: n={stats.count} mean={stats.mean_ms:.1f}ms "
+                        f"p50={stats.percentile(50):.1f}ms p99={stats.percentile(99):.1f}ms "
+                        f"max={stats.max_ms:.1f}ms")
+        return "\n".join(lines)
+
+
+# The registry shared by the whole bot.
+metrics = Metrics()
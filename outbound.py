@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Priority classes for outbound requests, lower goes first."""
+    INTERACTION = 0
+    STICKY = 1
+    ALERT = 2
+    RENAME = 3
+
+
+class Job():
+    def __init__(self, factory: Callable[[], Awaitable[Any]], priority: Priority,
+                 bucket: str, merge_key: str | None) -> None:
+        """One queued piece of outbound work.
+
+        Args:
+            factory (Callable[[], Awaitable[Any]]): Creates the coroutine to run. Only called when the job gets its turn, so it can use the newest state.
+            priority (Priority): The priority class of the job.
+            bucket (str): The bucket the job is queued in.
+            merge_key (str | None): Pending jobs with the same key are merged into one.
+        """
+        self.factory = factory
+        self.priority = priority
+        self.bucket = bucket
+        self.merge_key = merge_key
+        self.queued_at = time.perf_counter()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Fire and forget callers never look at the result. Failures are
+        # logged by the scheduler, so mark them as retrieved.
+        self.future.add_done_callback(
+            lambda f: f.cancelled() or f.exception())
+
+
+class PriorityGate():
+    def __init__(self, limit: int) -> None:
+        """Like a semaphore, but when it's full the waiter with the best
+        priority gets the next free slot instead of the one that came first.
+
+        Args:
+            limit (int): The max amount of holders at the same time.
+        """
+        self.limit = limit
+        self.active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: Priority) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # We were handed a slot right as we got cancelled, pass it on.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        # Hand the slot straight to the best waiter, so nobody can sneak in
+        # between the release and the wake up.
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class OutboundScheduler():
+    def __init__(self, max_in_flight: int = 8) -> None:
+        """Runs every discord request the bot makes on its own (sticky reposts,
+        member count renames, interaction replies) through one place.
+
+        Jobs are queued per bucket (usually a channel or an interaction) and
+        run one at a time per bucket, best priority first. A global gate
+        caps how many background requests are in flight at once, so under
+        load sticky reposts get ahead of channel renames. Interaction replies
+        skip the gate, they are capped by the interactions coming in. A job
+        submitted with the merge key of a job that is still waiting replaces
+        that job's work instead of queueing more.
+
+        Args:
+            max_in_flight (int, optional): The max amount of background requests (everything but interactions) running at the same time. Defaults to 8.
+        """
+        self.gate = PriorityGate(max_in_flight)
+        self._queues: dict[str, list[tuple[int, int, Job]]] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._pending: dict[str, Job] = {}
+        self._counter = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        """The amount of jobs waiting to run."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, factory: Callable[[], Awaitable[Any]], priority: Priority,
+               bucket: str, merge_key: str = None) -> asyncio.Future:
+        """Queues outbound work.
+
+        Args:
+            factory (Callable[[], Awaitable[Any]]): Creates the coroutine to run, e.g. lambda: channel.send(...). Called when the job gets its turn, so it can use the newest state.
+            priority (Priority): The priority class of the job.
+            bucket (str): The bucket to queue in, jobs in the same bucket run one after the other.
+            merge_key (str, optional): If a job with this key is still waiting, its work is replaced by this one and both callers get the same result. Defaults to None.
+
+        Returns:
+            asyncio.Future: Resolves to whatever the coroutine returned. Can be ignored for fire and forget work.
+        """
+        if merge_key is not None:
+            pending = self._pending.get(merge_key)
+            if pending is not None:
+                # The newer work supersedes the one still waiting.
+                pending.factory = factory
+                metrics.increment(f"outbound.merged.{priority.name.lower()}")
+                return pending.future
+
+        job = Job(factory, priority, bucket, merge_key)
+        if merge_key is not None:
+            self._pending[merge_key] = job
+        heapq.heappush(self._queues.setdefault(bucket, []),
+                       (priority, next(self._counter), job))
+        metrics.set_gauge("outbound.queued", self.queued)
+
+        if bucket not in self._workers:
+            self._workers[bucket] = asyncio.create_task(self._work(bucket))
+        return job.future
+
+    async def run(self, factory: Callable[[], Awaitable[Any]], priority: Priority,
+                  bucket: str, merge_key: str = None) -> Any:
+        """Same as submit(), but waits for the result.
+
+        Returns:
+            Any: Whatever the coroutine returned.
+        """
+        return await self.submit(factory, priority, bucket, merge_key)
+
+    async def _work(self, bucket: str) -> None:
+        queue = self._queues[bucket]
+        try:
+            while queue:
+                _, _, job = heapq.heappop(queue)
+                if job.merge_key is not None:
+                    # From here on, new work with this key gets its own job.
+                    self._pending.pop(job.merge_key, None)
+                await self._run_job(job)
+        finally:
+            del self._workers[bucket]
+            if not queue:
+                del self._queues[bucket]
+            metrics.set_gauge("outbound.queued", self.queued)
+
+    async def _run_job(self, job: Job) -> None:
+        name = job.priority.name.lower()
+        # Interactions have to be answered within 3 seconds, they never wait
+        # for slots held by slow sticky reposts or renames.
+        gated = job.priority != Priority.INTERACTION
+        if gated:
+            try:
+                await self.gate.acquire(job.priority)
+            except asyncio.CancelledError:
+                # Already off its queue, close() won't see it.
+                job.future.cancel()
+                raise
+        metrics.observe(f"outbound.wait.{name}",
+                        (time.perf_counter() - job.queued_at) * 1000)
+        start = time.perf_counter()
+        try:
+            result = await job.factory()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            metrics.increment(f"outbound.failed.{name}")
+            logger.exception("Outbound %s job in bucket %s failed", name, job.bucket)
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            if gated:
+                self.gate.release()
+            metrics.observe(f"outbound.run.{name}",
+                            (time.perf_counter() - start) * 1000)
+
+    async def drain(self) -> None:
+        """Waits until every queued job has run."""
+        while self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+    async def close(self) -> None:
+        """Cancels all queued work, used when the bot shuts down."""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for _, _, job in queue:
+                job.future.cancel()
+        self._queues.clear()
+        self._pending.clear()
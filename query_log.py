@@ -0,0 +1,192 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class QueryShape():
+    def __init__(self, shape: str) -> None:
+        """Aggregated timing stats for every statement sharing the same shape.
+
+        Args:
+            shape (str): The normalized query string.
+        """
+        self.shape = shape
+        self.count = 0
+        self.slow_count = 0
+        self.error_count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.plan: list[str] = None
+
+    def merge(self, other: "QueryShape") -> None:
+        """Adds the stats of the same shape from another time bucket."""
+        self.count += other.count
+        self.slow_count += other.slow_count
+        self.error_count += other.error_count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    @property
+    def mean_ms(self) -> float:
+        """The mean time this shape took to execute, in milliseconds."""
+        if self.count == 0:
+            return 0.0
+        return self.total_ms / self.count
+
+
+class SlowQueryLog():
+    def __init__(self, connection: sqlite3.Connection, threshold_ms: float,
+                 top_n: int = 10, window: int = 900, buckets: int = 15) -> None:
+        """Keeps timing stats for every query sent through the DBHandler and logs
+        the ones that take longer than the given threshold, together with
+        their parameters and query plan.
+
+        The stats only cover the last window seconds, so the summary shows
+        what is expensive now rather than since the start. They are kept in
+        buckets of window / buckets seconds, the oldest one is dropped as a
+        new one starts.
+
+        Args:
+            connection (sqlite3.Connection): The connection to run EXPLAIN QUERY PLAN on.
+            threshold_ms (float): Statements slower than this (in milliseconds) get logged.
+            top_n (int, optional): The amount of shapes to keep in the summary. Defaults to 10.
+            window (int, optional): Seconds of stats the summary covers. Defaults to 900.
+            buckets (int, optional): The amount of buckets the window is split into. Defaults to 15.
+        """
+        self.connection = connection
+        self.threshold_ms = threshold_ms
+        self.top_n = top_n
+        self.window = window
+        self.bucket_seconds = window / buckets
+        # (bucket number, shape -> stats), oldest first.
+        self._buckets: deque[tuple[int, dict[str, QueryShape]]] = deque(maxlen=buckets)
+        # Plans outlive the buckets, a shape is only explained once.
+        self.plans: dict[str, list[str]] = {}
+        # Queries run on worker threads as well.
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Collapses a query down to its "shape" so that the same statement
+        written with different whitespace or literals is grouped together.
+
+        Args:
+            query (str): The query string.
+
+        Returns:
+            str: The normalized query string.
+        """
+        query = re.sub(r"'(?:[^']|'')*'", "?", query)
+        query = re.sub(r"\b\d+\b", "?", query)
+        return " ".join(query.split())
+
+    def record(self, query: str, vars: tuple, duration_ms: float,
+               connection: sqlite3.Connection = None, failed: bool = False) -> None:
+        """Adds one execution of a query to the stats, logging it if it was slow.
+
+        Args:
+            query (str): The query string that was executed.
+            vars (tuple): The vars that were passed with the query.
+            duration_ms (float): How long the query took, in milliseconds.
+            connection (sqlite3.Connection, optional): The connection the query ran on, needed when it wasn't the main one (connections can't be shared between threads). Defaults to None.
+            failed (bool, optional): If the query raised an error. It counts towards the stats but isn't explained. Defaults to False.
+        """
+        shape = self.normalize(query)
+        bucket = int(time.monotonic() // self.bucket_seconds)
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != bucket:
+                self._buckets.append((bucket, {}))
+            shapes = self._buckets[-1][1]
+            stats = shapes.get(shape)
+            if stats is None:
+                stats = shapes[shape] = QueryShape(shape)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            if failed:
+                stats.error_count += 1
+                return
+            if duration_ms < self.threshold_ms:
+                return
+            stats.slow_count += 1
+            plan = self.plans.get(shape)
+        if plan is None:
+            # Explained outside the lock, the first plan stored for a shape wins.
+            plan = self._explain(query, vars, connection or self.connection)
+            with self._lock:
+                plan = self.plans.setdefault(shape, plan)
+
+        plan = "\n\t\t".join(plan) if plan else "(no plan)"
+        logger.warning("Slow query (%.1f ms): %s\n\tvars: %s\n\tplan:\n\t\t%s",
+                       duration_ms, shape, vars, plan)
+
+    def _explain(self, query: str, vars: tuple, connection: sqlite3.Connection) -> list[str]:
+        """Gets the query plan SQLite would use for the given query.
+
+        Args:
+            query (str): The query string.
+            vars (tuple): The vars to replace the spots in the query string.
+            connection (sqlite3.Connection): The connection to explain the query on.
+
+        Returns:
+            list[str]: One line per step in the plan, indented by depth.
+        """
+        try:
+            rows = connection.execute(
+                f"EXPLAIN QUERY PLAN {query}", vars).fetchall()
+        except sqlite3.Error as e:
+            return [f"could not explain query: {e}"]
+
+        # Rows are (id, parent, notused, detail), indent the details so
+        # nested loops and subqueries are easy to tell apart.
+        depth = {0: 0}
+        plan = []
+        for id, parent, _, detail in rows:
+            depth[id] = depth.get(parent, 0) + 1
+            plan.append("  " * (depth[id] - 1) + detail)
+        return plan
+
+    def summary(self) -> list[QueryShape]:
+        """Returns the most expensive query shapes of the last window seconds,
+        ordered by total time spent.
+
+        Returns:
+            list[QueryShape]: The top shapes, at most top_n long.
+        """
+        oldest = int(time.monotonic() // self.bucket_seconds) - self._buckets.maxlen + 1
+        shapes: dict[str, QueryShape] = {}
+        with self._lock:
+            for bucket, bucket_shapes in self._buckets:
+                if bucket < oldest:
+                    continue
+                for shape, stats in bucket_shapes.items():
+                    if shape not in shapes:
+                        shapes[shape] = QueryShape(shape)
+                        shapes[shape].plan = self.plans.get(shape)
+                    shapes[shape].merge(stats)
+        return sorted(shapes.values(),
+                      key=lambda s: s.total_ms, reverse=True)[:self.top_n]
+
+    def format_summary(self) -> str:
+        """Returns the summary as a printable table.
+
+        Returns:
+            str: One line per query shape.
+        """
+        lines = [f"{'total ms':>10} {'max ms':>9} {'mean ms':>9} {'count':>7} {'slow':>5} {'err':>4}  query"]
+        for s in self.summary():
+            lines.append(
+                f"{s.total_ms:>10.1f} {s.max_ms:>9.2f} {s.mean_ms:>9.3f} {s.count:>7} {s.slow_count:>5} "
+                f"{s.error_count:>4}  {s.shape[:120]}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """Clears all gathered stats, for example after a schema change."""
+        with self._lock:
+            self._buckets.clear()
+            self.plans = {}
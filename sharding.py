@@ -0,0 +1,91 @@
+import discord
+from metrics import metrics
+
+
+def shard_of(guild_id: int, shard_count: int) -> int:
+    """Returns the shard discord sends a guild's events to.
+
+    Args:
+        guild_id (int): The id of the guild.
+        shard_count (int): The total amount of shards.
+
+    Returns:
+        int: The shard id.
+    """
+    return (guild_id >> 22) % shard_count
+
+
+class ShardPlan():
+    def __init__(self, shard_count: int = None, shard_ids: list[int] = None) -> None:
+        """Which of the bot's shards run in this process. One process can run
+        every shard, or the shards can be split over several processes that
+        share the database. Each process then only does the work of its own
+        guilds, and the work that isn't tied to a guild (backups, archiving)
+        runs in the process with shard 0.
+
+        Args:
+            shard_count (int, optional): The total amount of shards. Defaults to None, as many as discord recommends.
+            shard_ids (list[int], optional): The shards to run here. Defaults to None, all of them.
+        """
+        if shard_ids is not None and shard_count is None:
+            raise ValueError("Running a subset of the shards needs the shard count")
+        if shard_ids is not None and any(not 0 <= id < shard_count for id in shard_ids):
+            raise ValueError(f"Shard ids have to be between 0 and {shard_count - 1}")
+        self.shard_count = shard_count
+        self.shard_ids = sorted(set(shard_ids)) if shard_ids is not None else None
+
+    @property
+    def is_partial(self) -> bool:
+        """If other processes run some of the shards."""
+        return self.shard_ids is not None and len(self.shard_ids) < self.shard_count
+
+    def owns(self, guild_id: int) -> bool:
+        """Checks if this process does the work of a guild.
+
+        Args:
+            guild_id (int): The id of the guild, 0 for work that isn't tied to a guild.
+
+        Returns:
+            bool: If the guild is on one of the local shards.
+        """
+        if not self.is_partial:
+            return True
+        if guild_id == 0:
+            return 0 in self.shard_ids
+        return shard_of(guild_id, self.shard_count) in self.shard_ids
+
+    @property
+    def action_id_slot(self) -> tuple[int, int]:
+        """(remainder, modulus) of the action ids this process hands out, see
+        DBHandler. The lowest local shard differs between the processes."""
+        if not self.is_partial:
+            return (0, 1)
+        return (self.shard_ids[0], self.shard_count)
+
+    def describe(self) -> str:
+        if self.shard_count is None:
+            return "all shards (count recommended by discord)"
+        if not self.is_partial:
+            return f"all {self.shard_count} shards"
+        return f"shards {', '.join(map(str, self.shard_ids))} of {self.shard_count}"
+
+
+def record_shard_metrics(bot: discord.AutoShardedClient) -> None:
+    """Sets the per shard gauges (gateway latency, guilds and members) from the
+    current state of the local shards, so /metrics shows how the load is
+    spread over them.
+
+    Args:
+        bot (discord.AutoShardedClient): The bot.
+    """
+    guilds: dict[int, int] = {}
+    members: dict[int, int] = {}
+    for guild in bot.guilds:
+        guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+        members[guild.shard_id] = members.get(guild.shard_id, 0) + (guild.member_count or 0)
+    for shard_id, latency in bot.latencies:
+        # The latency is inf until the first heartbeat is acknowledged.
+        if latency != float("inf"):
+            metrics.set_gauge(f"shard.{shard_id}.latency_ms", round(latency * 1000, 1))
+        metrics.set_gauge(f"shard.{shard_id}.guilds", guilds.get(shard_id, 0))
+        metrics.set_gauge(f"shard.{shard_id}.members", members.get(shard_id, 0))
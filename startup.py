@@ -0,0 +1,54 @@
+import time
+from contextlib import contextmanager
+from metrics import metrics
+
+
+class StartupTimer():
+    def __init__(self) -> None:
+        """Keeps track of how long each step of the bot's startup takes, so we
+        notice when something (like a new cog) makes restarts slow."""
+        self.started = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times everything inside the with block as one startup phase.
+
+        Args:
+            name (str): Name of the phase, e.g. "db open".
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name: str, duration_ms: float) -> None:
+        """Adds a phase that was timed somewhere else.
+
+        Args:
+            name (str): Name of the phase.
+            duration_ms (float): How long the phase took, in milliseconds.
+        """
+        self.phases.append((name, duration_ms))
+        metrics.set_gauge(f"startup.{name}", round(duration_ms, 1))
+
+    def duration(self, name: str) -> float:
+        """Returns how long the last phase with the given name took, in
+        milliseconds, or 0 if there was none."""
+        return next((ms for phase, ms in reversed(self.phases) if phase == name), 0.0)
+
+    def format(self) -> str:
+        """Returns the breakdown of all phases recorded so far.
+
+        Phases can run concurrently (cogs are loaded in parallel), so they
+        can add up to more than the total.
+
+        Returns:
+            str: One line per phase, followed by the total time since the timer was created.
+        """
+        width = max([len(name) for name, _ in self.phases] + [5])
+        lines = [f"{name:<{width}} {ms:>9.1f} ms" for name, ms in self.phases]
+        total = (time.perf_counter() - self.started) * 1000
+        lines.append(f"{'total':<{width}} {total:>9.1f} ms")
+        return "\n".join(lines)
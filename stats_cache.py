@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import threading
+import time
+from metrics import metrics
+
+# Stands in for the end of any period that reaches up to (or past) now, so
+# "last 7 days until now" asked a minute apart still hits the same entry.
+OPEN = None
+
+
+class StatsCache():
+    def __init__(self, maxsize: int = 4096, grace: int = 600) -> None:
+        """LRU cache for per moderator action counts, keyed by (moderator, start, end).
+        The moderator can be any hashable key, the DBHandler uses (guild id, moderator id).
+
+        Counts for a period that has fully ended can't change any more, those
+        entries are kept until they are evicted. Entries for a period that
+        still overlaps now remember the moderator's write watermark at the
+        time they were computed, and are dropped as soon as a new action for
+        that moderator bumps it.
+
+        Args:
+            maxsize (int, optional): The max amount of entries to keep. Defaults to 4096.
+            grace (int, optional): Seconds after its end before a period counts as closed. Deletions come in through the audit log and can be stamped a bit in the past, so periods that just ended stay checked against the watermark for a while. Defaults to 600.
+        """
+        self.maxsize = maxsize
+        self.grace = grace
+        # key -> (watermark when computed or None if closed, counts)
+        self._entries: OrderedDict[tuple, tuple[int | None, tuple]] = OrderedDict()
+        self._watermarks: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        # DB calls can come from worker threads.
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """The share of lookups that were answered from the cache, between 0 and 1."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _key(self, moderator_id: int, start_time: int, end_time: int, now: int) -> tuple:
+        return (moderator_id, start_time, end_time if end_time < now else OPEN)
+
+    def watermark(self, moderator_id: int) -> int:
+        """Returns the current write watermark of a moderator. Read it before
+        running the query whose result is passed to put().
+
+        Args:
+            moderator_id (int): Discord id of the moderator.
+
+        Returns:
+            int: The watermark.
+        """
+        return self._watermarks.get(moderator_id, 0)
+
+    def bump(self, moderator_id: int) -> None:
+        """Marks that a new action was recorded for the moderator, invalidating
+        every entry of theirs that isn't closed yet.
+
+        Args:
+            moderator_id (int): Discord id of the moderator.
+        """
+        with self._lock:
+            self._watermarks[moderator_id] = self._watermarks.get(moderator_id, 0) + 1
+
+    def get(self, moderator_id: int, start_time: int, end_time: int) -> tuple | None:
+        """Looks up cached counts.
+
+        Args:
+            moderator_id (int): Discord id of the moderator.
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+
+        Returns:
+            tuple | None: The cached counts, or None if there is no valid entry.
+        """
+        key = self._key(moderator_id, start_time, end_time, int(time.time()))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] != self.watermark(moderator_id):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+        metrics.increment("stats_cache.miss" if entry is None else "stats_cache.hit")
+        metrics.set_gauge("stats_cache.hit_rate", round(self.hit_rate, 3))
+        return entry[1] if entry else None
+
+    def put(self, moderator_id: int, start_time: int, end_time: int,
+            counts: tuple, watermark: int) -> None:
+        """Stores freshly computed counts.
+
+        Args:
+            moderator_id (int): Discord id of the moderator.
+            start_time (int): Beginning of the timeframe (unix timestamp).
+            end_time (int): End of the timeframe (unix timestamp).
+            counts (tuple): The counts to cache.
+            watermark (int): The moderator's watermark from before the counts were queried.
+        """
+        now = int(time.time())
+        closed = end_time < now - self.grace
+        key = self._key(moderator_id, start_time, end_time, now)
+        with self._lock:
+            self._entries[key] = (None if closed else watermark, counts)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                evicted += 1
+            size = len(self._entries)
+
+        if evicted:
+            metrics.increment("stats_cache.evicted", evicted)
+        metrics.set_gauge("stats_cache.size", size)
+
+    def clear(self) -> None:
+        """Drops every entry, for example after actions were changed in bulk."""
+        with self._lock:
+            self._entries.clear()